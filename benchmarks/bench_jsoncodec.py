@@ -0,0 +1,81 @@
+"""
+Micro-benchmark of the `utilities.jsoncodec` backends on MeterValues payloads.
+
+Decodes the JSON contents of `statics/logs/test/meterValues.log` and a large synthetic MeterValues
+frame, encodes them back, and runs `parse_input` on the log lines, with every installed backend.
+
+Run from the project root: `python benchmarks/bench_jsoncodec.py [--number N]`
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ocpp_log_sys.settings')
+
+import django
+django.setup()
+
+from log_processor.parser import parse_input
+from scripts import patterns
+from utilities import jsoncodec
+
+MEASURANDS = [('Voltage', 'V'), ('Current.Import', 'A'), ('Power.Active.Import', 'W'), ('Energy.Active.Import.Register', 'Wh')]
+
+def _large_frame(meter_values=6):
+    """A MeterValues content with a sampled value per measurand and phase in each meter value."""
+    return json.dumps({
+        'connectorId': 1,
+        'transactionId': 22934366,
+        'meterValue': [{
+            'timestamp': f'2024-06-14T01:5{i}:29Z',
+            'sampledValue': [
+                {'value': str(100 + i), 'context': 'Sample.Periodic', 'format': 'Raw', 'measurand': measurand, 'phase': phase, 'location': 'Outlet', 'unit': unit}
+                for measurand, unit in MEASURANDS for phase in ['L1', 'L2', 'L3']
+            ],
+        } for i in range(meter_values)],
+    })
+
+def _contents(lines):
+    contents = []
+    for line in lines:
+        for comparable_pattern in patterns.COMPARABLE_KEYWORD_CONTENT_MAP['metervalues']:
+            match = comparable_pattern.pattern.search(line)
+            if match:
+                contents.append(match.group(1))
+                break
+    return contents
+
+def _per_item(func, items, number):
+    return timeit.timeit(lambda: [func(item) for item in items], number=number) / (number * len(items)) * 1e6
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--number', type=int, default=2000, help='Number of passes over the payloads')
+    args = arg_parser.parse_args()
+
+    with open(os.path.join(root_dir, 'statics/logs/test/meterValues.log'), 'r') as f:
+        lines = [line for line in f if line.strip()]
+    cases = {
+        'loads log contents': (jsoncodec.loads, _contents(lines)),
+        'loads large frame': (jsoncodec.loads, [_large_frame()]),
+        'dumps log contents': (jsoncodec.dumps, [json.loads(c) for c in _contents(lines)]),
+        'dumps large frame': (jsoncodec.dumps, [json.loads(_large_frame())]),
+        'parse_input': (parse_input, lines),
+    }
+    backends = jsoncodec.available_backends()
+    print(f'{"us/item":<20}' + ''.join(f'{name:>10}' for name in backends))
+    for case, (func, items) in cases.items():
+        timings = []
+        for name in backends:
+            jsoncodec.set_backend(name)
+            # parse_input is much slower than the codec calls, run it fewer times
+            number = max(args.number // 10, 1) if case == 'parse_input' else args.number
+            timings.append(_per_item(func, items, number))
+        print(f'{case:<20}' + ''.join(f'{t:10.1f}' for t in timings))
+
+if __name__ == '__main__':
+    main()
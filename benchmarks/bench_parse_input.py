@@ -0,0 +1,90 @@
+"""
+Micro-benchmark of the per-line overhead of `log_processor.parser.parse_input`.
+
+`before` is the reference implementation which built the `ParserPattern` models and called
+`re.compile` on every call, `after` is `parse_input` with the precompiled `parser.PARSER_PATTERNS`.
+
+Run from the project root: `python benchmarks/bench_parse_input.py [--number N]`
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ocpp_log_sys.settings')
+
+import django
+django.setup()
+
+from log_processor import errors
+from log_processor.errors import ErrorMessage
+from log_processor.parser import CHARGER_REQUEST_PARSER_MAP, ParserPattern, build_charger_sent_request_input, parse_input
+from scripts import patterns
+
+DATATRANSFER_LOG_RECORD = 'INFO:ocpp:1000191: receive message [2,"104","DataTransfer",{"vendorId":"ATESS","messageId":"currentrecord","data":"id=0&connectorId=0&chargemode=0"}]'
+CONSUMERS_LOG_RECORD = 'INFO:consumers [TH010] receive [2,"105","DataTransfer",{"vendorId":"ATESS","messageId":"currentrecord","data":""}]'
+UNSUPPORTED_LOG_RECORD = 'INFO:ocpp:1000191: send [3,"104",{"status":"Accepted"}]'
+
+def reference_parse_input(data: str):
+    """`parse_input` as it was before the patterns were precompiled, rebuilding them on every call."""
+    parser_patterns = [
+        ParserPattern(
+            identifier='',
+            pattern=re.compile(r'ocpp:([\w|\d]+):.+receive message\s*\[.+,.+,\s*\"(\w+)\"\s*,\s*(\{.+\})\s*]'),
+            build_parser_input=build_charger_sent_request_input
+        ),
+        ParserPattern(
+            identifier='',
+            pattern=re.compile(patterns.CONSUMERS_REGEX.pattern + r'\[(\w+)\].+?\[.+,.+,\s*\"(\w+)\"\s*,\s*(\{.+\})\s*]'),
+            build_parser_input=build_charger_sent_request_input
+        ),
+    ]
+    for pp in parser_patterns:
+        match = pp.pattern.search(data)
+        if match:
+            r = pp.build_parser_input(data, match)
+            try:
+                parser = CHARGER_REQUEST_PARSER_MAP[r.request_type]
+            except KeyError:
+                raise errors.CurrentlyUnSupported(ErrorMessage.NOT_CONFIGURED.value + f': {match.group(2)}')
+            return parser.parsed(r)
+    raise errors.CurrentlyUnSupported(ErrorMessage.UNSUPPORTED_INPUT_FORMAT.value)
+
+IMPLEMENTATIONS = {
+    'before': reference_parse_input,
+    'after': parse_input,
+}
+
+def _parse_or_reject(parse, line):
+    try:
+        parse(line)
+    except errors.CurrentlyUnSupported:
+        pass
+
+def _bench(parse, lines, number):
+    elapsed = timeit.timeit(lambda: [_parse_or_reject(parse, line) for line in lines], number=number)
+    return elapsed / (number * len(lines)) * 1e6
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--number', type=int, default=2000, help='Number of passes over the sample lines')
+    args = arg_parser.parse_args()
+
+    with open(os.path.join(root_dir, 'statics/logs/test/meterValues.log'), 'r') as f:
+        metervalues_lines = [line for line in f if line.strip()]
+
+    cases = {
+        'metervalues': metervalues_lines,
+        'datatransfer': [DATATRANSFER_LOG_RECORD],
+        'consumers': [CONSUMERS_LOG_RECORD],
+        'unsupported': [UNSUPPORTED_LOG_RECORD],
+    }
+    print(f'{"us/line":<14}' + ''.join(f'{name:>10}' for name in IMPLEMENTATIONS))
+    for name, lines in cases.items():
+        print(f'{name:<14}' + ''.join(f'{_bench(parse, lines, args.number):10.1f}' for parse in IMPLEMENTATIONS.values()))
+
+if __name__ == '__main__':
+    main()
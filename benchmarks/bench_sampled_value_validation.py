@@ -0,0 +1,52 @@
+"""
+Micro-benchmark of the validation of MeterValues frames by `SampledMeterValueSerializer`.
+
+Compares the pydantic fast path with the per item DRF `SampledValueSerializer` it falls back to,
+up to the unsaved model instance (whose schema fields validate the sampled values again).
+
+Run from the project root: `python benchmarks/bench_sampled_value_validation.py [--number N]`
+"""
+import argparse
+import os
+import sys
+import timeit
+from unittest import mock
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ocpp_log_sys.settings')
+
+import django
+django.setup()
+
+from log_processor import serializers
+from log_processor.parser import parse_input
+
+def _validate(frames):
+    for frame in frames:
+        serializer = serializers.SampledMeterValueSerializer(data=frame)
+        serializer.is_valid(raise_exception=True)
+        serializer.build_instance()
+
+def _bench(frames, number):
+    elapsed = timeit.timeit(lambda: _validate(frames), number=number)
+    return elapsed / (number * len(frames)) * 1e6
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--number', type=int, default=200, help='Number of passes over the sample frames')
+    args = arg_parser.parse_args()
+
+    with open(os.path.join(root_dir, 'statics/logs/test/meterValues.log'), 'r') as f:
+        frames = [model for line in f if line.strip() for model in parse_input(line).parsed_models]
+    sampled_values = sum(len(frame[phase]) for frame in frames for phase in ['L1', 'L2', 'L3']) / len(frames)
+
+    with mock.patch.object(serializers, '_validate_sampled_values', return_value=None):
+        drf = _bench(frames, args.number)
+    fast = _bench(frames, args.number)
+    print(f'{len(frames)} frames, {sampled_values:.1f} sampled values per frame')
+    print(f'{"drf":<8} {drf:8.1f} us/frame')
+    print(f'{"pydantic":<8} {fast:8.1f} us/frame')
+
+if __name__ == '__main__':
+    main()
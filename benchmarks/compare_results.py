@@ -0,0 +1,63 @@
+"""
+Compare two results files written by `run_benchmarks.py`, e.g. of two commits.
+
+Prints the change of every metric from the base to the head results and exits with status 1 when a
+metric got worse by more than the threshold. Metrics ending in `_per_second` are better when higher,
+all the others (durations and latencies) when lower.
+
+Run from the project root: `python benchmarks/compare_results.py BASE HEAD [--threshold 0.1]`
+"""
+import argparse
+import json
+import sys
+
+# Metrics which describe the workload rather than measure it
+IGNORED_METRICS = {'comparator.lines'}
+
+def is_higher_better(metric: str) -> bool:
+    return metric.endswith('_per_second')
+
+def compare(base: dict, head: dict, threshold: float):
+    """Yield `(metric, base value, head value, relative change, is regression)` for the metrics of both results."""
+    for metric in sorted(set(base) & set(head) - IGNORED_METRICS):
+        base_value, head_value = base[metric], head[metric]
+        if not base_value:
+            continue
+        change = (head_value - base_value) / base_value
+        worse = -change if is_higher_better(metric) else change
+        yield metric, base_value, head_value, change, worse > threshold
+
+def _load(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _workload(report):
+    return {k: v for k, v in report['parameters'].items() if k != 'output'}
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('base', help='Results file of the reference run')
+    arg_parser.add_argument('head', help='Results file of the run to check')
+    arg_parser.add_argument('--threshold', type=float, default=0.1, help='Relative change regarded as a regression')
+    args = arg_parser.parse_args()
+
+    base, head = _load(args.base), _load(args.head)
+    for report, name in [(base, 'base'), (head, 'head')]:
+        env = report['environment']
+        print(f"{name}: {(env['commit'] or 'unknown')[:8]}{' (dirty)' if env['dirty'] else ''} on {env['platform']}, {env['cpu_count']} CPUs, Python {env['python']}")
+    if base['environment'].get('cpu_count') != head['environment'].get('cpu_count'):
+        print('Warning: the results were measured on different machines')
+    if _workload(base) != _workload(head):
+        print('Warning: the results were measured with different parameters')
+
+    regressions = []
+    for metric, base_value, head_value, change, is_regression in compare(base['results'], head['results'], args.threshold):
+        print(f"{metric:<48} {base_value:14.1f} {head_value:14.1f} {change:+8.1%}{'  REGRESSION' if is_regression else ''}")
+        if is_regression:
+            regressions.append(metric)
+    if regressions:
+        print(f'{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
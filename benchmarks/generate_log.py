@@ -0,0 +1,137 @@
+"""
+Generator of synthetic raw OCPP logs for the benchmarks.
+
+Writes a log mixing charger sent MeterValues, DataTransfer and StatusNotification requests, the same
+requests logged by the `consumers` websocket handler, and noise (responses sent to the chargers and
+unrelated records). Every request has a distinct message id, so that none of them is deduplicated
+on ingestion.
+
+Run from the project root:
+`python benchmarks/generate_log.py OUTPUT [--lines N] [--mix metervalues=5,datatransfer=2,...] [--seed S]`
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable
+
+LINE_KINDS = ['metervalues', 'datatransfer', 'statusnotification', 'consumers', 'noise']
+DEFAULT_MIX = {
+    'metervalues': 5,
+    'datatransfer': 2,
+    'statusnotification': 1,
+    'consumers': 1,
+    'noise': 1,
+}
+CHARGER_NUMBERS = ['1000129', '1000186', '1000191', '1000193', '1000203', 'TH007', 'TH009', 'TH010']
+START_TIME = datetime(2024, 7, 1, tzinfo=timezone.utc)
+PHASES = ['L1', 'L2', 'L3']
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse a `kind=weight,...` mix; kinds which are not listed get a zero weight."""
+    mix = dict.fromkeys(LINE_KINDS, 0.0)
+    for item in value.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip().lower()
+        if kind not in mix:
+            raise ValueError(f'Unknown line kind {kind!r}, expected one of {LINE_KINDS}')
+        mix[kind] = float(weight)
+    if not any(mix.values()):
+        raise ValueError('The mix must have a positive weight')
+    return mix
+
+def _dumps(content, rnd: random.Random) -> str:
+    # Chargers log either compact JSON or JSON padded with spaces
+    if rnd.random() < 0.3:
+        return json.dumps(content, separators=(' , ', ' : '))
+    return json.dumps(content, separators=(',', ':'))
+
+def _timestamp(i: int) -> str:
+    return (START_TIME + timedelta(seconds=i)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def _meter_values(rnd: random.Random, i: int) -> dict:
+    # The phases of a measurand only differ by their phase, and the values are positive (the parser drops zeros)
+    extra_fields = {'location': 'Outlet'} if rnd.random() < 0.5 else {}
+
+    def _sampled_value(measurand, unit, value, phase=None):
+        sampled_value = {'value': value, 'context': 'Sample.Periodic', 'format': 'Raw', 'measurand': measurand, 'unit': unit, **extra_fields}
+        if phase:
+            sampled_value['phase'] = phase
+        return sampled_value
+
+    sampled_values = [_sampled_value('Energy.Active.Import.Register', 'Wh', str(rnd.randint(1, 10 ** 7)))]
+    if rnd.random() < 0.5:
+        sampled_values.extend(_sampled_value('Voltage', 'V', f'{rnd.uniform(220, 245):.1f}', phase) for phase in PHASES)
+        sampled_values.extend(_sampled_value('Current.Import', 'A', f'{rnd.uniform(1, 32):.1f}', phase) for phase in PHASES)
+    else:
+        sampled_values.append(_sampled_value('Voltage', 'V', f'{rnd.uniform(220, 245):.1f}'))
+        sampled_values.append(_sampled_value('Current.Import', 'A', f'{rnd.uniform(1, 32):.1f}'))
+    sampled_values.append(_sampled_value('Power.Active.Import', 'W', str(rnd.randint(1, 22000))))
+    return {
+        'connectorId': rnd.randint(1, 2),
+        'transactionId': rnd.randint(1, 10 ** 8),
+        'meterValue': [{'timestamp': _timestamp(i), 'sampledValue': sampled_values}],
+    }
+
+def _datatransfer(rnd: random.Random, i: int) -> dict:
+    if rnd.random() < 0.7:
+        data = f'id={i}&connectorId={rnd.randint(0, 2)}&chargemode={rnd.randint(0, 1)}'
+        return {'vendorId': 'ATESS', 'messageId': 'currentrecord', 'data': data}
+    fault_group = [{'connectorId': rnd.randint(1, 2)}] if rnd.random() < 0.3 else []
+    data = json.dumps({'FaultGroup': fault_group, 'timestamp': _timestamp(i)}, separators=(',', ':'))
+    return {'vendorId': 'CEGN', 'messageId': 'chargePoridStatu', 'data': data}
+
+def _status_notification(rnd: random.Random, i: int) -> dict:
+    content = {'connectorId': rnd.randint(0, 2), 'errorCode': 'NoError', 'status': rnd.choice(['Available', 'Preparing', 'Charging', 'Finishing'])}
+    if rnd.random() < 0.5:
+        content['timestamp'] = _timestamp(i)
+    return content
+
+REQUEST_CONTENTS = {
+    'MeterValues': _meter_values,
+    'DataTransfer': _datatransfer,
+    'StatusNotification': _status_notification,
+}
+
+def _request(rnd: random.Random, i: int, request_type: str) -> str:
+    return f'[2,"{i}-{rnd.getrandbits(32):08x}","{request_type}",{_dumps(REQUEST_CONTENTS[request_type](rnd, i), rnd)}]'
+
+def _line(rnd: random.Random, i: int, kind: str) -> str:
+    charger_number = rnd.choice(CHARGER_NUMBERS)
+    if kind == 'consumers':
+        request = _request(rnd, i, rnd.choice(['MeterValues', 'DataTransfer']))
+        return f'INFO:websockets: consumers [{charger_number}] receive {request}'
+    if kind == 'noise':
+        if rnd.random() < 0.5:
+            return f'INFO:ocpp:{charger_number}: send [3,"{i}",{{"status":"Accepted"}}]'
+        return f'DEBUG:websockets.server: < PONG {rnd.getrandbits(64):016x} [{rnd.randint(0, 64)} bytes]'
+    request_type = {'metervalues': 'MeterValues', 'datatransfer': 'DataTransfer', 'statusnotification': 'StatusNotification'}[kind]
+    return f'INFO:ocpp:{charger_number}: receive message {_request(rnd, i, request_type)}'
+
+def generate_lines(count: int, mix: Dict[str, float] = None, seed: int = 0) -> Iterable[str]:
+    """Yield `count` log lines (without line breaks), picking the kind of every line at random with the weights of `mix`."""
+    rnd = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds, weights = zip(*[(kind, weight) for kind, weight in mix.items() if weight > 0])
+    for start in range(0, count, 1000):
+        for i, kind in enumerate(rnd.choices(kinds, weights=weights, k=min(1000, count - start)), start):
+            yield _line(rnd, i, kind)
+
+def write_log(path, count: int, mix: Dict[str, float] = None, seed: int = 0):
+    with open(path, 'w') as f:
+        for line in generate_lines(count, mix, seed):
+            f.write(line + '\n')
+    return path
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('output', help='Path of the log file to write')
+    arg_parser.add_argument('--lines', type=int, default=1_000_000, help='Number of lines')
+    arg_parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                            help=f'Relative weights of the line kinds, e.g. {",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items())}')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+    write_log(args.output, args.lines, args.mix, args.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Load test of the synchronous and async single line ingestion endpoints of a running server.
+
+Start the server under an ASGI server first, e.g. `uvicorn ocpp_log_sys.asgi:application --port 8000`
+(uvicorn and httpx are not project requirements), then run from the project root:
+`python benchmarks/load_test_ingest.py [--base-url URL] [--requests N] [--concurrency C]`
+
+Every request posts a distinct line, made unique by rewriting its message id, so that no request is
+answered by the idempotency check. Note that the lines are stored in the server's database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import time
+import uuid
+
+import httpx
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = {
+    'sync': '/api/process-charger-sent-logs',
+    'async': '/api/async/process-charger-sent-logs',
+}
+MESSAGE_ID_REGEX = re.compile(r'(\[\s*2\s*,\s*")([^"]*)(")')
+
+def _unique_lines(lines, count, run_id):
+    for i in range(count):
+        line = lines[i % len(lines)]
+        yield MESSAGE_ID_REGEX.sub(lambda m: f'{m.group(1)}{m.group(2)}-{run_id}-{i}{m.group(3)}', line, count=1)
+
+async def _run(base_url, path, lines, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=httpx.Limits(max_connections=concurrency)) as client:
+
+        async def _post(line):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(path, content=json.dumps(line), headers={'Content-Type': 'application/json'})
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[_post(line) for line in lines])
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests_per_second': len(lines) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1e3,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1e3,
+        'statuses': statuses,
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    arg_parser.add_argument('--requests', type=int, default=500, help='Number of requests per endpoint')
+    arg_parser.add_argument('--concurrency', type=int, default=50, help='Number of requests in flight')
+    arg_parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    args = arg_parser.parse_args()
+
+    with open(os.path.join(root_dir, 'statics/logs/test/meterValues.log'), 'r') as f:
+        metervalues_lines = [line.strip() for line in f if line.strip()]
+
+    for name in args.endpoints:
+        lines = list(_unique_lines(metervalues_lines, args.requests, uuid.uuid4().hex[:8]))
+        result = asyncio.run(_run(args.base_url, ENDPOINTS[name], lines, args.concurrency))
+        print(f"{name:<6} {result['requests_per_second']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+              f"p99 {result['p99_ms']:7.1f} ms  statuses {result['statuses']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+Benchmark suite of the extractor, the comparator, the parser and the ingestion API.
+
+Generates a synthetic log with `generate_log.py` (or reads `--log`), runs the suites and writes the
+results as a flat JSON map of metrics to `benchmarks/results/`, together with the commit and the
+machine they were measured on, so that two runs can be compared with `compare_results.py`.
+Metrics ending in `_per_second` are better when higher, all the others when lower.
+
+Run from the project root:
+`python benchmarks/run_benchmarks.py [--lines N] [--log PATH] [--suites extractor comparator parser api] [--output PATH]`
+"""
+import argparse
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ocpp_log_sys.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from benchmarks import generate_log
+from log_processor import errors
+from log_processor.parser import parse_input
+from scripts import extractor, patterns
+from utilities import comparator, jsoncodec, loggers
+
+RESULTS_DIR = os.path.join(root_dir, 'benchmarks/results')
+SUITES = ['extractor', 'comparator', 'parser', 'api']
+PERCENTILES = [50, 90, 99]
+
+def _percentiles(latencies):
+    latencies = sorted(latencies)
+    res = {f'p{p}_us': latencies[min(len(latencies) - 1, len(latencies) * p // 100)] * 1e6 for p in PERCENTILES}
+    res['mean_us'] = statistics.fmean(latencies) * 1e6
+    return res
+
+def _count_lines(path):
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
+
+def _read_sample(path, count):
+    lines = []
+    with open(path, 'r') as f:
+        for line in f:
+            if len(lines) >= count:
+                break
+            lines.append(line)
+    return lines
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+def bench_extractor(log_path, total_lines, processes, work_dir):
+    """Time every extraction mode of `scripts/extractor.py` over the whole log."""
+    raw_log_filename = os.path.basename(log_path)
+    keywords = extractor.extract_keywords_from_log(log_path)
+
+    def _per_keyword(output_dir):
+        for keyword in sorted(keywords):
+            extractor.extract_content_with_keyword_from_file(keyword, log_path, extractor._output_path(output_dir, keyword, raw_log_filename))
+
+    def _multi_threaded(output_dir):
+        threads = [threading.Thread(
+            target=extractor.extract_content_with_keyword_from_file,
+            args=(keyword, log_path, extractor._output_path(output_dir, keyword, raw_log_filename), []),
+        ) for keyword in sorted(keywords)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    modes = {
+        'single_threaded': _per_keyword,
+        'multi_threaded': _multi_threaded,
+        'single_pass': lambda output_dir: extractor.extract_contents_from_file(log_path, raw_log_filename, output_dir),
+        'mmap': lambda output_dir: extractor.mmap_extract_contents_from_file(log_path, raw_log_filename, output_dir),
+        'sharded': lambda output_dir: extractor.sharded_extract_contents_from_file(log_path, raw_log_filename, output_dir, processes=processes),
+    }
+    results = {}
+    for mode, run in modes.items():
+        comparator.clear_parse_cache()
+        output_dir = os.path.join(work_dir, mode)
+        elapsed = _timed(run, output_dir)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        results[f'extractor.{mode}.seconds'] = elapsed
+        results[f'extractor.{mode}.lines_per_second'] = total_lines / elapsed
+    return results
+
+def _comparable_contents(lines):
+    """The (keyword, content, comparable pattern) of the lines the extractor would deduplicate."""
+    contents = []
+    for line in lines:
+        classified = extractor._classify_line(line)
+        if classified is None:
+            continue
+        identifier, keyword, _ = classified
+        for comparable_pattern in patterns.COMPARABLE_KEYWORD_CONTENT_MAP.get(keyword.lower(), []):
+            if comparable_pattern.identifier != identifier:
+                continue
+            match = comparable_pattern.pattern.search(line)
+            if match:
+                contents.append((keyword.lower(), match.group(1), comparable_pattern))
+                break
+    return contents
+
+def bench_comparator(lines):
+    """Cost per line of the structure signatures and of the pairwise comparators they replaced."""
+    contents = _comparable_contents(lines)
+    examples = {}
+    for keyword, content, _ in contents:
+        examples.setdefault(keyword, content)
+    results = {'comparator.lines': len(contents)}
+    for name, compare in [
+        ('signature', lambda keyword, content, cp: cp.signature(content)),
+        ('pairwise', lambda keyword, content, cp: cp.is_identical(content, examples[keyword])),
+    ]:
+        comparator.clear_parse_cache()
+        elapsed = _timed(lambda: [compare(*c) for c in contents])
+        results[f'comparator.{name}.us_per_line'] = elapsed / len(contents) * 1e6
+    return results
+
+def bench_parser(lines):
+    """Latency percentiles of `parse_input` per request type, including the rejected lines."""
+    latencies = {}
+    for line in lines:
+        start = time.perf_counter()
+        try:
+            request_type = parse_input(line).serializer_clz.Meta.model.__name__.lower()
+        except errors.CurrentlyUnSupported:
+            request_type = 'unsupported'
+        latencies.setdefault(request_type, []).append(time.perf_counter() - start)
+    latencies['all'] = [latency for type_latencies in latencies.values() for latency in type_latencies]
+    results = {}
+    for request_type, type_latencies in sorted(latencies.items()):
+        results.update({f'parser.{request_type}.{k}': v for k, v in _percentiles(type_latencies).items()})
+    return results
+
+def bench_api(lines, chunk_size):
+    """End-to-end ingestion rate of the single line and bulk endpoints, against a throwaway test database."""
+    lines = [line.strip() for line in lines if extractor._classify_line(line) is not None]
+    half = len(lines) // 2
+    client = Client()
+    # Rejected lines (e.g. StatusNotification) would log a warning per request
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        latencies = []
+        start = time.perf_counter()
+        for line in lines[:half]:
+            request_start = time.perf_counter()
+            client.post(reverse('log_processor:process-charger-sent-logs'), data=jsoncodec.dumps(line), content_type='application/json')
+            latencies.append(time.perf_counter() - request_start)
+        single_elapsed = time.perf_counter() - start
+
+        bulk_lines = lines[half:]
+        start = time.perf_counter()
+        for i in range(0, len(bulk_lines), chunk_size):
+            client.post(reverse('log_processor:bulk-process-charger-sent-logs'), data=jsoncodec.dumps(bulk_lines[i:i + chunk_size]), content_type='application/json')
+        bulk_elapsed = time.perf_counter() - start
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+    results = {
+        'api.single.lines_per_second': half / single_elapsed,
+        'api.bulk.lines_per_second': len(bulk_lines) / bulk_elapsed,
+    }
+    results.update({f'api.single.{k}': v for k, v in _percentiles(latencies).items()})
+    return results
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=root_dir, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'json_codec': jsoncodec.backend.name,
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--lines', type=int, default=200_000, help='Number of lines of the generated log')
+    arg_parser.add_argument('--mix', type=generate_log.parse_mix, default=generate_log.DEFAULT_MIX, help='Line mix of the generated log, see generate_log.py')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--log', help='Benchmark an existing log instead of a generated one')
+    arg_parser.add_argument('--suites', nargs='+', choices=SUITES, default=SUITES)
+    arg_parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Worker processes of the sharded extractor')
+    arg_parser.add_argument('--sample-lines', type=int, default=20_000, help='Number of lines run through the comparator and parser suites')
+    arg_parser.add_argument('--api-lines', type=int, default=2_000, help='Number of lines posted to the ingestion API')
+    arg_parser.add_argument('--api-chunk-size', type=int, default=500, help='Number of lines per bulk request')
+    arg_parser.add_argument('--output', help='Path of the results file (default: benchmarks/results/<time>-<commit>.json)')
+    args = arg_parser.parse_args()
+
+    loggers.mute_logger(loggers.debug_file_logger)
+    loggers.mute_logger(loggers.error_file_logger)
+    work_dir = tempfile.mkdtemp()
+    try:
+        log_path = args.log or generate_log.write_log(os.path.join(work_dir, 'generated.log'), args.lines, args.mix, args.seed)
+        total_lines = _count_lines(log_path)
+        results = {}
+        if 'extractor' in args.suites:
+            results.update(bench_extractor(log_path, total_lines, args.processes, work_dir))
+        if 'comparator' in args.suites:
+            results.update(bench_comparator(_read_sample(log_path, args.sample_lines)))
+        if 'parser' in args.suites:
+            results.update(bench_parser(_read_sample(log_path, args.sample_lines)))
+        if 'api' in args.suites:
+            results.update(bench_api(_read_sample(log_path, args.api_lines), args.api_chunk_size))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    env = environment()
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'environment': env,
+        'parameters': {**vars(args), 'total_lines': total_lines},
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{(env['commit'] or 'unknown')[:8]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        f.write(jsoncodec.dumps(report, indent=2))
+    for metric, value in results.items():
+        print(f'{metric:<48} {value:14.1f}')
+    print(f'Results written to {output}')
+
+if __name__ == '__main__':
+    main()
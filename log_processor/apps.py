@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class LogProcessorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'log_processor'
+
+    def ready(self):
+        if settings.METRICS_ENABLED:
+            from log_processor import instrumentation
+            instrumentation.install()
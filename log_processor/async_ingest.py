@@ -0,0 +1,153 @@
+import asyncio
+import weakref
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework import status
+
+from log_processor import ingest, instrumentation
+from utilities import metrics
+
+_parse_executor: Optional[ThreadPoolExecutor] = None
+_write_executor: Optional[ThreadPoolExecutor] = None
+
+def parse_executor() -> ThreadPoolExecutor:
+    """Bounded pool running the parsing and validation of log lines, which do not touch the database."""
+    global _parse_executor
+    if _parse_executor is None:
+        _parse_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_INGEST_PARSE_WORKERS, thread_name_prefix='ingest-parse')
+    return _parse_executor
+
+def write_executor() -> ThreadPoolExecutor:
+    """
+    Single thread writing the micro-batches one at a time, with its own database connection.
+
+    Django runs the synchronous middlewares of every request in the shared thread used by
+    `sync_to_async(thread_sensitive=True)`, so writing there would hold requests back.
+    """
+    global _write_executor
+    if _write_executor is None:
+        _write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-write')
+    return _write_executor
+
+def assign_primary_keys(instances: list):
+    """
+    Set the primary keys which `bulk_create` leaves unset on backends that cannot return them (e.g. SQLite).
+
+    Ingestion stores a raw log line once, so an instance is found by its model and `raw_line`.
+    """
+    instances_by_raw_line = defaultdict(dict)
+    for instance in instances:
+        if instance.pk is None:
+            instances_by_raw_line[type(instance)][instance.raw_line_id] = instance
+    for model, by_raw_line in instances_by_raw_line.items():
+        for raw_line_id, pk in model.objects.filter(raw_line_id__in=list(by_raw_line)).values_list('raw_line_id', 'pk'):
+            by_raw_line[raw_line_id].pk = pk
+
+def _save_parsed_lines(parsed_lines):
+    # The writer thread is not a request thread, so its connection is not recycled by the request signals
+    close_old_connections()
+    results = ingest.save_parsed_lines(parsed_lines)
+    assign_primary_keys([
+        instance
+        for (_, instances), result in zip(parsed_lines, results) if result['status'] == status.HTTP_201_CREATED
+        for instance in instances
+    ])
+    return results
+
+async def write_batch(parsed_lines):
+    return await asyncio.get_running_loop().run_in_executor(write_executor(), _save_parsed_lines, parsed_lines)
+
+def parse_line(line: str):
+    """Validated serializers of a log line and the unsaved instances built from them."""
+    validated_serializers = ingest.validate_line(line)
+    return validated_serializers, [s.build_instance() for s in validated_serializers]
+
+class MicroBatcher:
+    """
+    Coalesce the items submitted by concurrent requests of an event loop into batches written by one call.
+
+    A batch is flushed once it holds `batch_size` items, or `flush_interval` seconds after its first
+    item. `write` is a coroutine function taking the list of items and returning one result per item.
+    The flushing task only runs while items are pending.
+    """
+
+    def __init__(self, write: Callable, batch_size: int, flush_interval: float):
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, item) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((item, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_pending())
+        return await future
+
+    async def _next_batch(self) -> List[tuple]:
+        loop = asyncio.get_running_loop()
+        batch = [self.queue.get_nowait()]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush_pending(self):
+        while not self.queue.empty():
+            batch = await self._next_batch()
+            try:
+                results = await self.write([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+
+# One batcher per event loop, since asyncio queues and futures are bound to their loop
+_batchers = weakref.WeakKeyDictionary()
+
+def get_batcher() -> MicroBatcher:
+    loop = asyncio.get_running_loop()
+    if loop not in _batchers:
+        _batchers[loop] = MicroBatcher(
+            write_batch,
+            settings.ASYNC_INGEST_BATCH_SIZE,
+            settings.ASYNC_INGEST_FLUSH_INTERVAL,
+        )
+    return _batchers[loop]
+
+async def ingest_line(line) -> dict:
+    """
+    Parse a log line in the bounded executor, then write it with the next micro-batch.
+
+    Returns the status code the line would have got from the synchronous endpoint and either the
+    serialized data of the saved instances or the error message. A failed write fails every line
+    of its micro-batch.
+    """
+    try:
+        validated_serializers, instances = await asyncio.get_running_loop().run_in_executor(parse_executor(), parse_line, line)
+        result = await get_batcher().submit((line, instances))
+    except Exception as e:
+        http_status, msg = ingest.failure_for(e)
+        result = {'status': http_status, 'error': msg}
+    else:
+        if result['status'] == status.HTTP_201_CREATED:
+            result['data'] = [type(s)(instance).data for s, instance in zip(validated_serializers, instances)]
+        elif result['status'] == status.HTTP_200_OK:
+            result['data'] = ingest.ALREADY_INGESTED
+    if metrics.enabled:
+        instrumentation.record_line(line, result['status'])
+    return result
@@ -10,4 +10,9 @@ class ErrorMessage(Enum):
 class CurrentlyUnSupported(Exception):
     def __init__(self, message):
         self.message = message
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+class InvalidParsedModel(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(errors)
@@ -0,0 +1,223 @@
+"""
+Columnar export of the parsed MeterValues samples and DataTransfer requests, for analytics tools.
+
+The rows are read from the database (`MeterValueSample`, the normalized output of the MeterValues
+parser, and `DataTransferRequest`), or parsed from a raw log without storing them, and written as
+Parquet or Arrow IPC files with `pyarrow`, which is an optional dependency. Rows are buffered and
+written one row group (one record batch) of `ROW_GROUP_SIZE` rows at a time, so the memory used does
+not depend on the number of rows exported.
+
+The low cardinality string columns (charger numbers, measurands, phases, units, vendor and message
+ids) are dictionary encoded. A column keeps a single dictionary for the whole file, which later row
+groups extend with new values: Arrow IPC files only accept dictionary deltas, and the codes stay
+comparable across row groups. Arrow IPC files can be read without copying through a memory map:
+
+    with pyarrow.memory_map('statics/exports/meter_values.arrow') as source:
+        table = pyarrow.ipc.open_file(source).read_all()
+"""
+import os
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from log_processor import ingest
+from log_processor.models import DataTransferRequest, MeterValueSample, SampledMeterValue
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Rows per row group (Parquet) or record batch (Arrow IPC), and rows fetched per database query
+ROW_GROUP_SIZE = 65536
+FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+DICTIONARY = 'dictionary'
+
+# (column name, column kind) of the exported tables; the columns are the fields of the models
+METER_VALUE_COLUMNS = (
+    ('charger_number', DICTIONARY),
+    ('connector_id', 'int32'),
+    ('transaction_id', 'int64'),
+    ('timestamp', 'timestamp'),
+    ('measurand', DICTIONARY),
+    ('phase', DICTIONARY),
+    ('unit', DICTIONARY),
+    ('value', 'float64'),
+)
+DATA_TRANSFER_COLUMNS = (
+    ('charger_number', DICTIONARY),
+    ('vendor_id', DICTIONARY),
+    ('message_id', DICTIONARY),
+    ('data', 'string'),
+    ('created_at', 'timestamp'),
+)
+TABLES = {
+    'meter_values': (MeterValueSample, METER_VALUE_COLUMNS),
+    'data_transfers': (DataTransferRequest, DATA_TRANSFER_COLUMNS),
+}
+
+class PyArrowNotInstalled(Exception):
+    pass
+
+def _require_pyarrow():
+    if pa is None:
+        raise PyArrowNotInstalled('The columnar export requires the pyarrow package')
+
+def _arrow_type(kind: str):
+    if kind == DICTIONARY:
+        return pa.dictionary(pa.int32(), pa.string())
+    if kind == 'timestamp':
+        return pa.timestamp('us', tz='UTC')
+    return getattr(pa, kind)()
+
+def arrow_schema(columns: Sequence[Tuple[str, str]]):
+    _require_pyarrow()
+    return pa.schema([(name, _arrow_type(kind)) for name, kind in columns])
+
+class ColumnarWriter:
+    """
+    Write rows (tuples in the order of `columns`) to a Parquet or Arrow IPC file, one row group at a time.
+
+    Use it as a context manager, or call `close`, to write the last row group and the file footer.
+    """
+
+    def __init__(self, path, columns: Sequence[Tuple[str, str]], file_format: str = 'parquet', row_group_size: int = ROW_GROUP_SIZE):
+        if file_format not in FORMATS:
+            raise ValueError(f'Unsupported export format {file_format}, expected one of {list(FORMATS)}')
+        if row_group_size < 1:
+            raise ValueError('The row group size must be positive')
+        self.schema = arrow_schema(columns)
+        self.path = path
+        self.file_format = file_format
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self.row_groups = 0
+        self._columns: List[list] = [[] for _ in columns]
+        # Column index -> {value: code}, in the order of the codes
+        self._dictionaries: Dict[int, dict] = {i: {} for i, (_, kind) in enumerate(columns) if kind == DICTIONARY}
+        if file_format == 'parquet':
+            self._sink = None
+            self._writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self._sink = pa.OSFile(os.fspath(path), 'wb')
+            self._writer = pa.ipc.new_file(self._sink, self.schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    def write(self, row: Sequence):
+        for values, value in zip(self._columns, row):
+            values.append(value)
+        if len(self._columns[0]) >= self.row_group_size:
+            self.flush()
+
+    def write_rows(self, rows: Iterable[Sequence]):
+        for row in rows:
+            self.write(row)
+
+    def _array(self, index: int, values: list):
+        field = self.schema.field(index)
+        dictionary = self._dictionaries.get(index)
+        if dictionary is None:
+            return pa.array(values, type=field.type)
+        codes = [None if value is None else dictionary.setdefault(value, len(dictionary)) for value in values]
+        return pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32()), pa.array(list(dictionary), type=pa.string()))
+
+    def flush(self):
+        """Write the buffered rows as a row group."""
+        count = len(self._columns[0])
+        if not count:
+            return
+        batch = pa.record_batch([self._array(i, values) for i, values in enumerate(self._columns)], schema=self.schema)
+        if self.file_format == 'parquet':
+            self._writer.write_batch(batch, row_group_size=count)
+        else:
+            self._writer.write_batch(batch)
+        self.rows += count
+        self.row_groups += 1
+        for values in self._columns:
+            values.clear()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._writer.close()
+            if self._sink is not None:
+                self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def table_rows(model, columns: Sequence[Tuple[str, str]], chunk_size: int = ROW_GROUP_SIZE) -> Iterable[tuple]:
+    """The rows of a model's table in `id` order, fetched `chunk_size` rows at a time."""
+    return model.objects.order_by('id').values_list(*(name for name, _ in columns)).iterator(chunk_size=chunk_size)
+
+def instance_row(instance, columns: Sequence[Tuple[str, str]]) -> tuple:
+    return tuple(getattr(instance, name) for name, _ in columns)
+
+def export_path(output_dir, table: str, file_format: str) -> str:
+    return os.path.join(output_dir, table + FORMATS[file_format])
+
+def _summary(writers: Dict[str, ColumnarWriter]) -> dict:
+    return {table: {'path': writer.path, 'rows': writer.rows, 'row_groups': writer.row_groups} for table, writer in writers.items()}
+
+def _open_writers(output_dir, file_format: str, row_group_size: int) -> Dict[str, ColumnarWriter]:
+    os.makedirs(output_dir, exist_ok=True)
+    writers = {}
+    try:
+        for table, (_, columns) in TABLES.items():
+            writers[table] = ColumnarWriter(export_path(output_dir, table, file_format), columns, file_format, row_group_size)
+    except BaseException:
+        for writer in writers.values():
+            writer.close()
+        raise
+    return writers
+
+def export_database(output_dir, file_format: str = 'parquet', row_group_size: int = ROW_GROUP_SIZE) -> dict:
+    """Export the stored meter value samples and DataTransfer requests, returning the path, rows and row groups of each file."""
+    _require_pyarrow()
+    writers = _open_writers(output_dir, file_format, row_group_size)
+    try:
+        for table, (model, columns) in TABLES.items():
+            writers[table].write_rows(table_rows(model, columns, row_group_size))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return _summary(writers)
+
+def export_log_lines(lines: Iterable[str], output_dir, file_format: str = 'parquet', row_group_size: int = ROW_GROUP_SIZE) -> dict:
+    """
+    Parse the charger sent messages of a raw log and export them without storing them.
+
+    Lines are parsed and validated as by the ingestion endpoints; lines which fail are counted and
+    skipped. DataTransfer requests have no `created_at` since they are not stored.
+    """
+    _require_pyarrow()
+    summary = {'total_lines': 0, 'skipped_lines': 0, 'failed_lines': 0}
+    writers = _open_writers(output_dir, file_format, row_group_size)
+    try:
+        for line in lines:
+            summary['total_lines'] += 1
+            if not ingest.is_charger_sent_message(line):
+                summary['skipped_lines'] += 1
+                continue
+            try:
+                instances = [s.build_instance() for s in ingest.validate_line(line)]
+            except Exception:
+                summary['failed_lines'] += 1
+                continue
+            for instance in instances:
+                if isinstance(instance, SampledMeterValue):
+                    for sample in instance.build_samples():
+                        writers['meter_values'].write(instance_row(sample, METER_VALUE_COLUMNS))
+                elif isinstance(instance, DataTransferRequest):
+                    writers['data_transfers'].write(instance_row(instance, DATA_TRANSFER_COLUMNS))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {**summary, **_summary(writers)}
+
@@ -0,0 +1,199 @@
+import itertools
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Any, Iterable, List, Tuple
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework import serializers, status
+
+from log_processor import errors, instrumentation
+from log_processor.models import MeterValueSample, RawLogLine, SampledMeterValue, raw_line_digest
+from log_processor.parser import ParserOutput, parse_input
+from scripts import patterns
+from utilities import loggers, metrics
+
+# Maximum number of failed lines reported by `ingest_stream`
+MAX_REPORTED_ERRORS = 20
+ALREADY_INGESTED = 'Log line already ingested'
+
+def line_digest(line: str) -> str:
+    # The serializers strip the raw data before it is stored as a `RawLogLine`
+    return raw_line_digest(line.strip())
+
+def is_ingested(data) -> bool:
+    """Whether the raw log line was already stored, in which case ingesting it again is a no-op."""
+    return isinstance(data, str) and RawLogLine.objects.filter(digest=line_digest(data)).exists()
+
+def validate_line(data: str) -> List[serializers.ModelSerializer]:
+    """Parse a raw log line and validate the parsed models, returning their (unsaved) serializers."""
+    output: ParserOutput = parse_input(data)
+    start = time.perf_counter() if metrics.enabled else None
+    validated_serializers = []
+    try:
+        for model_data in output.parsed_models:
+            serializer = output.serializer_clz(data=model_data)
+            if not serializer.is_valid():
+                raise errors.InvalidParsedModel(serializer.errors)
+            validated_serializers.append(serializer)
+    finally:
+        instrumentation.observe_stage('validate', start)
+    return validated_serializers
+
+def failure_for(e: Exception) -> Tuple[int, Any]:
+    """Log an exception raised while ingesting a line and map it to an HTTP status code and error message."""
+    if isinstance(e, errors.InvalidParsedModel):
+        loggers.error_file_logger.error(e.errors, exc_info=True)
+        return status.HTTP_400_BAD_REQUEST, e.errors
+    if isinstance(e, errors.CurrentlyUnSupported):
+        loggers.error_file_logger.error(e.message, exc_info=True)
+        return status.HTTP_406_NOT_ACCEPTABLE, e.message
+    if isinstance(e, ValidationError):
+        try:
+            msg = [json.loads(x) for x in e.messages]
+        except (json.JSONDecodeError, TypeError):
+            msg = e.messages
+        return status.HTTP_400_BAD_REQUEST, msg
+    loggers.error_file_logger.error(errors.ErrorMessage.UNHANDLED_EXCEPTION.value, exc_info=True)
+    return status.HTTP_500_INTERNAL_SERVER_ERROR, errors.ErrorMessage.INTERNAL_SERVER_ERROR.value
+
+def save_instances(instances: list):
+    """Write unsaved model instances with one `bulk_create` per model, inside the current transaction."""
+    raw_lines = {instance.raw_line.digest: instance.raw_line for instance in instances if hasattr(instance, 'raw_line')}
+    RawLogLine.objects.bulk_create(raw_lines.values(), ignore_conflicts=True)
+    instances_by_model = defaultdict(list)
+    for instance in instances:
+        instances_by_model[type(instance)].append(instance)
+    # Sampled meter values are also written to the normalized time-series table
+    instances_by_model[MeterValueSample].extend(
+        sample for instance in instances_by_model[SampledMeterValue] for sample in instance.build_samples()
+    )
+    for model, model_instances in instances_by_model.items():
+        if model_instances:
+            model.objects.bulk_create(model_instances)
+
+def ingested_digests(digests: Iterable[str]) -> set:
+    return set(RawLogLine.objects.filter(digest__in=[d for d in digests if d]).values_list('digest', flat=True))
+
+def _save_created(created: List[dict], instances: list) -> List[dict]:
+    start = time.perf_counter() if metrics.enabled else None
+    try:
+        with transaction.atomic():
+            save_instances(instances)
+        instrumentation.observe_stage('write', start)
+    except Exception as e:
+        http_status, msg = failure_for(e)
+        created = [{**r, 'status': http_status, 'error': msg} for r in created]
+    return created
+
+def _ingest_chunk(lines: List[Tuple[int, str]]) -> List[dict]:
+    results, instances, created = [], [], []
+    digests = [line_digest(line) if isinstance(line, str) else None for _, line in lines]
+    seen = ingested_digests(digests)
+    for (index, line), digest in zip(lines, digests):
+        if digest in seen:
+            results.append({'line': index, 'status': status.HTTP_200_OK})
+            continue
+        try:
+            line_instances = [s.build_instance() for s in validate_line(line)]
+        except Exception as e:
+            http_status, msg = failure_for(e)
+            results.append({'line': index, 'status': http_status, 'error': msg})
+        else:
+            instances.extend(line_instances)
+            created.append({'line': index, 'status': status.HTTP_201_CREATED})
+            seen.add(digest)
+    results = sorted(results + _save_created(created, instances), key=lambda r: r['line'])
+    if metrics.enabled:
+        for (_, line), result in zip(lines, results):
+            instrumentation.record_line(line, result['status'])
+    return results
+
+def save_parsed_lines(parsed_lines: List[Tuple[str, list]]) -> List[dict]:
+    """
+    Write the instances built from already validated lines in a single transaction.
+
+    Returns a status report per line, in order, without the line index; lines which were
+    already ingested are skipped with a 200 status.
+    """
+    results, instances, created = [], [], []
+    digests = [line_digest(line) for line, _ in parsed_lines]
+    seen = ingested_digests(digests)
+    for index, ((_, line_instances), digest) in enumerate(zip(parsed_lines, digests)):
+        if digest in seen:
+            results.append({'line': index, 'status': status.HTTP_200_OK})
+            continue
+        instances.extend(line_instances)
+        created.append({'line': index, 'status': status.HTTP_201_CREATED})
+        seen.add(digest)
+    results = sorted(results + _save_created(created, instances), key=lambda r: r['line'])
+    for result in results:
+        del result['line']
+    return results
+
+def summarize(results: List[dict]) -> dict:
+    """Count the per-line results of `ingest_lines` by outcome."""
+    failed = sum(1 for r in results if 'error' in r)
+    skipped = sum(1 for r in results if r['status'] == status.HTTP_200_OK)
+    return {
+        'created': len(results) - failed - skipped,
+        'skipped': skipped,
+        'failed': failed,
+        'results': results,
+    }
+
+def _ingest_numbered_lines(numbered_lines: Iterable[Tuple[int, str]], chunk_size: int = None) -> Iterable[dict]:
+    chunk_size = chunk_size or settings.INGEST_CHUNK_SIZE
+    numbered_lines = iter(numbered_lines)
+    while True:
+        chunk = list(itertools.islice(numbered_lines, chunk_size))
+        if not chunk:
+            break
+        yield from _ingest_chunk(chunk)
+
+def ingest_lines(lines: Iterable[str], chunk_size: int = None) -> Iterable[dict]:
+    """
+    Parse, validate and store raw log lines, writing every chunk of lines in a single transaction.
+
+    Yields a status report per line: its index, the HTTP status code it would have got from the
+    single line API and, for failed lines, the error message. Lines which were already ingested
+    are skipped with a 200 status.
+    """
+    return _ingest_numbered_lines(enumerate(lines), chunk_size)
+
+def is_charger_sent_message(line: str) -> bool:
+    return any(identifier in line for identifier in patterns.ChargerSentMessageIdentifier)
+
+def decode_lines(raw_lines: Iterable[bytes], encoding='utf-8') -> Iterable[str]:
+    for raw_line in raw_lines:
+        yield raw_line.decode(encoding, errors='replace')
+
+def ingest_stream(lines: Iterable[str], chunk_size: int = None) -> dict:
+    """
+    Ingest a raw OCPP log read as a stream of lines, in memory bounded by the chunk size.
+
+    Lines which are not charger sent messages are skipped before parsing. Returns the counts of
+    lines per status code and the first `MAX_REPORTED_ERRORS` failed lines.
+    """
+    summary = {
+        'total_lines': 0,
+        'skipped_lines': 0,
+        'statuses': Counter(),
+        'errors': [],
+    }
+
+    def _charger_sent_messages():
+        for index, line in enumerate(lines):
+            summary['total_lines'] += 1
+            if is_charger_sent_message(line):
+                yield index, line
+            else:
+                summary['skipped_lines'] += 1
+
+    for result in _ingest_numbered_lines(_charger_sent_messages(), chunk_size):
+        summary['statuses'][result['status']] += 1
+        if 'error' in result and len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append(result)
+    summary['statuses'] = dict(summary['statuses'])
+    return summary
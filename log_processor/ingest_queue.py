@@ -0,0 +1,55 @@
+from datetime import timedelta
+from typing import List, Optional
+from django.utils import timezone
+
+from log_processor import ingest
+from log_processor.models import IngestBatch
+from utilities import loggers
+
+def enqueue(lines: List[str]) -> IngestBatch:
+    """Durably queue log lines for the `drain_ingest_queue` worker."""
+    return IngestBatch.objects.create(lines=lines)
+
+def claim_next_batch() -> Optional[IngestBatch]:
+    """
+    Mark the oldest pending batch as processing and return it, or None if the queue is empty.
+
+    The claim is a conditional update, so concurrent workers never process the same batch.
+    """
+    while True:
+        batch_id = IngestBatch.objects.filter(status=IngestBatch.Status.PENDING).order_by('id').values_list('id', flat=True).first()
+        if batch_id is None:
+            return None
+        claimed = IngestBatch.objects.filter(id=batch_id, status=IngestBatch.Status.PENDING).update(
+            status=IngestBatch.Status.PROCESSING, updated_at=timezone.now()
+        )
+        if claimed:
+            return IngestBatch.objects.get(id=batch_id)
+
+def process_batch(batch: IngestBatch, chunk_size: int = None) -> IngestBatch:
+    try:
+        batch.result = ingest.summarize(list(ingest.ingest_lines(batch.lines, chunk_size)))
+        batch.status = IngestBatch.Status.DONE
+    except Exception as e:
+        loggers.error_file_logger.error(f'Ingest batch {batch.id} failed', exc_info=True)
+        batch.status = IngestBatch.Status.FAILED
+        batch.error = repr(e)
+    batch.save(update_fields=['status', 'result', 'error', 'updated_at'])
+    return batch
+
+def drain(max_batches: int = None, chunk_size: int = None) -> int:
+    """Process pending batches until the queue is empty or `max_batches` were processed, returning their number."""
+    processed = 0
+    while max_batches is None or processed < max_batches:
+        batch = claim_next_batch()
+        if batch is None:
+            break
+        process_batch(batch, chunk_size)
+        processed += 1
+    return processed
+
+def requeue_stale_batches(stale_after: timedelta) -> int:
+    """Put back batches left processing by a worker which died, since ingesting a line twice is a no-op."""
+    return IngestBatch.objects.filter(
+        status=IngestBatch.Status.PROCESSING, updated_at__lt=timezone.now() - stale_after
+    ).update(status=IngestBatch.Status.PENDING, updated_at=timezone.now())
@@ -0,0 +1,48 @@
+"""
+Metrics of the ingestion path, exposed by the `/metrics` endpoint.
+
+`install` is called by the app config when `settings.METRICS_ENABLED` is set. Otherwise no step hook
+is registered and the instrumented code only checks `metrics.enabled`.
+"""
+import time
+from typing import Optional
+
+from log_processor import parser
+from scripts import patterns
+from utilities import metrics
+
+PARSER_STEP_SECONDS = metrics.histogram(
+    'ocpp_parser_step_seconds', 'Duration of the parser steps, matching the parser pattern included.', ['request_type', 'step'])
+INGEST_STAGE_SECONDS = metrics.histogram(
+    'ocpp_ingest_stage_seconds', 'Duration of the serializer validation of a line and of the database writes.', ['stage'])
+INGESTED_LINES = metrics.counter(
+    'ocpp_ingested_lines_total', 'Log lines handled by the ingestion endpoints and workers, by request type and HTTP status.', ['request_type', 'status'])
+
+def observe_parser_step(request_type: str, step_name: str, elapsed: float):
+    PARSER_STEP_SECONDS.observe(elapsed, request_type, step_name)
+
+def observe_stage(stage: str, start: Optional[float]):
+    """Record the duration of a stage started at `start` (a `time.perf_counter()` value), unless it is None."""
+    if start is not None:
+        INGEST_STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+
+def request_type_of(line) -> str:
+    # Label values must be bounded, so request types which are not known OCPP requests are grouped
+    match = patterns.THIRD_ARRAY_ITEM_REGEX.search(line) if isinstance(line, str) else None
+    if match is None:
+        return 'unknown'
+    request_type = match.group(1).lower()
+    return request_type if request_type in patterns.COMPARABLE_KEYWORD_CONTENT_MAP else 'other'
+
+def record_line(line, http_status: int):
+    INGESTED_LINES.inc(request_type_of(line), str(http_status))
+
+def install():
+    metrics.enable()
+    if observe_parser_step not in parser.STEP_HOOKS:
+        parser.register_step_hook(observe_parser_step)
+
+def uninstall():
+    metrics.disable()
+    if observe_parser_step in parser.STEP_HOOKS:
+        parser.unregister_step_hook(observe_parser_step)
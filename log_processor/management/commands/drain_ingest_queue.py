@@ -0,0 +1,33 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+
+from log_processor import ingest_queue
+
+class Command(BaseCommand):
+    help = 'Ingest the log lines queued by the API, polling the queue until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Number of queued batches processed between two checks for stale batches')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Number of lines written in a single transaction (default: settings.INGEST_CHUNK_SIZE)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stale-after', type=float, default=600,
+                            help='Seconds after which a batch left processing is put back in the queue')
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        total = 0
+        while True:
+            requeued = ingest_queue.requeue_stale_batches(stale_after)
+            if requeued:
+                self.stderr.write(f'Requeued {requeued} stale batches')
+            processed = ingest_queue.drain(options['max_batches'], options['chunk_size'])
+            total += processed
+            if not processed:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        self.stdout.write(f'Processed {total} batches')
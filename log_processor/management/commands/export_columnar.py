@@ -0,0 +1,35 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+
+from log_processor import export, ingest
+from utilities import compression
+
+class Command(BaseCommand):
+    help = 'Export the meter value samples and DataTransfer requests as Parquet or Arrow IPC files, one file per table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir', help='Directory of the exported files, created if needed')
+        parser.add_argument('--format', choices=list(export.FORMATS), default='parquet', help='File format of the export')
+        parser.add_argument('--row-group-size', type=int, default=export.ROW_GROUP_SIZE,
+                            help='Rows per Parquet row group or Arrow record batch')
+        parser.add_argument('--log-file', default=None,
+                            help='Parse and export a raw OCPP log file, plain or compressed, instead of the stored rows')
+
+    def handle(self, *args, **options):
+        if options['row_group_size'] < 1:
+            raise CommandError('--row-group-size must be positive')
+        try:
+            if options['log_file'] is None:
+                summary = export.export_database(options['output_dir'], options['format'], options['row_group_size'])
+            else:
+                with compression.open_log(options['log_file']) as log_file:
+                    summary = export.export_log_lines(
+                        ingest.decode_lines(log_file), options['output_dir'], options['format'], options['row_group_size']
+                    )
+        except export.PyArrowNotInstalled as e:
+            raise CommandError(str(e))
+        except FileNotFoundError:
+            raise CommandError(f"File {options['log_file']} not found.")
+        except (compression.UnsupportedCompression, compression.CorruptedLog) as e:
+            raise CommandError(str(e))
+        self.stdout.write(json.dumps(summary, indent=4))
@@ -0,0 +1,23 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+
+from log_processor import ingest
+from utilities import compression
+
+class Command(BaseCommand):
+    help = 'Stream a raw OCPP log file, optionally compressed, into the database, without staging extracted files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('log_file_path', help='Path of the raw OCPP log file, plain or compressed with gzip, bzip2, xz or zstd')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Number of lines written in a single transaction (default: settings.INGEST_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        try:
+            with compression.open_log(options['log_file_path']) as log_file:
+                summary = ingest.ingest_stream(ingest.decode_lines(log_file), options['chunk_size'])
+        except FileNotFoundError:
+            raise CommandError(f"File {options['log_file_path']} not found.")
+        except (compression.UnsupportedCompression, compression.CorruptedLog) as e:
+            raise CommandError(str(e))
+        self.stdout.write(json.dumps(summary, indent=4))
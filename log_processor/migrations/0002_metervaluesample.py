@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+# Defaults of the `SampledValue` schema when this migration was written
+SAMPLED_VALUE_DEFAULTS = {'measurand': 'Energy.Active.Export.Register', 'unit': 'Wh'}
+
+
+def sampled_value_fields(sampled_value) -> dict:
+    if hasattr(sampled_value, 'model_dump'):
+        sampled_value = sampled_value.model_dump(mode='json')
+    return {**SAMPLED_VALUE_DEFAULTS, **dict(sampled_value)}
+
+
+def build_samples(sampled_meter_value, MeterValueSample) -> list:
+    samples = []
+    for phase in ['L1', 'L2', 'L3']:
+        for sampled_value in getattr(sampled_meter_value, phase):
+            fields = sampled_value_fields(sampled_value)
+            timestamp = fields['timestamp']
+            samples.append(MeterValueSample(
+                charger_number=sampled_meter_value.charger_number,
+                connector_id=sampled_meter_value.connector_id,
+                transaction_id=sampled_meter_value.transaction_id,
+                timestamp=timestamp if isinstance(timestamp, datetime) else parse_datetime(timestamp),
+                measurand=fields['measurand'] or '',
+                phase=phase,
+                unit=fields['unit'] or '',
+                value=float(fields['value']),
+            ))
+    return samples
+
+
+def backfill_meter_value_samples(apps, schema_editor):
+    SampledMeterValue = apps.get_model('log_processor', 'SampledMeterValue')
+    MeterValueSample = apps.get_model('log_processor', 'MeterValueSample')
+    samples = []
+    for sampled_meter_value in SampledMeterValue.objects.iterator(chunk_size=500):
+        samples.extend(build_samples(sampled_meter_value, MeterValueSample))
+        if len(samples) >= 5000:
+            MeterValueSample.objects.bulk_create(samples)
+            samples = []
+    MeterValueSample.objects.bulk_create(samples)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('log_processor', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeterValueSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('charger_number', models.CharField(max_length=64)),
+                ('connector_id', models.IntegerField()),
+                ('transaction_id', models.IntegerField()),
+                ('timestamp', models.DateTimeField()),
+                ('measurand', models.CharField(blank=True, max_length=64)),
+                ('phase', models.CharField(max_length=2)),
+                ('unit', models.CharField(blank=True, max_length=16)),
+                ('value', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='metervaluesample',
+            index=models.Index(fields=['charger_number', 'timestamp'], name='metervaluesample_charger_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='metervaluesample',
+            index=models.Index(fields=['transaction_id', 'timestamp'], name='metervaluesample_tx_ts'),
+        ),
+        migrations.RunPython(backfill_meter_value_samples, migrations.RunPython.noop),
+    ]
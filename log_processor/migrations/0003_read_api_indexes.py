@@ -0,0 +1,40 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('log_processor', '0002_metervaluesample'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datatransferrequest',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='sampledmetervalue',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='datatransferrequest',
+            index=models.Index(fields=['charger_number', 'id'], name='datatransfer_charger_id'),
+        ),
+        migrations.AddIndex(
+            model_name='datatransferrequest',
+            index=models.Index(fields=['vendor_id', 'message_id', 'id'], name='datatransfer_vendor_msg_id'),
+        ),
+        migrations.AddIndex(
+            model_name='sampledmetervalue',
+            index=models.Index(fields=['charger_number', 'id'], name='sampledmetervalue_charger_id'),
+        ),
+        migrations.AddIndex(
+            model_name='sampledmetervalue',
+            index=models.Index(fields=['transaction_id', 'id'], name='sampledmetervalue_tx_id'),
+        ),
+    ]
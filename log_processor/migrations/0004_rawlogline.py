@@ -0,0 +1,94 @@
+import hashlib
+import zlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+REQUEST_MODELS = ['DataTransferRequest', 'SampledMeterValue']
+# Digest and compression of the raw lines when this migration was written
+RAW_LINE_COMPRESSION_LEVEL = 6
+
+
+def raw_line_digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def compress_raw_line(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8'), RAW_LINE_COMPRESSION_LEVEL)
+
+
+def move_raw_data_to_raw_lines(apps, schema_editor):
+    RawLogLine = apps.get_model('log_processor', 'RawLogLine')
+    for model_name in REQUEST_MODELS:
+        model = apps.get_model('log_processor', model_name)
+        for request in model.objects.only('id', 'raw_data').iterator(chunk_size=500):
+            raw_line, _ = RawLogLine.objects.get_or_create(
+                digest=raw_line_digest(request.raw_data),
+                defaults={'compressed': compress_raw_line(request.raw_data)},
+            )
+            model.objects.filter(id=request.id).update(raw_line=raw_line)
+
+
+def move_raw_lines_to_raw_data(apps, schema_editor):
+    for model_name in REQUEST_MODELS:
+        model = apps.get_model('log_processor', model_name)
+        for request in model.objects.select_related('raw_line').iterator(chunk_size=500):
+            text = zlib.decompress(bytes(request.raw_line.compressed)).decode('utf-8')
+            model.objects.filter(id=request.id).update(raw_data=text)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('log_processor', '0003_read_api_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RawLogLine',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('compressed', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='datatransferrequest',
+            name='raw_line',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='log_processor.rawlogline'),
+        ),
+        migrations.AddField(
+            model_name='sampledmetervalue',
+            name='raw_line',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='log_processor.rawlogline'),
+        ),
+        # Nullable while the raw data is moved, so that the migration can be reversed
+        migrations.AlterField(
+            model_name='datatransferrequest',
+            name='raw_data',
+            field=models.TextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='sampledmetervalue',
+            name='raw_data',
+            field=models.TextField(null=True),
+        ),
+        migrations.RunPython(move_raw_data_to_raw_lines, move_raw_lines_to_raw_data),
+        migrations.RemoveField(
+            model_name='datatransferrequest',
+            name='raw_data',
+        ),
+        migrations.RemoveField(
+            model_name='sampledmetervalue',
+            name='raw_data',
+        ),
+        migrations.AlterField(
+            model_name='datatransferrequest',
+            name='raw_line',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='log_processor.rawlogline'),
+        ),
+        migrations.AlterField(
+            model_name='sampledmetervalue',
+            name='raw_line',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='log_processor.rawlogline'),
+        ),
+    ]
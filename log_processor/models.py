@@ -1,6 +1,8 @@
+import hashlib
+import zlib
 from datetime import datetime
 from enum import Enum
-from typing import Optional, Sequence
+from typing import List, Optional, Sequence
 from django.db import models
 
 from django.db import models
@@ -98,13 +100,50 @@ class ChargerSentRequestMixin(models.Model):
     class Meta:
         abstract = True
 
-class DataTransferRequest(ChargerSentRequestMixin, models.Model):
+RAW_LINE_COMPRESSION_LEVEL = 6
+
+def raw_line_digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def compress_raw_line(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8'), RAW_LINE_COMPRESSION_LEVEL)
+
+class RawLogLine(models.Model):
+    """An ingested log line, stored once under the SHA-256 digest of its text and zlib compressed."""
+    digest = models.CharField(max_length=64, primary_key=True)
+    compressed = models.BinaryField()
+
+    @classmethod
+    def from_text(cls, text: str) -> 'RawLogLine':
+        return cls(digest=raw_line_digest(text), compressed=compress_raw_line(text))
+
+    @property
+    def text(self) -> str:
+        return zlib.decompress(bytes(self.compressed)).decode('utf-8')
+
+class RawLogLineMixin(models.Model):
+    raw_line = models.ForeignKey(RawLogLine, on_delete=models.PROTECT, related_name='+')
+    class Meta:
+        abstract = True
+
+    @property
+    def raw_data(self) -> str:
+        return self.raw_line.text
+
+class DataTransferRequest(ChargerSentRequestMixin, RawLogLineMixin, models.Model):
     vendor_id = models.CharField(max_length=255)
     message_id = models.CharField(max_length=50, blank=True)
     data = models.TextField(blank=True)
-    raw_data = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the filtered read API walks these in `id` order
+            models.Index(fields=['charger_number', 'id'], name='datatransfer_charger_id'),
+            models.Index(fields=['vendor_id', 'message_id', 'id'], name='datatransfer_vendor_msg_id'),
+        ]
 
-class SampledMeterValue(ChargerSentRequestMixin, models.Model):
+class SampledMeterValue(ChargerSentRequestMixin, RawLogLineMixin, models.Model):
     connector_id = models.IntegerField()
     transaction_id = models.IntegerField()
 
@@ -112,7 +151,73 @@ class SampledMeterValue(ChargerSentRequestMixin, models.Model):
     L2: Sequence[SampledValue] = SchemaField()
     L3: Sequence[SampledValue] = SchemaField()
 
-    raw_data = models.TextField()
-    
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['charger_number', 'id'], name='sampledmetervalue_charger_id'),
+            models.Index(fields=['transaction_id', 'id'], name='sampledmetervalue_tx_id'),
+        ]
+
+    def build_samples(self) -> List['MeterValueSample']:
+        """Unsaved normalized rows of the sampled values, one per sampled value and phase."""
+        return build_meter_value_samples(self, MeterValueSample)
+
+class MeterValueSample(ChargerSentRequestMixin, models.Model):
+    """A sampled value of a MeterValues request, normalized so that time-series queries are index scans."""
+    connector_id = models.IntegerField()
+    transaction_id = models.IntegerField()
+    timestamp = models.DateTimeField()
+    measurand = models.CharField(max_length=64, blank=True)
+    phase = models.CharField(max_length=2) # L1, L2 or L3 as selected by the MeterValues parser
+    unit = models.CharField(max_length=16, blank=True)
+    value = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['charger_number', 'timestamp'], name='metervaluesample_charger_ts'),
+            models.Index(fields=['transaction_id', 'timestamp'], name='metervaluesample_tx_ts'),
+        ]
+
+def build_meter_value_samples(sampled_meter_value, sample_model) -> list:
+    """
+    Build the normalized sample rows of a `SampledMeterValue`.
+
+    The sampled values may be `SampledValue` instances or their validated dict representations.
+    """
+    samples = []
+    for phase in ['L1', 'L2', 'L3']:
+        for sampled_value in getattr(sampled_meter_value, phase):
+            if not isinstance(sampled_value, SampledValue):
+                sampled_value = SampledValue.model_validate(dict(sampled_value))
+            samples.append(sample_model(
+                charger_number=sampled_meter_value.charger_number,
+                connector_id=sampled_meter_value.connector_id,
+                transaction_id=sampled_meter_value.transaction_id,
+                timestamp=sampled_value.timestamp,
+                measurand=sampled_value.measurand.value if sampled_value.measurand else '',
+                phase=phase,
+                unit=sampled_value.unit.value if sampled_value.unit else '',
+                value=float(sampled_value.value),
+            ))
+    return samples
 
+class IngestBatch(models.Model):
+    """Log lines queued by the API, waiting to be ingested by the `drain_ingest_queue` worker."""
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        PROCESSING = 'processing'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    lines = models.JSONField()
+    result = models.JSONField(null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='ingestbatch_status_id'),
+        ]
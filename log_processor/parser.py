@@ -1,13 +1,13 @@
-import json
 import re
-from typing import Callable, Dict, List, Type
+import time
+from typing import Callable, Dict, List, Optional, Type
 from pydantic import BaseModel
 from rest_framework import serializers
 
 from log_processor import errors, models
 from log_processor.errors import ErrorMessage
 from scripts import patterns
-from utilities import comparator
+from utilities import jsoncodec
 from .serializers import SERIALIZER_TYPES_MAP
 from django.core.exceptions import ValidationError
 
@@ -15,42 +15,69 @@ class ParserOutput(BaseModel):
     parsed_models: List[Dict]
     serializer_clz: Type[serializers.ModelSerializer]
 
-class ParserStepIO(BaseModel, extra='allow'):
-    content: List[Dict]
-    request_type: str
+class ParserContext:
+    """
+    Mutable state handed from one parser step to the next.
+
+    Steps update it in place, so nothing is copied or validated between steps:
+    the parsed models are only validated once, when the `ParserOutput` is built.
+    """
+    __slots__ = ('request_type', 'content', 'charger_number', 'raw_data')
+
+    def __init__(self, request_type: str, content: List[Dict], charger_number: Optional[str] = None, raw_data: Optional[str] = None):
+        self.request_type = request_type
+        self.content = content
+        self.charger_number = charger_number
+        self.raw_data = raw_data
+
+# Callables invoked with (request type, step name, elapsed seconds) after every parser step
+STEP_HOOKS: List[Callable[[str, str, float], None]] = []
+
+def register_step_hook(hook: Callable[[str, str, float], None]):
+    STEP_HOOKS.append(hook)
+    return hook
+
+def unregister_step_hook(hook: Callable[[str, str, float], None]):
+    STEP_HOOKS.remove(hook)
+
+def _call_step_hooks(request_type: str, step_name: str, elapsed: float):
+    for hook in STEP_HOOKS:
+        hook(request_type, step_name, elapsed)
 
 class BaseParser(BaseModel):
-    steps: List[Callable[[ParserStepIO], ParserStepIO]]
+    steps: List[Callable[[ParserContext], None]]
 
-    def _parse(self, input: ParserStepIO) -> ParserStepIO:
-        result = input
+    def _parse(self, context: ParserContext) -> ParserContext:
+        # Only pay for the timing when somebody listens
+        if not STEP_HOOKS:
+            for step in self.steps:
+                step(context)
+            return context
         for step in self.steps:
-            result = step(result)
-        return result
+            start = time.perf_counter()
+            step(context)
+            _call_step_hooks(context.request_type, step.__name__, time.perf_counter() - start)
+        return context
 
-    def parsed(self, input: ParserStepIO) -> ParserOutput:
-        r = self._parse(input)
+    def parsed(self, context: ParserContext) -> ParserOutput:
+        r = self._parse(context)
         try:
             serializer_clz = SERIALIZER_TYPES_MAP[r.request_type]
         except KeyError:
             raise errors.CurrentlyUnSupported(ErrorMessage.UNSUPPORTED_CHARGER_SENT_REQUEST_TYPE.value)
         return ParserOutput(parsed_models=r.content, serializer_clz=serializer_clz)
 
-def add_charger_number_and_raw_data_to_content(data: ParserStepIO) -> ParserStepIO:
-    data_dict = data.model_dump()
-
+def add_charger_number_and_raw_data_to_content(context: ParserContext):
     # Update content field
-    data_dict['content'] = [{
-        'charger_number': data.charger_number,
-        **json.loads(data.content[0]['json_str']),
-        'raw_data': data.raw_data,
+    context.content = [{
+        'charger_number': context.charger_number,
+        **jsoncodec.loads(context.content[0]['json_str']),
+        'raw_data': context.raw_data,
     }]
 
-    return ParserStepIO(**data_dict)
-
-def flatten_meter_value(data: ParserStepIO) -> ParserStepIO:
+def flatten_meter_value(context: ParserContext):
     # Extract basic information
-    prev_content = data.content[0]
+    prev_content = context.content[0]
     meter_values = prev_content["meterValue"]
     prev_content.pop("meterValue", None)
     # Collect all sampled values and add missing fields
@@ -65,19 +92,25 @@ def flatten_meter_value(data: ParserStepIO) -> ParserStepIO:
                 **sampled_value
             })
 
-    r = ParserStepIO(content=[{
+    context.content = [{
         "all_sampled_values": all_sampled_values,
         **prev_content
-    }], request_type=data.request_type)
-    
-    return r
+    }]
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return frozenset((k, _hashable(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    return value
 
-def process_sampled_values(data: ParserStepIO) -> ParserStepIO:
-    def _same_type_sample_values(to_compare: dict, values: List[dict], ignores: List[str] = ["value", "phase", "timestamp"]) -> List[dict]:
-        return [v for v in values if comparator.shallow_compare_two_dicts(v, to_compare, ignores)]
+def _sample_type_key(sampled_value: dict, ignores=("value", "phase", "timestamp")):
+    """Hashable key shared by the sampled values of the same type (same except for "value", "phase" and "timestamp")."""
+    return frozenset((k, _hashable(v)) for k, v in sampled_value.items() if k not in ignores)
 
+def process_sampled_values(context: ParserContext):
     # Extract basic information
-    prev_content = data.content[0]
+    prev_content = context.content[0]
     all_sampled_values = prev_content["all_sampled_values"]
 
     # Define phases and units
@@ -95,27 +128,16 @@ def process_sampled_values(data: ParserStepIO) -> ParserStepIO:
     for phase in l_phases:
         merged_result[phase] = {unit: [] for unit in valid_units}
 
-    # Initialize dictionaries to store phases for each unit
-    phases_dict = {unit: set() for unit in valid_units}
-
-    # Populate phases to process for each valid unit
-    for sampled_value in all_sampled_values:
-        unit = sampled_value.get("unit")
-        if unit in valid_units:
-            phase = sampled_value.get("phase")
-            if phase in all_phases:
-                phases_dict[unit].add(phase)
-
     # Initialize a dictionary to store values for each phase
     phase_unit_sampled_values = {phase: {unit: [] for unit in valid_units} for phase in l_phases}
-        
+
     # Categorize sampledValues
     for sampled_value in all_sampled_values:
         value = float(sampled_value["value"])
         phase = sampled_value.get("phase")
         unit = sampled_value.get("unit")
 
-        if unit in valid_units and phase in phases_dict[unit] and value > 0:
+        if unit in valid_units and phase in all_phases and value > 0:
             # When phase is absent, the measured value is interpreted as an overall value. Default to L1
             phase_unit_sampled_values[phase[:2] if phase else "L1"][unit].append(sampled_value)
 
@@ -124,24 +146,36 @@ def process_sampled_values(data: ParserStepIO) -> ParserStepIO:
         for u, list_sample in d.items():
             list_sample.sort(key=lambda x: len(x["phase"]) if x.get("phase") else 0)
 
+    # Index the L2 & L3 sampled values by (sample type, phase), so that finding the other phases of a L1 sampled value is a lookup
+    phase_type_index = {phase: {unit: {} for unit in valid_units} for phase in ["L2", "L3"]}
+    for phase, index in phase_type_index.items():
+        for unit, d in phase_unit_sampled_values[phase].items():
+            for stored_sampled_value in d:
+                index[unit].setdefault((_sample_type_key(stored_sampled_value), stored_sampled_value["phase"]), []).append(stored_sampled_value)
+
+    # Sample types already retained in L1 for each unit
+    l1_sample_types = {unit: set() for unit in valid_units}
+
     # Process L1 sampled values
+    phase_mapping = {
+        "L1": ("L2", "L3"),
+        "L1-N": ("L2-N", "L3-N"),
+        "L1-L2": ("L2-L3", "L3-L1"),
+    }
     for unit, d in phase_unit_sampled_values["L1"].items():
         for stored_sampled_value in d:
+            sample_type = _sample_type_key(stored_sampled_value)
             # If there is an overall item
             if not stored_sampled_value.get("phase"):
                 # L1 retains the overall item
                 merged_result["L1"][unit].append(stored_sampled_value)
+                l1_sample_types[unit].add(sample_type)
             # If it is not an overall item and there is no same type item, check whether it is single-phase or three-phase
-            elif len(_same_type_sample_values(stored_sampled_value, merged_result["L1"][unit])) == 0:
-                phase_mapping = {
-                    "L1": ("L2", "L3"),
-                    "L1-N": ("L2-N", "L3-N"),
-                    "L1-L2": ("L2-L3", "L3-L1"),
-                }
-                # Get the target phases and array indices for the corresponding phase
+            elif sample_type not in l1_sample_types[unit]:
+                # Get the target phases for the corresponding phase
                 l2_phase, l3_phase = phase_mapping.get(stored_sampled_value.get("phase"))
-                l2_same_type_sample_values = _same_type_sample_values({**stored_sampled_value, "phase": l2_phase}, phase_unit_sampled_values["L2"][unit], ["value", "timestamp"])
-                l3_same_type_sample_values = _same_type_sample_values({**stored_sampled_value, "phase": l3_phase}, phase_unit_sampled_values["L3"][unit], ["value", "timestamp"])
+                l2_same_type_sample_values = phase_type_index["L2"][unit].get((sample_type, l2_phase), [])
+                l3_same_type_sample_values = phase_type_index["L3"][unit].get((sample_type, l3_phase), [])
                 # If both of the next two phases have values, it is three-phase
                 if len(l2_same_type_sample_values) > 0 and len(l3_same_type_sample_values) > 0:
                     merged_result["L1"][unit].append(stored_sampled_value)
@@ -152,16 +186,20 @@ def process_sampled_values(data: ParserStepIO) -> ParserStepIO:
                     merged_result["L1"][unit].append(stored_sampled_value)
                 else:
                     raise ValidationError(f"Invalid data format: {stored_sampled_value} should either be a single-phase or triphase")
+                l1_sample_types[unit].add(sample_type)
 
     # Process L2 & L3 sampled values
     supplements = {unit: [] for unit in valid_units}
+    supplement_sample_types = {unit: set() for unit in valid_units}
     for phase in ["L2", "L3"]:
         for unit, d in phase_unit_sampled_values[phase].items():
             # If it is not in L1, add it to L1
             for stored_sampled_value in d:
-                if not _same_type_sample_values(stored_sampled_value, merged_result["L1"][unit]):
-                    is_having_same_type = _same_type_sample_values(stored_sampled_value, supplements[unit])
+                sample_type = _sample_type_key(stored_sampled_value)
+                if sample_type not in l1_sample_types[unit]:
+                    is_having_same_type = sample_type in supplement_sample_types[unit]
                     supplements[unit].append(stored_sampled_value)
+                    supplement_sample_types[unit].add(sample_type)
                     if is_having_same_type:
                         # Both L2 & L3 have the same type while L1 doesn't
                         raise ValidationError(f"Invalid phase configuration! Should either be single-phase or triphase, now {supplements[unit]}")
@@ -172,8 +210,7 @@ def process_sampled_values(data: ParserStepIO) -> ParserStepIO:
     for phase in l_phases:
         merged_result[phase] = [i for lst in merged_result[phase].values() for i in lst]
 
-    r = ParserStepIO(content=[merged_result], request_type=data.request_type)
-    return r
+    context.content = [merged_result]
 
 CHARGER_REQUEST_PARSER_MAP = {
     'datatransfer': BaseParser(steps=[add_charger_number_and_raw_data_to_content]),
@@ -181,40 +218,54 @@ CHARGER_REQUEST_PARSER_MAP = {
 }
 
 class ParserPattern(BaseModel):
+    identifier: str # substring the input must contain, checked before running the (more expensive) regex
     pattern: re.Pattern
-    build_parser_input: Callable[[tuple], ParserStepIO]
+    build_parser_input: Callable[[str, re.Match], ParserContext]
+
+# Precompiled parser patterns, tried in order by `parse_input`
+PARSER_PATTERNS: List[ParserPattern] = []
+
+def register_parser_pattern(parser_pattern: ParserPattern) -> ParserPattern:
+    PARSER_PATTERNS.append(parser_pattern)
+    return parser_pattern
+
+def build_charger_sent_request_input(data: str, match: re.Match) -> ParserContext:
+    charger_number, request_type, json_str = match.groups()
+    return ParserContext(
+        charger_number=charger_number,
+        request_type=request_type.lower(),
+        content=[{'json_str': json_str}],
+        raw_data=data
+    )
+
+register_parser_pattern(ParserPattern(
+    identifier=patterns.ChargerSentMessageIdentifier.RECEIVE_MESSAGE,
+    pattern=re.compile(r'ocpp:([\w|\d]+):.+receive message\s*\[.+,.+,\s*\"(\w+)\"\s*,\s*(\{.+\})\s*]'),
+    build_parser_input=build_charger_sent_request_input
+))
+register_parser_pattern(ParserPattern(
+    identifier=patterns.ChargerSentMessageIdentifier.CONSUMERS,
+    pattern=re.compile(patterns.CONSUMERS_REGEX.pattern + r'\[(\w+)\].+?\[.+,.+,\s*\"(\w+)\"\s*,\s*(\{.+\})\s*]'),
+    build_parser_input=build_charger_sent_request_input
+))
+# Register more patterns to parse the input string
 
 def parse_input(data: str) -> ParserOutput:
-    parser_patterns: List[ParserPattern] = [
-        ParserPattern(
-            pattern=re.compile(r'ocpp:([\w|\d]+):.+receive message\s*\[.+,.+,\s*\"(\w+)\"\s*,\s*(\{.+\})\s*]'),
-            build_parser_input=lambda x,y,z: ParserStepIO(**{
-                'charger_number': x,
-                'request_type': y.lower(),
-                'content': [{'json_str': z}],
-                'raw_data': data
-            })
-        ),
-        ParserPattern(
-            pattern=re.compile(patterns.CONSUMERS_REGEX.pattern + r'\[(\w+)\].+?\[.+,.+,\s*\"(\w+)\"\s*,\s*(\{.+\})\s*]'),
-            build_parser_input=lambda x,y,z: ParserStepIO(**{
-                'charger_number': x,
-                'request_type': y.lower(),
-                'content': [{'json_str': z}],
-                'raw_data': data
-            })
-        ),
-
-        # Add more patterns here to parse the input string
-    ]
-    for pp in parser_patterns:
-        match = pp.pattern.search(data)
-        if match:
-            r = pp.build_parser_input(*match.groups())
-            try:
-                parser: BaseParser = CHARGER_REQUEST_PARSER_MAP[r.request_type]
-            except KeyError:
-                raise errors.CurrentlyUnSupported(ErrorMessage.NOT_CONFIGURED.value + f': {match.group(2)}')
-            return parser.parsed(r)
+    if isinstance(data, str):
+        for pp in PARSER_PATTERNS:
+            if pp.identifier not in data:
+                continue
+            start = time.perf_counter() if STEP_HOOKS else None
+            match = pp.pattern.search(data)
+            if match:
+                r = pp.build_parser_input(data, match)
+                if start is not None:
+                    # Reported to the step hooks as a pseudo step preceding the parser's steps
+                    _call_step_hooks(r.request_type, 'match_pattern', time.perf_counter() - start)
+                try:
+                    parser: BaseParser = CHARGER_REQUEST_PARSER_MAP[r.request_type]
+                except KeyError:
+                    raise errors.CurrentlyUnSupported(ErrorMessage.NOT_CONFIGURED.value + f': {match.group(2)}')
+                return parser.parsed(r)
     # If no match is found for known patterns, then it means that the input format is not supported yet
-    raise errors.CurrentlyUnSupported(ErrorMessage.UNSUPPORTED_INPUT_FORMAT.value)
\ No newline at end of file
+    raise errors.CurrentlyUnSupported(ErrorMessage.UNSUPPORTED_INPUT_FORMAT.value)
@@ -0,0 +1,28 @@
+import json
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+from utilities import jsoncodec
+
+class NDJSONParser(BaseParser):
+    """
+    Parses a newline delimited JSON body into a list of values.
+
+    Lines which are not valid JSON are kept as they are, so a raw log file can be posted directly.
+    Bytes which are not valid in the request encoding are replaced, as for the raw log uploads.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        values = []
+        for raw_line in stream:
+            line = raw_line.decode(encoding, errors='replace').rstrip('\r\n')
+            if not line.strip():
+                continue
+            try:
+                values.append(jsoncodec.loads(line))
+            except json.JSONDecodeError:
+                values.append(line)
+        return values
@@ -1,18 +1,99 @@
+from typing import List, Optional
+import pydantic
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import datetime_re
+from pydantic import TypeAdapter
+from pytz import InvalidTimeError
 from rest_framework import serializers
 
-from log_processor.models import DataTransferRequest, Location, Measurand, Phase, ReadingContext, SampledMeterValue, UnitOfMeasure, ValueFormat
+from log_processor.models import DataTransferRequest, Location, Measurand, MeterValueSample, Phase, RawLogLine, ReadingContext, SampledMeterValue, SampledValue, UnitOfMeasure, ValueFormat
 
-class DataTransferRequestSerializer(serializers.ModelSerializer):
+class RawLogLineMixin:
+    """Stores the `raw_data` of the validated data as a deduplicated `RawLogLine` referenced by the instance."""
+
+    def split_raw_line(self, validated_data):
+        validated_data = dict(validated_data)
+        return validated_data, RawLogLine.from_text(validated_data.pop('raw_data'))
+
+    def create(self, validated_data):
+        validated_data, raw_line = self.split_raw_line(validated_data)
+        with transaction.atomic():
+            RawLogLine.objects.bulk_create([raw_line], ignore_conflicts=True)
+            return self.Meta.model.objects.create(**validated_data, raw_line=raw_line)
+
+class BulkCreateMixin(RawLogLineMixin):
+    def build_instance(self):
+        """Unsaved model instance built from the validated data, to be saved with `bulk_create` after its `raw_line`."""
+        validated_data, raw_line = self.split_raw_line(self.validated_data)
+        return self.Meta.model(**validated_data, raw_line=raw_line)
+
+class DataTransferRequestSerializer(BulkCreateMixin, serializers.ModelSerializer):
     vendorId = serializers.CharField(source='vendor_id')
     messageId = serializers.CharField(source='message_id')
     data = serializers.CharField(allow_blank=True)
+    raw_data = serializers.CharField()
     class Meta:
         model = DataTransferRequest
         fields = ['charger_number', 'vendorId', 'messageId', 'data', 'raw_data']
 
-    def create(self, validated_data):
-        data_transfer_request = DataTransferRequest.objects.create(**validated_data)
-        return data_transfer_request
+SAMPLED_VALUES_ADAPTER = TypeAdapter(List[SampledValue])
+SAMPLED_VALUE_CHOICE_FIELDS = ('context', 'format', 'measurand', 'phase', 'location', 'unit')
+_MISSING = object()
+
+def _validate_sampled_values(data) -> Optional[List[SampledValue]]:
+    """
+    Validate a list of sampled values in one pass with the pydantic adapter of `SampledMeterValue.L1/L2/L3`.
+
+    This is an accelerator in front of `SampledValueSerializer`, not a replacement: it returns None
+    for the lists it cannot validate exactly like the serializer (inputs the serializer coerces,
+    e.g. blank choices or numeric values) and for invalid lists, which are then validated by the
+    serializer for its error messages. `SampledValueValidationTests.EDGE_CASES` keeps both in line.
+    """
+    if not isinstance(data, list):
+        return None
+    for item in data:
+        if not isinstance(item, dict):
+            return None
+        value, timestamp = item.get('value'), item.get('timestamp')
+        if not (isinstance(value, str) and value and value.isascii() and '\x00' not in value and value.strip() == value):
+            return None
+        if not (isinstance(timestamp, str) and datetime_re.match(timestamp)):
+            return None
+        for name in SAMPLED_VALUE_CHOICE_FIELDS:
+            choice = item.get(name, _MISSING)
+            if choice is not _MISSING and not (isinstance(choice, str) and choice):
+                return None
+    try:
+        sampled_values = SAMPLED_VALUES_ADAPTER.validate_python(data)
+    except pydantic.ValidationError:
+        return None
+    current_timezone = timezone.get_current_timezone()
+    try:
+        for sampled_value in sampled_values:
+            # Like `serializers.DateTimeField.enforce_timezone`
+            if timezone.is_naive(sampled_value.timestamp):
+                sampled_value.timestamp = timezone.make_aware(sampled_value.timestamp, current_timezone)
+            else:
+                sampled_value.timestamp = sampled_value.timestamp.astimezone(current_timezone)
+    except (OverflowError, InvalidTimeError):
+        return None
+    return sampled_values
+
+class SampledValueListSerializer(serializers.ListSerializer):
+    """Validates the whole list with `_validate_sampled_values`, falling back to the per item serializer, which stays the reference."""
+
+    def to_internal_value(self, data):
+        sampled_values = _validate_sampled_values(data)
+        if sampled_values is None:
+            return super().to_internal_value(data)
+        return sampled_values
+
+    def to_representation(self, data):
+        return [
+            item.model_dump(mode='json', exclude_unset=True) if isinstance(item, SampledValue) else self.child.to_representation(item)
+            for item in data
+        ]
 
 class SampledValueSerializer(serializers.Serializer):
     timestamp = serializers.DateTimeField()
@@ -24,13 +105,86 @@ class SampledValueSerializer(serializers.Serializer):
     location = serializers.ChoiceField(choices=[e.value for e in Location], allow_blank=True, required=False)
     unit = serializers.ChoiceField(choices=[e.value for e in UnitOfMeasure], allow_blank=True, required=False)
 
-class SampledMeterValueSerializer(serializers.ModelSerializer):
+    class Meta:
+        list_serializer_class = SampledValueListSerializer
+
+class SampledMeterValueSerializer(BulkCreateMixin, serializers.ModelSerializer):
     L1 = SampledValueSerializer(many=True)
     L2 = SampledValueSerializer(many=True)
     L3 = SampledValueSerializer(many=True)
+    raw_data = serializers.CharField()
     class Meta:
         model = SampledMeterValue
-        fields = '__all__'
+        exclude = ['raw_line']
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            sampled_meter_value = super().create(validated_data)
+            MeterValueSample.objects.bulk_create(sampled_meter_value.build_samples())
+        return sampled_meter_value
+
+class OptionalRawDataMixin:
+    def get_fields(self):
+        """`raw_data` is only serialized when the view was asked to include it."""
+        fields = super().get_fields()
+        if not self.context.get('include_raw'):
+            fields.pop('raw_data', None)
+        return fields
+
+class SampledValuesField(serializers.Field):
+    def to_representation(self, value):
+        return [sampled_value.model_dump(mode='json', exclude_none=True) for sampled_value in value]
+
+class DataTransferRequestReadSerializer(OptionalRawDataMixin, serializers.ModelSerializer):
+    vendorId = serializers.CharField(source='vendor_id')
+    messageId = serializers.CharField(source='message_id')
+    raw_data = serializers.CharField(read_only=True)
+    class Meta:
+        model = DataTransferRequest
+        fields = ['id', 'created_at', 'charger_number', 'vendorId', 'messageId', 'data', 'raw_data']
+
+class SampledMeterValueReadSerializer(OptionalRawDataMixin, serializers.ModelSerializer):
+    L1 = SampledValuesField()
+    L2 = SampledValuesField()
+    L3 = SampledValuesField()
+    raw_data = serializers.CharField(read_only=True)
+    class Meta:
+        model = SampledMeterValue
+        fields = ['id', 'created_at', 'charger_number', 'connector_id', 'transaction_id', 'L1', 'L2', 'L3', 'raw_data']
+
+class ChargerSentRequestFilterSerializer(serializers.Serializer):
+    """Query parameters of the read API. Every declared filter except `include_raw` maps to a lookup in `LOOKUPS`."""
+    LOOKUPS = {
+        'charger_number': 'charger_number',
+        # Compared to the time the row was ingested, not to the time the charger sent the message
+        'ingested_since': 'created_at__gte',
+        'ingested_until': 'created_at__lt',
+    }
+    charger_number = serializers.CharField(required=False)
+    ingested_since = serializers.DateTimeField(required=False)
+    ingested_until = serializers.DateTimeField(required=False)
+    include_raw = serializers.BooleanField(required=False, default=False)
+
+    def lookups(self) -> dict:
+        return {self.LOOKUPS[name]: value for name, value in self.validated_data.items() if name in self.LOOKUPS}
+
+class DataTransferRequestFilterSerializer(ChargerSentRequestFilterSerializer):
+    LOOKUPS = {
+        **ChargerSentRequestFilterSerializer.LOOKUPS,
+        'vendor_id': 'vendor_id',
+        'message_id': 'message_id',
+    }
+    vendor_id = serializers.CharField(required=False)
+    message_id = serializers.CharField(required=False, allow_blank=True)
+
+class SampledMeterValueFilterSerializer(ChargerSentRequestFilterSerializer):
+    LOOKUPS = {
+        **ChargerSentRequestFilterSerializer.LOOKUPS,
+        'connector_id': 'connector_id',
+        'transaction_id': 'transaction_id',
+    }
+    connector_id = serializers.IntegerField(required=False)
+    transaction_id = serializers.IntegerField(required=False)
 
 SERIALIZER_TYPES_MAP = {
     'datatransfer': DataTransferRequestSerializer,
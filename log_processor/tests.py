@@ -1,12 +1,27 @@
+import asyncio
+import bz2
+import copy
+import gzip
 import json
 import os
-from django.test import TestCase
+import random
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
-from rest_framework import status
+from django.utils import timezone
+from rest_framework import serializers as drf_serializers, status
 
-from log_processor import errors
+from log_processor import errors, export, ingest, ingest_queue, instrumentation, models, parser, serializers
 from log_processor.views import api_failed_response_body
-from utilities import loggers
+from utilities import comparator, loggers, metrics
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 # Get the root path of the project directory
@@ -92,3 +107,823 @@ class ProcessChargerSentLogsAPIViewTests(TestCase):
             response.content.decode('utf-8'),
             api_failed_response_body(f'{errors.ErrorMessage.NOT_CONFIGURED.value}: Authorize')
         )
+
+
+class BulkProcessChargerSentLogsAPIViewTests(TestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            self.metervalues_lines = [line for line in f if line.strip()]
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+
+    def _bulk_process_charger_sent_logs(self, data, content_type='application/json'):
+        return self.client.post(
+            path=reverse('log_processor:bulk-process-charger-sent-logs'),
+            data=data,
+            content_type=content_type,
+        )
+
+    def test_bulk_process_json_array(self):
+        lines = self.metervalues_lines + [CORRECT_DATATRANSFER_LOG_RECORD]
+        response = self._bulk_process_charger_sent_logs(json.dumps(lines))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['message']['created'], len(lines))
+        self.assertEqual(models.SampledMeterValue.objects.count(), len(self.metervalues_lines))
+        self.assertEqual(models.DataTransferRequest.objects.count(), 1)
+
+    def test_bulk_process_ndjson_reports_status_per_line(self):
+        lines = [
+            CORRECT_DATATRANSFER_LOG_RECORD,
+            METERVALUES_LOG_RECORD_WITH_UNSUPPORTED_REGEX_PATTERN,
+            DATATRANSFER_LOG_RECORD_WITH_WRONG_FORMAT,
+            LOG_RECORD_WITH_UNSUPPORTED_KEYWORD,
+        ]
+        response = self._bulk_process_charger_sent_logs('\n'.join(json.dumps(line) for line in lines), 'application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.json()['message']['error']['results']
+        self.assertEqual([r['status'] for r in results], [
+            status.HTTP_201_CREATED,
+            status.HTTP_406_NOT_ACCEPTABLE,
+            status.HTTP_400_BAD_REQUEST,
+            status.HTTP_406_NOT_ACCEPTABLE,
+        ])
+        self.assertEqual(results[2]['error'], {"data": ["Not a valid string."]})
+        self.assertEqual(models.DataTransferRequest.objects.count(), 1)
+
+    def test_bulk_process_raw_ndjson_lines(self):
+        response = self._bulk_process_charger_sent_logs(''.join(self.metervalues_lines), 'application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(models.SampledMeterValue.objects.count(), len(self.metervalues_lines))
+
+    def test_bulk_process_ndjson_with_invalid_utf8(self):
+        body = json.dumps(CORRECT_DATATRANSFER_LOG_RECORD).encode() + b'\n' + CORRECT_DATATRANSFER_LOG_RECORD.strip().replace('id=0', 'id=\xff', 1).encode('latin-1')
+        response = self._bulk_process_charger_sent_logs(body, 'application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['message']['created'], 2)
+        self.assertTrue(models.DataTransferRequest.objects.filter(data__startswith='id=\ufffd&').exists())
+
+    def test_bulk_process_rejects_non_list_body(self):
+        response = self._bulk_process_charger_sent_logs(json.dumps(CORRECT_DATATRANSFER_LOG_RECORD))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StreamedLogFileIngestionTests(TestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            self.metervalues_lines = [line for line in f if line.strip()]
+        self.raw_log = ''.join(self.metervalues_lines) + CORRECT_DATATRANSFER_LOG_RECORD + 'INFO:ocpp:1000191: send [3,"104",{"status":"Accepted"}]\n'
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+
+    def assertIngested(self, summary):
+        self.assertEqual(summary['statuses'], {str(status.HTTP_201_CREATED): len(self.metervalues_lines) + 1})
+        self.assertEqual(summary['errors'], [])
+        self.assertEqual(models.SampledMeterValue.objects.count(), len(self.metervalues_lines))
+        self.assertEqual(models.DataTransferRequest.objects.count(), 1)
+
+    def test_ingest_log_file_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.log') as log_file:
+            log_file.write(self.raw_log)
+            log_file.flush()
+            out = StringIO()
+            call_command('ingest_log_file', log_file.name, '--chunk-size', '3', stdout=out)
+        summary = json.loads(out.getvalue())
+        # Only the charger sent messages are parsed
+        self.assertEqual(summary['total_lines'] - summary['skipped_lines'], len(self.metervalues_lines) + 1)
+        self.assertIngested(summary)
+
+    def test_ingest_compressed_log_file_command(self):
+        with tempfile.NamedTemporaryFile(suffix='.log.gz') as log_file:
+            log_file.write(gzip.compress(self.raw_log.encode()))
+            log_file.flush()
+            out = StringIO()
+            call_command('ingest_log_file', log_file.name, stdout=out)
+        self.assertIngested(json.loads(out.getvalue()))
+
+    def test_upload_log_file(self):
+        response = self.client.post(
+            path=reverse('log_processor:upload-charger-sent-logs'),
+            data={'file': SimpleUploadedFile('log1.log', self.raw_log.encode())},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIngested(response.json()['message'])
+
+    def test_stream_log_file_as_request_body(self):
+        response = self.client.post(
+            path=reverse('log_processor:upload-charger-sent-logs'),
+            data=self.raw_log + LOG_RECORD_WITH_UNSUPPORTED_KEYWORD,
+            content_type='text/plain',
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        summary = response.json()['message']['error']
+        self.assertEqual(summary['statuses'][str(status.HTTP_406_NOT_ACCEPTABLE)], 1)
+        self.assertEqual(models.SampledMeterValue.objects.count(), len(self.metervalues_lines))
+
+    def test_upload_compressed_log_file(self):
+        response = self.client.post(
+            path=reverse('log_processor:upload-charger-sent-logs'),
+            data={'file': SimpleUploadedFile('log1.log.bz2', bz2.compress(self.raw_log.encode()))},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIngested(response.json()['message'])
+
+    def test_stream_compressed_log_file_as_request_body(self):
+        response = self.client.post(
+            path=reverse('log_processor:upload-charger-sent-logs'),
+            data=gzip.compress(self.raw_log.encode()),
+            content_type='application/gzip',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIngested(response.json()['message'])
+
+    def test_stream_corrupted_log_file_as_request_body(self):
+        response = self.client.post(
+            path=reverse('log_processor:upload-charger-sent-logs'),
+            data=gzip.compress(self.raw_log.encode())[:-20],
+            content_type='application/gzip',
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MeterValueSampleTests(TestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            self.metervalues_lines = [line for line in f if line.strip()]
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+
+    def _samples(self):
+        return sorted(
+            models.MeterValueSample.objects.values_list('charger_number', 'connector_id', 'transaction_id', 'timestamp', 'measurand', 'phase', 'unit', 'value')
+        )
+
+    def _expected_samples(self):
+        expected = []
+        for sampled_meter_value in models.SampledMeterValue.objects.all():
+            for phase in ['L1', 'L2', 'L3']:
+                for sampled_value in getattr(sampled_meter_value, phase):
+                    expected.append((
+                        sampled_meter_value.charger_number, sampled_meter_value.connector_id, sampled_meter_value.transaction_id,
+                        sampled_value.timestamp, sampled_value.measurand.value, phase, sampled_value.unit.value, float(sampled_value.value),
+                    ))
+        return sorted(expected)
+
+    def test_single_line_api_writes_samples(self):
+        for line in self.metervalues_lines:
+            self.client.post(path=reverse('log_processor:process-charger-sent-logs'), data=json.dumps(line), content_type='application/json')
+        self.assertTrue(models.MeterValueSample.objects.exists())
+        self.assertEqual(self._samples(), self._expected_samples())
+
+    def test_bulk_ingestion_writes_the_same_samples(self):
+        for line in self.metervalues_lines:
+            self.client.post(path=reverse('log_processor:process-charger-sent-logs'), data=json.dumps(line), content_type='application/json')
+        single_line_samples = self._samples()
+        models.MeterValueSample.objects.all().delete()
+        models.SampledMeterValue.objects.all().delete()
+        models.RawLogLine.objects.all().delete()
+        response = self.client.post(
+            path=reverse('log_processor:bulk-process-charger-sent-logs'),
+            data=json.dumps(self.metervalues_lines),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._samples(), single_line_samples)
+        self.assertEqual(self._samples(), self._expected_samples())
+
+    def test_time_range_query_uses_index(self):
+        plan = str(models.MeterValueSample.objects.filter(charger_number='1000186', timestamp__gte='2024-07-01T00:00:00Z').explain())
+        self.assertIn('metervaluesample_charger_ts', plan)
+
+
+@skipUnless(export.pa, 'pyarrow is not installed')
+class ColumnarExportTests(TestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            self.metervalues_lines = [line for line in f if line.strip()]
+        self.raw_log = ''.join(self.metervalues_lines) + CORRECT_DATATRANSFER_LOG_RECORD + LOG_RECORD_WITH_UNSUPPORTED_KEYWORD
+        self.output_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.output_dir.cleanup()
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+
+    def _ingest(self):
+        summary = ingest.ingest_stream(self.raw_log.splitlines(keepends=True))
+        self.assertEqual(summary['statuses'][status.HTTP_201_CREATED], len(self.metervalues_lines) + 1)
+
+    def _stored_samples(self):
+        return list(models.MeterValueSample.objects.order_by('id').values_list(*(name for name, _ in export.METER_VALUE_COLUMNS)))
+
+    def _rows(self, table, columns):
+        return list(zip(*(table.column(name).to_pylist() for name, _ in columns)))
+
+    def test_parquet_export_of_stored_rows(self):
+        import pyarrow.parquet as pq
+        self._ingest()
+        samples = self._stored_samples()
+        summary = export.export_database(self.output_dir.name, 'parquet', row_group_size=4)
+        meter_values = pq.ParquetFile(summary['meter_values']['path'])
+        self.assertEqual(summary['meter_values']['rows'], len(samples))
+        self.assertEqual(meter_values.metadata.num_row_groups, -(-len(samples) // 4))
+        self.assertTrue(all(meter_values.metadata.row_group(i).num_rows <= 4 for i in range(meter_values.metadata.num_row_groups)))
+        table = meter_values.read()
+        for name in ('charger_number', 'measurand', 'phase', 'unit'):
+            self.assertEqual(table.schema.field(name).type, export.pa.dictionary(export.pa.int32(), export.pa.string()))
+        self.assertEqual(self._rows(table, export.METER_VALUE_COLUMNS), samples)
+        data_transfers = pq.read_table(summary['data_transfers']['path'])
+        self.assertEqual(data_transfers.column('vendor_id').to_pylist(), ['ATESS'])
+        self.assertIsNotNone(data_transfers.column('created_at')[0].as_py())
+
+    def test_arrow_export_is_memory_mappable(self):
+        self._ingest()
+        samples = self._stored_samples()
+        summary = export.export_database(self.output_dir.name, 'arrow', row_group_size=3)
+        with export.pa.memory_map(summary['meter_values']['path']) as source:
+            reader = export.pa.ipc.open_file(source)
+            self.assertEqual(reader.num_record_batches, summary['meter_values']['row_groups'])
+            table = reader.read_all()
+            # Later batches extend the dictionary of the first one
+            self.assertEqual(self._rows(table, export.METER_VALUE_COLUMNS), samples)
+            self.assertEqual(table.schema.field('phase').type, export.pa.dictionary(export.pa.int32(), export.pa.string()))
+
+    def test_export_log_file_command(self):
+        self._ingest()
+        samples = self._stored_samples()
+        with tempfile.NamedTemporaryFile(suffix='.log.gz') as log_file:
+            log_file.write(gzip.compress(self.raw_log.encode()))
+            log_file.flush()
+            out = StringIO()
+            call_command('export_columnar', self.output_dir.name, '--log-file', log_file.name, '--format', 'arrow', stdout=out)
+        summary = json.loads(out.getvalue())
+        self.assertEqual(summary['failed_lines'], 1)
+        self.assertEqual(summary['data_transfers']['rows'], 1)
+        with export.pa.memory_map(summary['meter_values']['path']) as source:
+            table = export.pa.ipc.open_file(source).read_all()
+        # The same rows as the export of the stored samples, without writing to the database
+        self.assertEqual(self._rows(table, export.METER_VALUE_COLUMNS), samples)
+
+    def test_export_without_pyarrow(self):
+        with mock.patch.object(export, 'pa', None):
+            with self.assertRaises(CommandError):
+                call_command('export_columnar', self.output_dir.name, stdout=StringIO())
+
+
+class ReadAPITests(TestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            self.metervalues_lines = [line for line in f if line.strip()]
+        self.client.post(
+            path=reverse('log_processor:bulk-process-charger-sent-logs'),
+            data=json.dumps(self.metervalues_lines + [CORRECT_DATATRANSFER_LOG_RECORD]),
+            content_type='application/json',
+        )
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+
+    def _list(self, name, **params):
+        return self.client.get(reverse(f'log_processor:{name}'), params)
+
+    def _list_all(self, name, **params):
+        ids, response = [], self._list(name, **params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(r['id'] for r in response.json()['results'])
+            if not response.json()['next']:
+                return ids
+            response = self.client.get(response.json()['next'])
+
+    def test_list_sampled_meter_values_without_raw_data(self):
+        response = self._list('sampled-meter-values')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual(len(results), len(self.metervalues_lines))
+        self.assertNotIn('raw_data', results[0])
+        stored = models.SampledMeterValue.objects.get(id=results[0]['id'])
+        self.assertEqual(results[0]['L1'], [v.model_dump(mode='json', exclude_none=True) for v in stored.L1])
+
+    def test_include_raw_data(self):
+        results = self._list('datatransfer-requests', include_raw='true').json()['results']
+        self.assertEqual(results[0]['raw_data'], models.DataTransferRequest.objects.get().raw_data)
+        self.assertEqual((results[0]['vendorId'], results[0]['messageId']), ('ATESS', 'currentrecord'))
+
+    def test_keyset_pagination_walks_every_row_once(self):
+        ids = self._list_all('sampled-meter-values', page_size=2)
+        self.assertEqual(ids, list(models.SampledMeterValue.objects.order_by('-id').values_list('id', flat=True)))
+
+    def test_filters(self):
+        stored = models.SampledMeterValue.objects.first()
+        ids = self._list_all('sampled-meter-values', charger_number=stored.charger_number, transaction_id=stored.transaction_id)
+        self.assertIn(stored.id, ids)
+        self.assertEqual(
+            sorted(ids),
+            sorted(models.SampledMeterValue.objects.filter(charger_number=stored.charger_number, transaction_id=stored.transaction_id).values_list('id', flat=True)),
+        )
+        self.assertEqual(self._list_all('datatransfer-requests', vendor_id='ATESS', message_id='other'), [])
+        self.assertEqual(self._list_all('sampled-meter-values', ingested_since='2100-01-01T00:00:00Z'), [])
+        self.assertEqual(len(self._list_all('sampled-meter-values', ingested_until='2100-01-01T00:00:00Z')), len(self.metervalues_lines))
+
+    def test_invalid_filter(self):
+        response = self._list('sampled-meter-values', transaction_id='abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('transaction_id', response.json())
+
+    def test_page_is_a_single_query(self):
+        with self.assertNumQueries(1) as ctx:
+            self._list('sampled-meter-values', page_size=3)
+        self.assertNotIn('rawlogline', ctx.captured_queries[0]['sql'])
+        with self.assertNumQueries(1):
+            self._list('sampled-meter-values', page_size=3, include_raw='true')
+
+
+class RawLogLineTests(TestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            self.metervalues_lines = [line for line in f if line.strip()]
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+
+    def _process_charger_sent_logs(self, record_str):
+        return self.client.post(
+            path=reverse('log_processor:process-charger-sent-logs'),
+            data=json.dumps(record_str),
+            content_type='application/json',
+        )
+
+    def _bulk_process_charger_sent_logs(self, lines):
+        return self.client.post(
+            path=reverse('log_processor:bulk-process-charger-sent-logs'),
+            data=json.dumps(lines),
+            content_type='application/json',
+        )
+
+    def test_raw_line_is_stored_compressed_once(self):
+        response = self._process_charger_sent_logs(CORRECT_DATATRANSFER_LOG_RECORD)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['message'][0]['raw_data'], CORRECT_DATATRANSFER_LOG_RECORD.strip())
+        raw_line = models.RawLogLine.objects.get()
+        self.assertEqual(raw_line.digest, models.raw_line_digest(CORRECT_DATATRANSFER_LOG_RECORD.strip()))
+        self.assertEqual(raw_line.text, CORRECT_DATATRANSFER_LOG_RECORD.strip())
+        self.assertLess(len(raw_line.compressed), len(raw_line.text))
+        self.assertEqual(models.DataTransferRequest.objects.get().raw_data, raw_line.text)
+
+    def test_single_line_ingestion_is_idempotent(self):
+        self._process_charger_sent_logs(CORRECT_DATATRANSFER_LOG_RECORD)
+        response = self._process_charger_sent_logs(CORRECT_DATATRANSFER_LOG_RECORD)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(models.DataTransferRequest.objects.count(), 1)
+
+    def test_bulk_ingestion_skips_ingested_lines(self):
+        self._bulk_process_charger_sent_logs(self.metervalues_lines[:3])
+        # Overlapping replay, with a duplicate inside the request
+        lines = self.metervalues_lines + self.metervalues_lines[-1:]
+        response = self._bulk_process_charger_sent_logs(lines)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        body = response.json()['message']
+        self.assertEqual((body['created'], body['skipped'], body['failed']), (len(self.metervalues_lines) - 3, 4, 0))
+        self.assertEqual([r['status'] for r in body['results']][:3], [status.HTTP_200_OK] * 3)
+        self.assertEqual(models.SampledMeterValue.objects.count(), len(self.metervalues_lines))
+        self.assertEqual(models.RawLogLine.objects.count(), len(self.metervalues_lines))
+
+
+class IngestQueueTests(TestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            self.metervalues_lines = [line for line in f if line.strip()]
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+
+    def _queue(self, data):
+        return self.client.post(path=reverse('log_processor:queue-charger-sent-logs'), data=json.dumps(data), content_type='application/json')
+
+    def _drain(self):
+        call_command('drain_ingest_queue', '--once', stdout=StringIO(), stderr=StringIO())
+
+    def test_queued_lines_are_ingested_by_the_worker(self):
+        response = self._queue(self.metervalues_lines + [LOG_RECORD_WITH_UNSUPPORTED_KEYWORD])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = response.json()['message']
+        self.assertEqual(job['status'], models.IngestBatch.Status.PENDING)
+        # Nothing is written before the worker runs
+        self.assertEqual(models.SampledMeterValue.objects.count(), 0)
+        self._drain()
+        self.assertEqual(models.SampledMeterValue.objects.count(), len(self.metervalues_lines))
+        response = self.client.get(job['status_url'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        job = response.json()['message']
+        self.assertEqual(job['status'], models.IngestBatch.Status.DONE)
+        self.assertEqual((job['result']['created'], job['result']['failed']), (len(self.metervalues_lines), 1))
+        self.assertEqual(job['result']['results'][-1]['status'], status.HTTP_406_NOT_ACCEPTABLE)
+
+    def test_queue_single_line(self):
+        self._queue(CORRECT_DATATRANSFER_LOG_RECORD)
+        self._queue(CORRECT_DATATRANSFER_LOG_RECORD)
+        self._drain()
+        self.assertEqual(
+            [batch.result['results'][0]['status'] for batch in models.IngestBatch.objects.order_by('id')],
+            [status.HTTP_201_CREATED, status.HTTP_200_OK],
+        )
+        self.assertEqual(models.DataTransferRequest.objects.count(), 1)
+
+    def test_claimed_batch_is_not_claimed_again(self):
+        ingest_queue.enqueue(self.metervalues_lines)
+        batch = ingest_queue.claim_next_batch()
+        self.assertEqual(batch.status, models.IngestBatch.Status.PROCESSING)
+        self.assertIsNone(ingest_queue.claim_next_batch())
+
+    def test_stale_batches_are_requeued(self):
+        ingest_queue.enqueue(self.metervalues_lines)
+        ingest_queue.claim_next_batch()
+        self.assertEqual(ingest_queue.requeue_stale_batches(timedelta(minutes=10)), 0)
+        self.assertEqual(ingest_queue.requeue_stale_batches(timedelta(seconds=-1)), 1)
+        self.assertEqual(ingest_queue.drain(), 1)
+
+    def test_invalid_body_and_unknown_job(self):
+        self.assertEqual(self._queue({'line': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('log_processor:ingest-job-status', args=[404]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncProcessChargerSentLogsTests(TransactionTestCase):
+    # The micro-batches are written by a dedicated thread, with its own database connection
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            self.metervalues_lines = [line for line in f if line.strip()]
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+
+    async def _process(self, client, line):
+        return await client.post(
+            path=reverse('log_processor:async-process-charger-sent-logs'),
+            data=json.dumps(line),
+            content_type='application/json',
+        )
+
+    @override_settings(ASYNC_INGEST_FLUSH_INTERVAL=0.05)
+    async def test_concurrent_requests_are_written_in_micro_batches(self):
+        client = AsyncClient()
+        with mock.patch.object(ingest, 'save_parsed_lines', wraps=ingest.save_parsed_lines) as save_parsed_lines:
+            responses = await asyncio.gather(*[self._process(client, line) for line in self.metervalues_lines])
+        self.assertEqual([r.status_code for r in responses], [status.HTTP_201_CREATED] * len(self.metervalues_lines))
+        self.assertLess(save_parsed_lines.call_count, len(self.metervalues_lines))
+        self.assertEqual(await sync_to_async(models.SampledMeterValue.objects.count)(), len(self.metervalues_lines))
+        self.assertEqual(responses[0].json()['message'][0]['raw_data'], self.metervalues_lines[0].strip())
+        ids = sorted([r.json()['message'][0]['id'] for r in responses])
+        self.assertEqual(ids, await sync_to_async(lambda: list(models.SampledMeterValue.objects.order_by('id').values_list('id', flat=True)))())
+
+    async def test_responses_match_the_sync_endpoint(self):
+        client = AsyncClient()
+        response = await self._process(client, LOG_RECORD_WITH_UNSUPPORTED_KEYWORD)
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        self.assertJSONEqual(
+            response.content.decode('utf-8'),
+            api_failed_response_body(f'{errors.ErrorMessage.NOT_CONFIGURED.value}: Authorize')
+        )
+        response = await self._process(client, DATATRANSFER_LOG_RECORD_WITH_WRONG_FORMAT)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertJSONEqual(response.content.decode('utf-8'), api_failed_response_body({"data": ["Not a valid string."]}))
+        response = await self._process(client, CORRECT_DATATRANSFER_LOG_RECORD)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data_transfer = await sync_to_async(models.DataTransferRequest.objects.select_related('raw_line').get)()
+        self.assertEqual(response.json()['message'], [serializers.DataTransferRequestSerializer(data_transfer).data])
+        response = await self._process(client, CORRECT_DATATRANSFER_LOG_RECORD)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(await sync_to_async(models.DataTransferRequest.objects.count)(), 1)
+
+    @override_settings(ASYNC_INGEST_FLUSH_INTERVAL=0.05)
+    async def test_failed_write_answers_every_line_of_the_batch(self):
+        client = AsyncClient()
+        with mock.patch.object(ingest, 'save_parsed_lines', side_effect=RuntimeError('database is locked')):
+            responses = await asyncio.gather(*[self._process(client, line) for line in self.metervalues_lines[:3]])
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            self.assertJSONEqual(response.content.decode('utf-8'), api_failed_response_body(errors.ErrorMessage.INTERNAL_SERVER_ERROR.value))
+        self.assertEqual(await sync_to_async(models.SampledMeterValue.objects.count)(), 0)
+
+
+class InstrumentationTests(TestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        self.metrics_enabled = metrics.enabled
+        instrumentation.install()
+        metrics.REGISTRY.clear()
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            self.metervalues_lines = [line for line in f if line.strip()]
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+        if self.metrics_enabled:
+            instrumentation.install()
+        else:
+            instrumentation.uninstall()
+
+    def _process_charger_sent_logs(self, record_str):
+        return self.client.post(
+            path=reverse('log_processor:process-charger-sent-logs'),
+            data=json.dumps(record_str),
+            content_type='application/json',
+        )
+
+    def test_single_line_outcomes_and_stages(self):
+        self._process_charger_sent_logs(self.metervalues_lines[0])
+        self._process_charger_sent_logs(self.metervalues_lines[0])
+        self._process_charger_sent_logs(METERVALUES_LOG_RECORD_WITH_UNSUPPORTED_SAMPLEDVALUE)
+        self._process_charger_sent_logs(LOG_RECORD_WITH_UNSUPPORTED_KEYWORD)
+        self.assertEqual(instrumentation.INGESTED_LINES.value('metervalues', '201'), 1)
+        self.assertEqual(instrumentation.INGESTED_LINES.value('metervalues', '200'), 1)
+        self.assertEqual(instrumentation.INGESTED_LINES.value('metervalues', '400'), 1)
+        self.assertEqual(instrumentation.INGESTED_LINES.value('authorize', '406'), 1)
+        for step in ['match_pattern', 'add_charger_number_and_raw_data_to_content', 'flatten_meter_value', 'process_sampled_values']:
+            self.assertEqual(instrumentation.PARSER_STEP_SECONDS.count('metervalues', step), 2)
+        self.assertEqual(instrumentation.INGEST_STAGE_SECONDS.count('validate'), 2)
+        self.assertEqual(instrumentation.INGEST_STAGE_SECONDS.count('write'), 1)
+
+    def test_bulk_outcomes(self):
+        lines = self.metervalues_lines + [CORRECT_DATATRANSFER_LOG_RECORD, LOG_RECORD_WITH_UNSUPPORTED_KEYWORD, 'noise']
+        self.client.post(reverse('log_processor:bulk-process-charger-sent-logs'), data=json.dumps(lines), content_type='application/json')
+        self.assertEqual(instrumentation.INGESTED_LINES.value('metervalues', '201'), len(self.metervalues_lines))
+        self.assertEqual(instrumentation.INGESTED_LINES.value('datatransfer', '201'), 1)
+        self.assertEqual(instrumentation.INGESTED_LINES.value('authorize', '406'), 1)
+        self.assertEqual(instrumentation.INGESTED_LINES.value('unknown', '406'), 1)
+        self.assertEqual(instrumentation.INGEST_STAGE_SECONDS.count('write'), 1)
+
+    def test_metrics_endpoint(self):
+        self._process_charger_sent_logs(CORRECT_DATATRANSFER_LOG_RECORD)
+        response = self.client.get(reverse('log_processor:metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE ocpp_ingested_lines_total counter', body)
+        self.assertIn('ocpp_ingested_lines_total{request_type="datatransfer",status="201"} 1', body)
+        self.assertIn('ocpp_parser_step_seconds_count{request_type="datatransfer",step="match_pattern"} 1', body)
+
+    def test_disabled_metrics(self):
+        instrumentation.uninstall()
+        self._process_charger_sent_logs(CORRECT_DATATRANSFER_LOG_RECORD)
+        self.assertEqual(instrumentation.INGESTED_LINES.value('datatransfer', '201'), 0)
+        self.assertEqual(instrumentation.PARSER_STEP_SECONDS.count('datatransfer', 'match_pattern'), 0)
+        self.assertEqual(self.client.get(reverse('log_processor:metrics')).status_code, status.HTTP_404_NOT_FOUND)
+
+class SampledValueValidationTests(SimpleTestCase):
+    """The pydantic fast path must validate sampled values like `SampledValueSerializer`, falling back to it otherwise."""
+
+    VALID = {'timestamp': '2024-07-09T07:18:36Z', 'value': '64059', 'context': 'Sample.Periodic', 'measurand': 'Energy.Active.Import.Register', 'unit': 'Wh'}
+    EDGE_CASES = [
+        [],
+        [VALID, {**VALID, 'phase': 'L1', 'location': 'Outlet', 'format': 'Raw'}],
+        [{**VALID, 'timestamp': '2024-07-09T15:18:36.123+08:00'}],
+        [{**VALID, 'timestamp': '2024-07-09T07:18:36'}],
+        [{**VALID, 'timestamp': '2024-07-09 07:18:36Z'}],
+        [{**VALID, 'timestamp': '1720509516'}],
+        [{**VALID, 'timestamp': 'yesterday'}],
+        [{**VALID, 'value': 64059}],
+        [{**VALID, 'value': ' 64059 '}],
+        [{**VALID, 'value': ''}],
+        [{**VALID, 'value': None}],
+        [{**VALID, 'unknown': 1}],
+        [{**VALID, 'context': 'Sample.Periodics'}],
+        [{**VALID, 'context': ''}],
+        [{**VALID, 'phase': None}],
+        [{**VALID, 'unit': 5}],
+        [{'value': '1'}],
+        ['not a dict'],
+        'not a list',
+    ]
+
+    def _validate(self, data, list_serializer_class):
+        serializer = list_serializer_class(child=serializers.SampledValueSerializer(), data=data)
+        if serializer.is_valid():
+            return [item.model_dump(exclude_unset=True) if isinstance(item, models.SampledValue) else dict(item) for item in serializer.validated_data], None
+        return None, serializer.errors
+
+    def assertSameValidation(self, data):
+        with self.subTest(data=data):
+            self.assertEqual(
+                self._validate(data, serializers.SampledValueListSerializer),
+                self._validate(data, drf_serializers.ListSerializer),
+            )
+
+    def test_edge_cases(self):
+        for data in self.EDGE_CASES:
+            self.assertSameValidation(data)
+
+    def test_metervalues_log_records_use_the_fast_path(self):
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                for model_data in parser.parse_input(line).parsed_models:
+                    for phase in ['L1', 'L2', 'L3']:
+                        self.assertIsNotNone(serializers._validate_sampled_values(model_data[phase]))
+                        self.assertSameValidation(model_data[phase])
+
+    def test_timestamps_are_converted_to_the_current_timezone(self):
+        sampled_values = serializers._validate_sampled_values([self.VALID])
+        self.assertEqual(sampled_values[0].timestamp.utcoffset(), timezone.localtime().utcoffset())
+
+
+class ParserPipelineTests(SimpleTestCase):
+
+    def test_step_hooks_receive_step_timings(self):
+        timings = []
+        hook = parser.register_step_hook(lambda request_type, step, elapsed: timings.append((request_type, step, elapsed)))
+        try:
+            with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+                output = parser.parse_input(f.readline())
+        finally:
+            parser.unregister_step_hook(hook)
+        self.assertEqual([(request_type, step) for request_type, step, _ in timings], [
+            ('metervalues', 'match_pattern'),
+            ('metervalues', 'add_charger_number_and_raw_data_to_content'),
+            ('metervalues', 'flatten_meter_value'),
+            ('metervalues', 'process_sampled_values'),
+        ])
+        self.assertTrue(all(elapsed >= 0 for _, _, elapsed in timings))
+        self.assertEqual(output.parsed_models[0]['charger_number'], '1000129')
+
+
+def reference_process_sampled_values(prev_content: dict) -> dict:
+    """The former quadratic implementation of `parser.process_sampled_values`, kept as the reference of its behavior."""
+    def _same_type_sample_values(to_compare, values, ignores=["value", "phase", "timestamp"]):
+        return [v for v in values if comparator.shallow_compare_two_dicts(v, to_compare, ignores)]
+
+    all_sampled_values = prev_content["all_sampled_values"]
+    valid_units = {'V', 'Wh', 'W', 'A'}
+    l_phases = {"L1", "L2", "L3"}
+    all_phases = l_phases.union({None, "L1-N", "L2-N", "L3-N", "L1-L2", "L2-L3", "L3-L1"})
+    merged_result = {
+        "charger_number": prev_content['charger_number'],
+        "connector_id": prev_content["connectorId"],
+        "transaction_id": prev_content["transactionId"],
+        "raw_data": prev_content['raw_data'],
+    }
+    for phase in l_phases:
+        merged_result[phase] = {unit: [] for unit in valid_units}
+    phases_dict = {unit: set() for unit in valid_units}
+    for sampled_value in all_sampled_values:
+        unit = sampled_value.get("unit")
+        if unit in valid_units:
+            phase = sampled_value.get("phase")
+            if phase in all_phases:
+                phases_dict[unit].add(phase)
+    phase_unit_sampled_values = {phase: {unit: [] for unit in valid_units} for phase in l_phases}
+    for sampled_value in all_sampled_values:
+        value = float(sampled_value["value"])
+        phase = sampled_value.get("phase")
+        unit = sampled_value.get("unit")
+        if unit in valid_units and phase in phases_dict[unit] and value > 0:
+            phase_unit_sampled_values[phase[:2] if phase else "L1"][unit].append(sampled_value)
+    for _, d in phase_unit_sampled_values.items():
+        for u, list_sample in d.items():
+            list_sample.sort(key=lambda x: len(x["phase"]) if x.get("phase") else 0)
+    for unit, d in phase_unit_sampled_values["L1"].items():
+        for stored_sampled_value in d:
+            if not stored_sampled_value.get("phase"):
+                merged_result["L1"][unit].append(stored_sampled_value)
+            elif len(_same_type_sample_values(stored_sampled_value, merged_result["L1"][unit])) == 0:
+                phase_mapping = {
+                    "L1": ("L2", "L3"),
+                    "L1-N": ("L2-N", "L3-N"),
+                    "L1-L2": ("L2-L3", "L3-L1"),
+                }
+                l2_phase, l3_phase = phase_mapping.get(stored_sampled_value.get("phase"))
+                l2_same_type_sample_values = _same_type_sample_values({**stored_sampled_value, "phase": l2_phase}, phase_unit_sampled_values["L2"][unit], ["value", "timestamp"])
+                l3_same_type_sample_values = _same_type_sample_values({**stored_sampled_value, "phase": l3_phase}, phase_unit_sampled_values["L3"][unit], ["value", "timestamp"])
+                if len(l2_same_type_sample_values) > 0 and len(l3_same_type_sample_values) > 0:
+                    merged_result["L1"][unit].append(stored_sampled_value)
+                    merged_result["L2"][unit].extend(l2_same_type_sample_values)
+                    merged_result["L3"][unit].extend(l3_same_type_sample_values)
+                elif len(l2_same_type_sample_values) == 0 and len(l3_same_type_sample_values) == 0:
+                    merged_result["L1"][unit].append(stored_sampled_value)
+                else:
+                    raise ValidationError(f"Invalid data format: {stored_sampled_value} should either be a single-phase or triphase")
+    supplements = {unit: [] for unit in valid_units}
+    for phase in ["L2", "L3"]:
+        for unit, d in phase_unit_sampled_values[phase].items():
+            for stored_sampled_value in d:
+                if not _same_type_sample_values(stored_sampled_value, merged_result["L1"][unit]):
+                    is_having_same_type = _same_type_sample_values(stored_sampled_value, supplements[unit])
+                    supplements[unit].append(stored_sampled_value)
+                    if is_having_same_type:
+                        raise ValidationError(f"Invalid phase configuration! Should either be single-phase or triphase, now {supplements[unit]}")
+    for u, s in supplements.items():
+        merged_result["L1"][u].extend(s)
+    for phase in l_phases:
+        merged_result[phase] = [i for lst in merged_result[phase].values() for i in lst]
+    return merged_result
+
+def random_sampled_value(rnd: random.Random) -> dict:
+    sampled_value = {
+        'timestamp': '2024-07-09T07:16:25Z',
+        'value': rnd.choice(['0', '-1', '12.5', '230', '7']),
+    }
+    optional_fields = {
+        'phase': [None, '', 'L1', 'L2', 'L3', 'N', 'L1-N', 'L2-N', 'L3-N', 'L1-L2', 'L2-L3', 'L3-L1'],
+        'unit': ['V', 'Wh', 'W', 'A', 'kWh', 'Percent'],
+        'measurand': ['Voltage', 'Current.Import', 'Power.Active.Import', 'Energy.Active.Import.Register'],
+        'context': ['Sample.Periodic', 'Transaction.Begin'],
+        'location': ['Outlet', 'Inlet'],
+    }
+    for field, choices in optional_fields.items():
+        if rnd.random() < 0.7:
+            sampled_value[field] = rnd.choice(choices)
+    return sampled_value
+
+def random_triphase_sampled_values(rnd: random.Random) -> list:
+    """Sampled values of a single type measured on all three phases, which are the interesting cases for the phase selection."""
+    phases = rnd.choice([("L1", "L2", "L3"), ("L1-N", "L2-N", "L3-N"), ("L1-L2", "L2-L3", "L3-L1")])
+    template = {k: v for k, v in random_sampled_value(rnd).items() if k != 'phase'}
+    return [{**template, 'value': str(rnd.randint(1, 400)), 'phase': phase} for phase in phases if rnd.random() < 0.9]
+
+class ProcessSampledValuesTests(SimpleTestCase):
+    """`parser.process_sampled_values` must select exactly the same phases as the reference implementation."""
+
+    def _metervalues_contents(self):
+        contents = []
+        with open(file=os.path.join(root_dir, 'statics/logs/test/meterValues.log'), mode = 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                pp, match = next((pp, pp.pattern.search(line)) for pp in parser.PARSER_PATTERNS if pp.pattern.search(line))
+                context = pp.build_parser_input(line, match)
+                parser.add_charger_number_and_raw_data_to_content(context)
+                parser.flatten_meter_value(context)
+                contents.append(context.content[0])
+        return contents
+
+    def _random_contents(self, count, seed):
+        rnd = random.Random(seed)
+        for _ in range(count):
+            all_sampled_values = []
+            for _ in range(rnd.randint(0, 12)):
+                all_sampled_values.extend(random_triphase_sampled_values(rnd) if rnd.random() < 0.4 else [random_sampled_value(rnd)])
+            rnd.shuffle(all_sampled_values)
+            yield {
+                'charger_number': 'TH007',
+                'connectorId': 1,
+                'transactionId': 78450704,
+                'raw_data': '',
+                'all_sampled_values': all_sampled_values,
+            }
+
+    def assertSameAsReference(self, content):
+        try:
+            expected = reference_process_sampled_values(copy.deepcopy(content))
+        except ValidationError as e:
+            with self.assertRaisesMessage(ValidationError, e.messages[0]):
+                parser.process_sampled_values(parser.ParserContext('metervalues', [copy.deepcopy(content)]))
+        else:
+            context = parser.ParserContext('metervalues', [copy.deepcopy(content)])
+            parser.process_sampled_values(context)
+            self.assertEqual(context.content, [expected])
+
+    def test_metervalues_log_records(self):
+        for content in self._metervalues_contents():
+            with self.subTest(raw_data=content['raw_data']):
+                self.assertSameAsReference(content)
+
+    def test_random_sampled_values(self):
+        for content in self._random_contents(count=500, seed=20240709):
+            with self.subTest(all_sampled_values=content['all_sampled_values']):
+                self.assertSameAsReference(content)
@@ -1,6 +1,24 @@
 from django.urls import path
-from .views import ProcessChargerSentLogsAPIView
+from .views import (
+    BulkProcessChargerSentLogsAPIView,
+    DataTransferRequestListAPIView,
+    IngestJobStatusAPIView,
+    ProcessChargerSentLogsAPIView,
+    QueueChargerSentLogsAPIView,
+    SampledMeterValueListAPIView,
+    UploadChargerSentLogsAPIView,
+    async_process_charger_sent_logs,
+    prometheus_metrics,
+)
 
 urlpatterns = [
     path('api/process-charger-sent-logs', ProcessChargerSentLogsAPIView.as_view(), name='process-charger-sent-logs'),
+    path('api/async/process-charger-sent-logs', async_process_charger_sent_logs, name='async-process-charger-sent-logs'),
+    path('api/process-charger-sent-logs/bulk', BulkProcessChargerSentLogsAPIView.as_view(), name='bulk-process-charger-sent-logs'),
+    path('api/upload-charger-sent-logs', UploadChargerSentLogsAPIView.as_view(), name='upload-charger-sent-logs'),
+    path('api/ingest-jobs', QueueChargerSentLogsAPIView.as_view(), name='queue-charger-sent-logs'),
+    path('api/ingest-jobs/<int:job_id>', IngestJobStatusAPIView.as_view(), name='ingest-job-status'),
+    path('api/sampled-meter-values', SampledMeterValueListAPIView.as_view(), name='sampled-meter-values'),
+    path('api/datatransfer-requests', DataTransferRequestListAPIView.as_view(), name='datatransfer-requests'),
+    path('metrics', prometheus_metrics, name='metrics'),
 ]
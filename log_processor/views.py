@@ -1,12 +1,19 @@
-import json
-from django.core.exceptions import ValidationError
+import io
+import time
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+from rest_framework.generics import ListAPIView
+from rest_framework.pagination import CursorPagination
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
-from log_processor import errors
-from log_processor.parser import ParserOutput, parse_input
-from utilities import loggers
+from log_processor import async_ingest, ingest, ingest_queue, instrumentation, serializers
+from log_processor.models import DataTransferRequest, IngestBatch, SampledMeterValue
+from log_processor.request_parsers import NDJSONParser
+from utilities import compression, jsoncodec, metrics
 
 def api_success_response_body(msg):
     return {
@@ -21,32 +28,184 @@ def api_failed_response_body(err_msg):
             'error': err_msg
         }
     }
+
+def is_list_of_log_lines(data):
+    return isinstance(data, list) and all(isinstance(line, str) for line in data)
+
 class ProcessChargerSentLogsAPIView(APIView):
 
     def post(self, request, *args, **kwargs):
+        response = self._process(request.data)
+        if metrics.enabled:
+            instrumentation.record_line(request.data, response.status_code)
+        return response
+
+    def _process(self, data):
         try:
+            if ingest.is_ingested(data):
+                return Response(api_success_response_body(ingest.ALREADY_INGESTED), status=status.HTTP_200_OK)
             all_serialized_data = []
-            # Parse input
-            output: ParserOutput = parse_input(request.data)
-            # Validate and save to DB
-            for model_data in output.parsed_models:
-                serializer = output.serializer_clz(data=model_data)
-                if serializer.is_valid():
-                    serializer.save()
-                    all_serialized_data.append(serializer.data)
-                else:
-                    loggers.error_file_logger.error(serializer.errors, exc_info=True)
-                    return Response(api_failed_response_body(serializer.errors), status=status.HTTP_400_BAD_REQUEST)
+            # Parse input and validate
+            validated_serializers = ingest.validate_line(data)
+            # Save to DB
+            start = time.perf_counter() if metrics.enabled else None
+            for serializer in validated_serializers:
+                serializer.save()
+                all_serialized_data.append(serializer.data)
+            instrumentation.observe_stage('write', start)
             return Response(api_success_response_body(all_serialized_data), status=status.HTTP_201_CREATED)
-        except errors.CurrentlyUnSupported as e:
-            loggers.error_file_logger.error(e.message, exc_info=True)
-            return Response(api_failed_response_body(e.message), status=status.HTTP_406_NOT_ACCEPTABLE)
-        except ValidationError as e:
-            try:
-                msg = [json.loads(x) for x in e.messages]
-            except (json.JSONDecodeError, TypeError):
-                msg = e.messages
-            return Response(api_failed_response_body(msg), status=status.HTTP_400_BAD_REQUEST)
-        except:
-            loggers.error_file_logger.error(errors.ErrorMessage.UNHANDLED_EXCEPTION.value, exc_info=True)
-            return Response(api_failed_response_body(errors.ErrorMessage.INTERNAL_SERVER_ERROR.value), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        except Exception as e:
+            http_status, msg = ingest.failure_for(e)
+            return Response(api_failed_response_body(msg), status=http_status)
+
+async def async_process_charger_sent_logs(request):
+    """
+    Async counterpart of `ProcessChargerSentLogsAPIView`, for ASGI servers.
+
+    DRF views are synchronous, so this is a plain Django view. The line is parsed in a bounded thread
+    pool and written together with the lines of concurrent requests, in one transaction per micro-batch.
+    """
+    if request.method != 'POST':
+        return JsonResponse(api_failed_response_body(f'Method "{request.method}" not allowed.'), status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    try:
+        line = jsoncodec.loads(request.body)
+    except ValueError:
+        return JsonResponse(api_failed_response_body('Invalid JSON body'), status=status.HTTP_400_BAD_REQUEST)
+    result = await async_ingest.ingest_line(line)
+    if 'error' in result:
+        return JsonResponse(api_failed_response_body(result['error']), status=result['status'])
+    return JsonResponse(api_success_response_body(result['data']), status=result['status'])
+
+# csrf_exempt does not support async views in Django 3.2
+async_process_charger_sent_logs.csrf_exempt = True
+
+@require_GET
+def prometheus_metrics(request):
+    """Metrics of the ingestion path in the Prometheus text format, see `log_processor/instrumentation.py`."""
+    if not metrics.enabled:
+        return JsonResponse(api_failed_response_body('Metrics are disabled'), status=status.HTTP_404_NOT_FOUND)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class BulkProcessChargerSentLogsAPIView(APIView):
+    """Ingest many log lines, posted as a JSON array or as NDJSON, and report a status per line."""
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request, *args, **kwargs):
+        lines = request.data
+        if not is_list_of_log_lines(lines):
+            return Response(api_failed_response_body('Expected a list of log lines'), status=status.HTTP_400_BAD_REQUEST)
+        body = ingest.summarize(list(ingest.ingest_lines(lines)))
+        if body['failed']:
+            return Response(api_failed_response_body(body), status=status.HTTP_207_MULTI_STATUS)
+        return Response(api_success_response_body(body), status=status.HTTP_201_CREATED)
+
+class UploadChargerSentLogsAPIView(APIView):
+    """
+    Stream a raw OCPP log file into the database.
+
+    The log is either uploaded as the `file` field of a multipart form, or sent as the raw request
+    body, in which case it is read line by line from the request stream without being buffered.
+    Logs compressed with gzip, bzip2, xz or zstd are decompressed on the fly.
+    """
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type.startswith('multipart/form-data'):
+            log_file = request.FILES.get('file')
+            if log_file is None:
+                return Response(api_failed_response_body('Missing file field'), status=status.HTTP_400_BAD_REQUEST)
+            raw_lines = log_file
+        else:
+            raw_lines = request.stream or io.BytesIO()
+        try:
+            with compression.open_log(raw_lines) as log_file:
+                summary = ingest.ingest_stream(ingest.decode_lines(log_file))
+        except (compression.UnsupportedCompression, compression.CorruptedLog) as e:
+            # The lines decompressed before a corrupted block are ingested
+            return Response(api_failed_response_body(str(e)), status=status.HTTP_400_BAD_REQUEST)
+        if summary['errors']:
+            return Response(api_failed_response_body(summary), status=status.HTTP_207_MULTI_STATUS)
+        return Response(api_success_response_body(summary), status=status.HTTP_201_CREATED)
+
+class QueueChargerSentLogsAPIView(APIView):
+    """
+    Queue log lines, posted like to the bulk endpoint, and acknowledge them without waiting for their ingestion.
+
+    The lines are ingested by the `drain_ingest_queue` management command; the returned job id is
+    polled on the status endpoint.
+    """
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request, *args, **kwargs):
+        lines = request.data
+        if isinstance(lines, str):
+            lines = [lines]
+        if not is_list_of_log_lines(lines):
+            return Response(api_failed_response_body('Expected a log line or a list of log lines'), status=status.HTTP_400_BAD_REQUEST)
+        batch = ingest_queue.enqueue(lines)
+        return Response(api_success_response_body({
+            'job_id': batch.id,
+            'status': batch.status,
+            'status_url': reverse('log_processor:ingest-job-status', args=[batch.id]),
+        }), status=status.HTTP_202_ACCEPTED)
+
+class IngestJobStatusAPIView(APIView):
+    """Status of a queued batch of log lines and, once it is done, the same per-line report as the bulk endpoint."""
+
+    def get(self, request, job_id, *args, **kwargs):
+        batch = IngestBatch.objects.filter(id=job_id).defer('lines').first()
+        if batch is None:
+            return Response(api_failed_response_body('Job not found'), status=status.HTTP_404_NOT_FOUND)
+        return Response(api_success_response_body({
+            'job_id': batch.id,
+            'status': batch.status,
+            'created_at': batch.created_at,
+            'updated_at': batch.updated_at,
+            'result': batch.result,
+            'error': batch.error,
+        }), status=status.HTTP_200_OK)
+
+class KeysetPagination(CursorPagination):
+    """Pages are newest first `id < cursor` range scans (`id > cursor` going back), so every page costs the same however deep it is."""
+    ordering = '-id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+class ChargerSentRequestListAPIView(ListAPIView):
+    """
+    List stored requests, newest first, filtered by the query parameters of `filter_serializer_class`.
+
+    The raw log lines are only joined and decompressed when `include_raw=true` is passed.
+    """
+    pagination_class = KeysetPagination
+    filter_serializer_class = serializers.ChargerSentRequestFilterSerializer
+
+    def get_filters(self):
+        if not hasattr(self, '_filters'):
+            filters = self.filter_serializer_class(data=self.request.query_params)
+            filters.is_valid(raise_exception=True)
+            self._filters = filters
+        return self._filters
+
+    def get_queryset(self):
+        filters = self.get_filters()
+        queryset = self.queryset.filter(**filters.lookups())
+        if filters.validated_data['include_raw']:
+            queryset = queryset.select_related('raw_line')
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['include_raw'] = self.get_filters().validated_data['include_raw']
+        return context
+
+class SampledMeterValueListAPIView(ChargerSentRequestListAPIView):
+    queryset = SampledMeterValue.objects.all()
+    serializer_class = serializers.SampledMeterValueReadSerializer
+    filter_serializer_class = serializers.SampledMeterValueFilterSerializer
+
+class DataTransferRequestListAPIView(ChargerSentRequestListAPIView):
+    queryset = DataTransferRequest.objects.all()
+    serializer_class = serializers.DataTransferRequestReadSerializer
+    filter_serializer_class = serializers.DataTransferRequestFilterSerializer
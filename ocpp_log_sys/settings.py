@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -145,4 +146,13 @@ CORS_ALLOW_METHODS = [
 
 CORS_ALLOW_HEADERS = [
     'content-type',
-]
\ No newline at end of file
+]
+# Number of log lines written to the database in a single transaction by the bulk ingestion paths
+INGEST_CHUNK_SIZE = 500
+# Async ingestion endpoint: size of the pool parsing log lines, and maximum size / delay of the micro-batches written in one transaction
+ASYNC_INGEST_PARSE_WORKERS = 4
+ASYNC_INGEST_BATCH_SIZE = 200
+ASYNC_INGEST_FLUSH_INTERVAL = 0.01 # seconds
+# Per stage timings and outcome counters of the ingestion path, served by the unauthenticated /metrics endpoint.
+# Off unless the METRICS_ENABLED environment variable is set to 1, true or yes
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
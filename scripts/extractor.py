@@ -1,10 +1,21 @@
-import json
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import hashlib
+import mmap
 import re
+import shutil
+import sys
+import tempfile
 import threading
+import time
 import os
 
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Tuple
 from scripts import patterns
-from utilities import loggers
+from utilities import comparator, compression, jsoncodec, loggers
 
 # Get the current script directory path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -17,26 +28,17 @@ lock = threading.Lock()
 EXTRACTED_FILES_DIR_PATH = os.path.join(root_dir, 'statics/logs/extracted')
 RAW_LOG_FILES_DIR_PATH = os.path.join(root_dir, 'statics/logs/raw')
 CHARGER_SENT_MESSAGE_IDENTIFIER = 'receive message'
+# Number of leading bytes of a followed log hashed to recognise it after its inode was reused
+FOLLOW_FINGERPRINT_SIZE = 1024
 
 def extract_keywords_from_log(log_file_path):
     try:
-        with open(log_file_path, 'r') as log_file:
+        with compression.open_text_log(log_file_path) as log_file:
             keywords_in_log = set()
             for line in log_file:
-                for identifier in patterns.ChargerSentMessageIdentifier:
-                    if identifier in line:
-                        # walk through all known keyword patterns
-                        for keyword_pattern in patterns.KEYWORD_PATTERNS[identifier]:
-                            match = keyword_pattern.search(line)
-                            if match:
-                                keyword = match.group(1)
-                                if keyword and keyword.isalpha():  # Check if the keyword is a word (contains only letters)
-                                    keywords_in_log.add(keyword)  # Will be used to match raw data, so we don't need to format it
-
-                                # stop propagating once found a match
-                                break
-                        # No need to go through more identifiers as an identifier should be exclusive
-                        break
+                classified = _classify_line(line)
+                if classified is not None:
+                    keywords_in_log.add(classified.keyword)  # Will be used to match raw data, so we don't need to format it
         
     except FileNotFoundError:
         print(f"Error: File {log_file_path} not found.")
@@ -56,65 +58,94 @@ def _extract_ocpp_charger_num(line):
     except:
         return f'Ocpp charger number: Not found'
 
-def extract_content_with_keyword_from_file(keyword: str, raw_log_filepath, output_path, multithread_result=None):
-    is_success = True
-    extracted_lines, total_lines = 0, 0
-    # The former set simply stores content so that they can compare between each other,
-    # while the latter set will store content with charger number concatenated
-    unique_structure_content_examples, unique_example_with_charger_num = set(), set()
-    comparable_content_patterns = patterns.COMPARABLE_KEYWORD_CONTENT_MAP[keyword.lower()]
+def _classify_line(line):
+    """Return the (identifier, keyword, content start) of a charger sent message line, or None for any other line."""
+    return patterns.classify_charger_sent_message(line)
+
+class KeywordExtraction:
+    """Accumulates the extracted lines, line counts and unique structure examples of a keyword."""
+
+    def __init__(self, keyword: str, raw_log_filepath, output_file):
+        self.keyword = keyword
+        self.raw_log_filepath = raw_log_filepath
+        self.output_file = output_file
+        self.is_success = True
+        self.extracted_lines = 0
+        # (identifier, content, content with charger number concatenated) of the examples having unique structures,
+        # in the order they were first seen
+        self.unique_examples = []
+        # Structure signatures of the unique examples, so that checking uniqueness is a single lookup
+        self.unique_signatures = set()
+        self.comparable_content_patterns = patterns.COMPARABLE_KEYWORD_CONTENT_MAP.get(keyword.lower(), [])
+
+    def _comparable_content_pattern(self, identifier):
+        for comparable_content_pattern in self.comparable_content_patterns:
+            if comparable_content_pattern.identifier == identifier:
+                return comparable_content_pattern
+        return None
+
+    def add_unique_example(self, identifier, content, example_with_charger_num):
+        signature = self._comparable_content_pattern(identifier).signature(content)
+        if signature is not None:
+            if signature in self.unique_signatures:
+                return False
+            self.unique_signatures.add(signature)
+        self.unique_examples.append((identifier, content, example_with_charger_num))
+        return True
+
+    def add(self, line, identifier, content_start=None):
+        try:
+            self.output_file.write(line)
+            self.extracted_lines += 1
+            # extract content examples having unique data structures
+            comparable_content_pattern = self._comparable_content_pattern(identifier)
+            if comparable_content_pattern is not None:
+                content = comparable_content_pattern.content(line, content_start)
+                if content:
+                    self.add_unique_example(identifier, content, f'{content}, {_extract_ocpp_charger_num(line)}')
+        except:
+            self.is_success = False
+            r = {
+                'keyword': self.keyword,
+                'line': line,
+            }
+            loggers.error_file_logger.error(jsoncodec.dumps(r), exc_info=True)
+
+    def summary(self, total_lines):
+        summary = {
+            'success': self.is_success,
+            'keyword': self.keyword,
+            'unique_example_with_charger_num': [example for _, _, example in self.unique_examples],
+            'extracted_lines': self.extracted_lines,
+            'total_lines': total_lines,
+            'input_filepath': self.raw_log_filepath,
+            'output_filepath': self.output_file.name,
+        }
+        loggers.debug_file_logger.debug(jsoncodec.dumps(summary))
+        return summary
+
+def _log_parse_cache_info():
+    loggers.debug_file_logger.debug(f'Parse cache info: {comparator.parse_cache_info()}')
+
+def _open_output_file(output_path, mode='w'):
     output_dir = os.path.dirname(output_path)
-    # Create directories if non-exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    with open(raw_log_filepath, 'r') as file, open(output_path, 'w') as output_file:
+    # Create directories if non-exist (concurrently with the other workers of a batch)
+    os.makedirs(output_dir, exist_ok=True)
+    return open(output_path, mode, encoding=compression.TEXT_ENCODING)
+
+def _output_path(extracted_files_dir, keyword, raw_log_filename):
+    return os.path.join(extracted_files_dir, keyword.lower(), f'from_{raw_log_filename}')
+
+def extract_content_with_keyword_from_file(keyword: str, raw_log_filepath, output_path, multithread_result=None):
+    total_lines = 0
+    with compression.open_text_log(raw_log_filepath) as file, _open_output_file(output_path) as output_file:
+        extraction = KeywordExtraction(keyword, raw_log_filepath, output_file)
         for line in file:
             total_lines += 1
-            try:
-                for identifier in patterns.ChargerSentMessageIdentifier:
-                    if identifier in line and keyword in line:
-                        output_file.write(line)
-                        extracted_lines += 1
-                        # extract content examples having unique data structures
-                        for comparable_content_pattern in comparable_content_patterns:
-                            if comparable_content_pattern.identifier != identifier:
-                                continue
-                            match = comparable_content_pattern.pattern.search(line)
-                            if match:
-                                content = match.group(1)
-                                if content:
-                                    if not unique_structure_content_examples:
-                                        unique_structure_content_examples.add(content)
-                                        unique_example_with_charger_num.add(f'{content}, {_extract_ocpp_charger_num(line)}')
-                                    else:
-                                        is_unique = True
-                                        for item in unique_structure_content_examples:
-                                            is_unique = not comparable_content_pattern.is_identical(content, item) and is_unique
-                                        if is_unique:
-                                            unique_structure_content_examples.add(content)
-                                            unique_example_with_charger_num.add(f'{content}, {_extract_ocpp_charger_num(line)}')
-                                # Stop the iteration once a match is found no matter if it's unique
-                                break
-                        # No need to go through more identifiers as an identifier should be exclusive
-                        break
-            except:
-                is_success = False
-                r = {
-                    'keyword': keyword,
-                    'line': line,
-                }
-                loggers.error_file_logger.error(json.dumps(r, indent=4), exc_info=True)
-
-    summary = {
-        'success': is_success,
-        'keyword': keyword,
-        'unique_example_with_charger_num': list(unique_example_with_charger_num),
-        'extracted_lines': extracted_lines,
-        'total_lines': total_lines,
-        'input_filepath': raw_log_filepath,
-        'output_filepath': output_path,
-    }
-    loggers.debug_file_logger.debug(json.dumps(summary, indent=4))
+            classified = _classify_line(line)
+            if classified is not None and classified.keyword == keyword:
+                extraction.add(line, classified.identifier, content_start=classified.content_start)
+    summary = extraction.summary(total_lines)
     # Store results when use multithreads
     if isinstance(multithread_result, list):
         with lock:
@@ -123,8 +154,556 @@ def extract_content_with_keyword_from_file(keyword: str, raw_log_filepath, outpu
             })
     return summary
 
+def extract_contents_from_file(raw_log_filepath, raw_log_filename, extracted_files_dir=EXTRACTED_FILES_DIR_PATH):
+    """
+    Extract all the keywords of a raw log file in a single streaming pass.
+
+    Every line is read once and classified by the keyword captured with `patterns.KEYWORD_PATTERNS`,
+    then handed to the extraction (output writer and stats accumulator) of that keyword.
+    Compressed logs are decompressed on the fly, see `utilities/compression.py`.
+    Returns a list of `{keyword: summary}` sorted by keyword.
+    """
+    extractions, total_lines = _extract_contents(raw_log_filepath, raw_log_filename, extracted_files_dir)
+    return [{keyword: extractions[keyword].summary(total_lines)} for keyword in sorted(extractions)]
+
+def _extract_contents(raw_log_filepath, raw_log_filename, extracted_files_dir):
+    """The extractions by keyword and the number of lines of a single pass over a raw log, see `extract_contents_from_file`."""
+    extractions = {}
+    total_lines = 0
+    try:
+        with compression.open_text_log(raw_log_filepath) as file:
+            for line in file:
+                total_lines += 1
+                classified = _classify_line(line)
+                if classified is None:
+                    continue
+                identifier, keyword, content_start = classified
+                extraction = extractions.get(keyword)
+                if extraction is None:
+                    output_file = _open_output_file(_output_path(extracted_files_dir, keyword, raw_log_filename))
+                    extraction = extractions[keyword] = KeywordExtraction(keyword, raw_log_filepath, output_file)
+                extraction.add(line, identifier, content_start=content_start)
+    finally:
+        for extraction in extractions.values():
+            extraction.output_file.close()
+    _log_parse_cache_info()
+    return extractions, total_lines
+
+def _map_file(file):
+    # Empty files cannot be mapped
+    if os.fstat(file.fileno()).st_size == 0:
+        return contextlib.nullcontext(b'')
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _count_lines(buf, chunk_size=1 << 24):
+    """The number of lines `compression.decode_text_lines` would split `buf` into."""
+    # mmap has no count(), count the line breaks of bounded copies of the buffer
+    line_breaks = 0
+    for i in range(0, len(buf), chunk_size):
+        chunk = buf[i:i + chunk_size]
+        line_breaks += chunk.count(b'\n') + chunk.count(b'\r') - chunk.count(b'\r\n')
+        # A CRLF split between two chunks is a single line break
+        if i and chunk[:1] == b'\n' and buf[i - 1:i] == b'\r':
+            line_breaks -= 1
+    return line_breaks + (1 if buf[-1:] not in (b'', b'\n', b'\r') else 0)
+
+def _iter_candidate_lines(buf):
+    """
+    Yield the lines of `buf` containing a charger sent message identifier, skipping the others without copying them.
+
+    The lines are decoded and split by `compression.decode_text_lines`, so the lines sharing a line feed
+    with a candidate through lone carriage returns are yielded too.
+    """
+    search = patterns.CHARGER_SENT_MESSAGE_IDENTIFIERS_BYTES_REGEX.search
+    size = len(buf)
+    match = search(buf)
+    while match:
+        start = buf.rfind(b'\n', 0, match.start()) + 1
+        end = buf.find(b'\n', match.end())
+        end = size if end == -1 else end + 1
+        yield from compression.decode_text_lines(buf[start:end])
+        match = search(buf, end)
+
+def mmap_extract_keywords_from_log(log_file_path):
+    """Same as `extract_keywords_from_log`, only decoding the lines containing an identifier of a memory-mapped log."""
+    keywords_in_log = set()
+    with open(log_file_path, 'rb') as file, _map_file(file) as buf:
+        for line in _iter_candidate_lines(buf):
+            classified = _classify_line(line)
+            if classified is not None:
+                keywords_in_log.add(classified[1])
+    loggers.debug_file_logger.debug(f"Found keywords \'{keywords_in_log}\' in {log_file_path}")
+    return keywords_in_log
+
+def mmap_extract_contents_from_file(raw_log_filepath, raw_log_filename, extracted_files_dir=EXTRACTED_FILES_DIR_PATH):
+    """
+    Same as `extract_contents_from_file`, scanning the bytes of the memory-mapped log instead of reading its lines.
+
+    The identifiers are searched for in the whole buffer, so only the lines containing one are copied
+    and decoded (like `compression.open_text_log`) to be classified.
+    Worth it on logs where the charger sent messages are a small fraction of the lines.
+    Compressed logs cannot be mapped, they are extracted by `extract_contents_from_file`.
+    """
+    if compression.detect_file_compression(raw_log_filepath) is not None:
+        return extract_contents_from_file(raw_log_filepath, raw_log_filename, extracted_files_dir)
+    extractions = {}
+    try:
+        with open(raw_log_filepath, 'rb') as file, _map_file(file) as buf:
+            total_lines = _count_lines(buf)
+            for line in _iter_candidate_lines(buf):
+                classified = _classify_line(line)
+                if classified is None:
+                    continue
+                identifier, keyword, content_start = classified
+                extraction = extractions.get(keyword)
+                if extraction is None:
+                    output_file = _open_output_file(_output_path(extracted_files_dir, keyword, raw_log_filename))
+                    extraction = extractions[keyword] = KeywordExtraction(keyword, raw_log_filepath, output_file)
+                extraction.add(line, identifier, content_start=content_start)
+    finally:
+        for extraction in extractions.values():
+            extraction.output_file.close()
+    _log_parse_cache_info()
+    return [{keyword: extractions[keyword].summary(total_lines)} for keyword in sorted(extractions)]
+
+def _split_into_byte_ranges(filepath, count):
+    """Split a file into at most `count` contiguous (start, end) byte ranges, each starting at the beginning of a line."""
+    size = os.path.getsize(filepath)
+    boundaries = [0]
+    with open(filepath, 'rb') as file:
+        for i in range(1, count):
+            file.seek(size * i // count)
+            # Move to the beginning of the next line
+            file.readline()
+            position = file.tell()
+            if boundaries[-1] < position < size:
+                boundaries.append(position)
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+def _iter_lines_in_byte_range(filepath, start, end):
+    with open(filepath, 'rb') as file:
+        file.seek(start)
+        position = start
+        while position < end:
+            raw_line = file.readline()
+            if not raw_line:
+                break
+            position += len(raw_line)
+            yield from compression.decode_text_lines(raw_line)
+
+def _extract_byte_range(raw_log_filepath, start, end, parts_dir):
+    """
+    Extract all the keywords of a byte range of a raw log (run in a worker process).
+
+    The extracted lines of every keyword are written to a part file under `parts_dir`, and the
+    per-keyword results are returned so that they can be merged in the order of the ranges.
+    """
+    extractions = {}
+    total_lines = 0
+    try:
+        for line in _iter_lines_in_byte_range(raw_log_filepath, start, end):
+            total_lines += 1
+            classified = _classify_line(line)
+            if classified is None:
+                continue
+            identifier, keyword, content_start = classified
+            extraction = extractions.get(keyword)
+            if extraction is None:
+                output_file = _open_output_file(os.path.join(parts_dir, f'{keyword.lower()}.part'))
+                extraction = extractions[keyword] = KeywordExtraction(keyword, raw_log_filepath, output_file)
+            extraction.add(line, identifier, content_start=content_start)
+    finally:
+        for extraction in extractions.values():
+            extraction.output_file.close()
+    _log_parse_cache_info()
+    # Pool workers exit without running the atexit handlers which write the buffered log records
+    loggers.flush()
+    return {
+        'total_lines': total_lines,
+        'keywords': {
+            keyword: {
+                'success': extraction.is_success,
+                'extracted_lines': extraction.extracted_lines,
+                'unique_examples': extraction.unique_examples,
+                'part_filepath': extraction.output_file.name,
+            } for keyword, extraction in extractions.items()
+        },
+    }
+
+def sharded_extract_contents_from_file(raw_log_filepath, raw_log_filename, extracted_files_dir=EXTRACTED_FILES_DIR_PATH, processes=None):
+    """
+    Extract all the keywords of a raw log with a pool of worker processes.
+
+    The file is split into newline-aligned byte ranges which are extracted and deduplicated
+    in parallel. The per-keyword results are then merged in the order of the ranges, so the
+    output files are identical to the ones of `extract_contents_from_file`.
+    Compressed logs cannot be split, they are extracted by `extract_contents_from_file`.
+    """
+    if compression.detect_file_compression(raw_log_filepath) is not None:
+        return extract_contents_from_file(raw_log_filepath, raw_log_filename, extracted_files_dir)
+    processes = processes or os.cpu_count() or 1
+    byte_ranges = _split_into_byte_ranges(raw_log_filepath, processes)
+    if not os.path.exists(extracted_files_dir):
+        os.makedirs(extracted_files_dir)
+    parts_root_dir = tempfile.mkdtemp(prefix='.parts_', dir=extracted_files_dir)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(_extract_byte_range, raw_log_filepath, start, end, os.path.join(parts_root_dir, str(i)))
+                for i, (start, end) in enumerate(byte_ranges)
+            ]
+            range_results = [future.result() for future in futures]
+
+        total_lines = sum(r['total_lines'] for r in range_results)
+        res = []
+        for keyword in sorted({keyword for r in range_results for keyword in r['keywords']}):
+            with _open_output_file(_output_path(extracted_files_dir, keyword, raw_log_filename)) as output_file:
+                extraction = KeywordExtraction(keyword, raw_log_filepath, output_file)
+                for r in range_results:
+                    keyword_result = r['keywords'].get(keyword)
+                    if keyword_result is None:
+                        continue
+                    extraction.is_success = extraction.is_success and keyword_result['success']
+                    extraction.extracted_lines += keyword_result['extracted_lines']
+                    for unique_example in keyword_result['unique_examples']:
+                        extraction.add_unique_example(*unique_example)
+                    with open(keyword_result['part_filepath'], 'r', encoding=compression.TEXT_ENCODING) as part_file:
+                        shutil.copyfileobj(part_file, output_file)
+            res.append({keyword: extraction.summary(total_lines)})
+        return res
+    finally:
+        shutil.rmtree(parts_root_dir, ignore_errors=True)
+
+class KeywordCheckpoint(BaseModel):
+    success: bool = True
+    extracted_lines: int = 0
+    # (identifier, content, content with charger number concatenated), see `KeywordExtraction.unique_examples`
+    unique_examples: List[Tuple[str, str, str]] = []
+
+class FollowCheckpoint(BaseModel):
+    """Position of `follow_contents_from_file` in a growing raw log, and the state accumulated so far."""
+    device: int
+    inode: int
+    # End of the last complete line extracted
+    offset: int = 0
+    # sha256 of the first `fingerprint_size` bytes of the file
+    fingerprint: str = ''
+    fingerprint_size: int = 0
+    total_lines: int = 0
+    keywords: Dict[str, KeywordCheckpoint] = {}
+
+def _checkpoint_path(extracted_files_dir, raw_log_filename):
+    return os.path.join(extracted_files_dir, '.checkpoints', f'{raw_log_filename}.json')
+
+def _load_model(model_class, path):
+    try:
+        with open(path, 'r') as f:
+            return model_class.model_validate_json(f.read())
+    except FileNotFoundError:
+        return None
+
+def _save_model(model: BaseModel, path):
+    # Replace the previous file atomically, so that an interrupted run leaves a consistent one
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(model.model_dump_json())
+    os.replace(tmp_path, path)
+
+def _keyword_checkpoint(extraction: KeywordExtraction) -> KeywordCheckpoint:
+    return KeywordCheckpoint(
+        success=extraction.is_success,
+        extracted_lines=extraction.extracted_lines,
+        unique_examples=[(identifier.value, content, example) for identifier, content, example in extraction.unique_examples],
+    )
+
+def _add_unique_examples(extraction: KeywordExtraction, keyword_checkpoint: KeywordCheckpoint):
+    for identifier, content, example in keyword_checkpoint.unique_examples:
+        extraction.add_unique_example(patterns.ChargerSentMessageIdentifier(identifier), content, example)
+
+def _fingerprint(filepath, size):
+    with open(filepath, 'rb') as f:
+        return hashlib.sha256(f.read(size)).hexdigest()
+
+def _is_checkpointed_file(filepath, checkpoint: FollowCheckpoint):
+    """Whether `filepath` is the file the checkpoint was taken on, and still holds the checkpointed bytes."""
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return False
+    return (
+        (stat.st_dev, stat.st_ino) == (checkpoint.device, checkpoint.inode)
+        and stat.st_size >= checkpoint.offset
+        and _fingerprint(filepath, checkpoint.fingerprint_size) == checkpoint.fingerprint
+    )
+
+def _find_rotated_file(raw_log_filepath, checkpoint: FollowCheckpoint):
+    """The file the checkpointed log was renamed to by a rotation (e.g. `ocpp.log.1`), if it is still in the same directory."""
+    with os.scandir(os.path.dirname(os.path.abspath(raw_log_filepath))) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and entry.inode() == checkpoint.inode and _is_checkpointed_file(entry.path, checkpoint):
+                return entry.path
+    return None
+
+def _iter_appended_lines(filepath, start, include_incomplete_line=False):
+    """
+    Yield the (line, offset after the line) of a file from the byte `start`.
+
+    The lines are decoded and split by `compression.decode_text_lines`. A last line without a line
+    break may still be being written, so it is left for the next run unless `include_incomplete_line`
+    (e.g. for a rotated file which will not grow anymore). So is a last line ended by a carriage
+    return, which may be the first half of a CRLF.
+    """
+    with open(filepath, 'rb') as file:
+        file.seek(start)
+        position = start
+        for raw_line in file:
+            if not raw_line.endswith(b'\n') and not include_incomplete_line:
+                # Only the lines ended by a carriage return followed by another byte are complete
+                raw_line = raw_line[:raw_line.rfind(b'\r', 0, len(raw_line) - 1) + 1]
+                if not raw_line:
+                    break
+            position += len(raw_line)
+            for line in compression.decode_text_lines(raw_line):
+                yield line, position
+
+def follow_contents_from_file(raw_log_filepath, raw_log_filename, extracted_files_dir=EXTRACTED_FILES_DIR_PATH, checkpoint_path=None):
+    """
+    Extract the lines appended to a growing raw log since the previous call.
+
+    The position in the file and the accumulated line counts and unique structure examples are kept in
+    a checkpoint (under `extracted_files_dir/.checkpoints` by default), and the newly extracted lines are
+    appended to the output files, so a call costs work proportional to the new data. The first call, or a
+    call without a checkpoint, extracts the whole file and overwrites the outputs.
+
+    The log is identified by its inode. When it was rotated (renamed, and a new file created in its place),
+    the rest of the rotated file is extracted if it is still in the same directory, then the new file from
+    its beginning. When it was truncated or overwritten in place, it is extracted again from its beginning.
+    The checkpoint is written after the outputs, so an interrupted call may extract some lines twice but
+    never skips any. Returns a list of `{keyword: summary}` sorted by keyword, over everything extracted
+    since the first call.
+    """
+    if compression.detect_file_compression(raw_log_filepath) is not None:
+        raise ValueError(f'{raw_log_filepath} is compressed, it cannot be followed')
+    checkpoint_path = checkpoint_path or _checkpoint_path(extracted_files_dir, raw_log_filename)
+    checkpoint = _load_model(FollowCheckpoint, checkpoint_path)
+    stat = os.stat(raw_log_filepath)
+
+    # (file, start, include incomplete last line) to extract, in order
+    segments = []
+    if checkpoint is None:
+        segments.append((raw_log_filepath, 0, False))
+    elif (stat.st_dev, stat.st_ino) != (checkpoint.device, checkpoint.inode):
+        rotated_filepath = _find_rotated_file(raw_log_filepath, checkpoint)
+        if rotated_filepath is not None:
+            segments.append((rotated_filepath, checkpoint.offset, True))
+        segments.append((raw_log_filepath, 0, False))
+    elif _is_checkpointed_file(raw_log_filepath, checkpoint):
+        segments.append((raw_log_filepath, checkpoint.offset, False))
+    else:
+        loggers.debug_file_logger.debug(f'{raw_log_filepath} was truncated, extracting it from the beginning')
+        segments.append((raw_log_filepath, 0, False))
+
+    extractions = {}
+    total_lines = checkpoint.total_lines if checkpoint else 0
+    offset = 0
+    try:
+        if checkpoint is not None:
+            for keyword, keyword_checkpoint in checkpoint.keywords.items():
+                output_file = _open_output_file(_output_path(extracted_files_dir, keyword, raw_log_filename), 'a')
+                extraction = extractions[keyword] = KeywordExtraction(keyword, raw_log_filepath, output_file)
+                extraction.is_success = keyword_checkpoint.success
+                extraction.extracted_lines = keyword_checkpoint.extracted_lines
+                _add_unique_examples(extraction, keyword_checkpoint)
+
+        for filepath, start, include_incomplete_line in segments:
+            offset = start
+            for line, offset in _iter_appended_lines(filepath, start, include_incomplete_line):
+                total_lines += 1
+                classified = _classify_line(line)
+                if classified is None:
+                    continue
+                identifier, keyword, content_start = classified
+                extraction = extractions.get(keyword)
+                if extraction is None:
+                    output_file = _open_output_file(_output_path(extracted_files_dir, keyword, raw_log_filename))
+                    extraction = extractions[keyword] = KeywordExtraction(keyword, raw_log_filepath, output_file)
+                extraction.add(line, identifier, content_start=content_start)
+    finally:
+        for extraction in extractions.values():
+            extraction.output_file.close()
+
+    fingerprint_size = min(offset, FOLLOW_FINGERPRINT_SIZE)
+    _save_model(FollowCheckpoint(
+        device=stat.st_dev,
+        inode=stat.st_ino,
+        offset=offset,
+        fingerprint=_fingerprint(raw_log_filepath, fingerprint_size),
+        fingerprint_size=fingerprint_size,
+        total_lines=total_lines,
+        keywords={keyword: _keyword_checkpoint(extraction) for keyword, extraction in extractions.items()},
+    ), checkpoint_path)
+    _log_parse_cache_info()
+    return [{keyword: extractions[keyword].summary(total_lines)} for keyword in sorted(extractions)]
+
+class BatchFileResult(BaseModel):
+    """Extraction of a file of a batch, kept in the manifest so that the next batches skip the file while it is unchanged."""
+    raw_log_filename: str
+    size: int
+    mtime_ns: int
+    total_lines: int = 0
+    keywords: Dict[str, KeywordCheckpoint] = {}
+
+class BatchManifest(BaseModel):
+    # By absolute path of the raw logs
+    files: Dict[str, BatchFileResult] = {}
+
+def expand_batch_inputs(inputs):
+    """The files of the given directories (recursively) and glob patterns, skipping hidden files."""
+    filepaths = set()
+    for path in inputs:
+        if os.path.isdir(path):
+            candidates = (os.path.join(dirpath, filename) for dirpath, _, filenames in os.walk(path) for filename in filenames)
+        else:
+            candidates = glob.glob(path, recursive=True)
+        filepaths.update(os.path.abspath(p) for p in candidates if os.path.isfile(p) and not os.path.basename(p).startswith('.'))
+    return sorted(filepaths)
+
+def _batch_raw_log_filenames(filepaths):
+    # Logs of different servers often have the same name, so they are named after their path relative to the common directory
+    if not filepaths:
+        return {}
+    common_dir = os.path.commonpath([os.path.dirname(filepath) for filepath in filepaths])
+    return {filepath: os.path.relpath(filepath, common_dir).replace(os.sep, '_') for filepath in filepaths}
+
+def _extract_batch_file(raw_log_filepath, raw_log_filename, extracted_files_dir, size, mtime_ns):
+    """Extract a file of a batch (run in a worker process)."""
+    try:
+        extractions, total_lines = _extract_contents(raw_log_filepath, raw_log_filename, extracted_files_dir)
+    finally:
+        # Pool workers exit without running the atexit handlers which write the buffered log records
+        loggers.flush()
+    return BatchFileResult(
+        raw_log_filename=raw_log_filename, size=size, mtime_ns=mtime_ns, total_lines=total_lines,
+        keywords={keyword: _keyword_checkpoint(extraction) for keyword, extraction in extractions.items()},
+    )
+
+def _is_unchanged(result: Optional[BatchFileResult], stat, raw_log_filename, extracted_files_dir):
+    return (
+        result is not None
+        and (result.size, result.mtime_ns, result.raw_log_filename) == (stat.st_size, stat.st_mtime_ns, raw_log_filename)
+        and all(os.path.exists(_output_path(extracted_files_dir, keyword, raw_log_filename)) for keyword in result.keywords)
+    )
+
+def batch_extract_contents_from_files(raw_log_filepaths, extracted_files_dir=EXTRACTED_FILES_DIR_PATH, processes=None, manifest_path=None, progress=None):
+    """
+    Extract many raw logs with a pool of worker processes, and merge their results.
+
+    Every file is extracted by a single pass (see `extract_contents_from_file`) to its own output files.
+    The files are submitted largest first, so that the pool does not end waiting for a large file started
+    last, and an idle worker takes the next file. The result of every file is recorded in a manifest
+    (`extracted_files_dir/.manifest.json` by default) as soon as it is done, and the files whose size and
+    modification time did not change since are skipped, so an interrupted batch resumes where it stopped.
+    `progress(done_files, total_files, done_bytes, total_bytes, filepath)` is called after every extracted file.
+
+    Returns the file counts, the errors of the files which failed, and a list of `{keyword: summary}` sorted
+    by keyword, where the unique structure examples are deduplicated across all the files.
+    """
+    processes = processes or os.cpu_count() or 1
+    manifest_path = manifest_path or os.path.join(extracted_files_dir, '.manifest.json')
+    manifest = _load_model(BatchManifest, manifest_path) or BatchManifest()
+    filepaths = sorted({os.path.abspath(filepath) for filepath in raw_log_filepaths})
+    raw_log_filenames = _batch_raw_log_filenames(filepaths)
+    stats = {filepath: os.stat(filepath) for filepath in filepaths}
+
+    results, failures = {}, {}
+    pending = []
+    for filepath in filepaths:
+        result = manifest.files.get(filepath)
+        if _is_unchanged(result, stats[filepath], raw_log_filenames[filepath], extracted_files_dir):
+            results[filepath] = result
+        else:
+            pending.append(filepath)
+    skipped_files = len(results)
+    pending.sort(key=lambda filepath: stats[filepath].st_size, reverse=True)
+    total_bytes = sum(stats[filepath].st_size for filepath in pending)
+    done_bytes = 0
+
+    def _done(filepath, result=None, error=None):
+        nonlocal done_bytes
+        if error is None:
+            results[filepath] = manifest.files[filepath] = result
+        else:
+            failures[filepath] = repr(error)
+            manifest.files.pop(filepath, None)
+            loggers.error_file_logger.error(jsoncodec.dumps({'raw_log_filepath': filepath, 'error': repr(error)}))
+        _save_model(manifest, manifest_path)
+        done_bytes += stats[filepath].st_size
+        if progress is not None:
+            progress(len(results) + len(failures) - skipped_files, len(pending), done_bytes, total_bytes, filepath)
+
+    def _args(filepath):
+        return filepath, raw_log_filenames[filepath], extracted_files_dir, stats[filepath].st_size, stats[filepath].st_mtime_ns
+
+    if processes > 1 and len(pending) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(processes, len(pending))) as executor:
+            futures = {executor.submit(_extract_batch_file, *_args(filepath)): filepath for filepath in pending}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    _done(futures[future], error=e)
+                else:
+                    _done(futures[future], result)
+    else:
+        for filepath in pending:
+            try:
+                result = _extract_batch_file(*_args(filepath))
+            except Exception as e:
+                _done(filepath, error=e)
+            else:
+                _done(filepath, result)
+
+    # Merge in the order of the paths, so the result does not depend on the scheduling
+    extractions, summaries = {}, {}
+    total_lines = sum(result.total_lines for result in results.values())
+    for filepath in filepaths:
+        result = results.get(filepath)
+        if result is None:
+            continue
+        for keyword, keyword_result in sorted(result.keywords.items()):
+            if keyword not in extractions:
+                extractions[keyword] = KeywordExtraction(keyword, None, None)
+                summaries[keyword] = {
+                    'success': True,
+                    'keyword': keyword,
+                    'extracted_lines': 0,
+                    'total_lines': total_lines,
+                    'input_filepaths': [],
+                    'output_filepaths': [],
+                }
+            summary = summaries[keyword]
+            summary['success'] = summary['success'] and keyword_result.success
+            summary['extracted_lines'] += keyword_result.extracted_lines
+            summary['input_filepaths'].append(filepath)
+            summary['output_filepaths'].append(_output_path(extracted_files_dir, keyword, result.raw_log_filename))
+            _add_unique_examples(extractions[keyword], keyword_result)
+    for keyword, summary in summaries.items():
+        summary['unique_example_with_charger_num'] = [example for _, _, example in extractions[keyword].unique_examples]
+    return {
+        'files': len(filepaths),
+        'extracted_files': len(pending) - len(failures),
+        'skipped_files': skipped_files,
+        'failed_files': failures,
+        'keywords': [{keyword: summaries[keyword]} for keyword in sorted(summaries)],
+    }
+
+def _prompt_for_raw_log_filename():
+    return input(f"Please enter the log file name under '{RAW_LOG_FILES_DIR_PATH}' (eg. log1.log): ")
+
 def _prepare_for_file_extractor():
-    raw_log_filename = input(f"Please enter the log file name under '{RAW_LOG_FILES_DIR_PATH}' (eg. log1.log): ")
+    raw_log_filename = _prompt_for_raw_log_filename()
     raw_log_filepath = os.path.join(RAW_LOG_FILES_DIR_PATH, raw_log_filename)
 
     kws = extract_keywords_from_log(log_file_path=raw_log_filepath)
@@ -135,7 +714,7 @@ def single_threaded_log_file_extractor():
     keywords, raw_log_filename, raw_log_filepath = _prepare_for_file_extractor()
     res = {}
     for keyword in sorted(keywords):    
-        output_path = os.path.join(EXTRACTED_FILES_DIR_PATH, keyword.lower(), f'from_{raw_log_filename}')
+        output_path = _output_path(EXTRACTED_FILES_DIR_PATH, keyword, raw_log_filename)
         r = extract_content_with_keyword_from_file(keyword, raw_log_filepath, output_path)
         res[keyword.lower()] = r
     return res
@@ -147,8 +726,7 @@ def multi_threaded_log_file_extractor():
     # Define a list of different parameters to pass
     parameters = [(
         keyword,
-        raw_log_filepath, os.path.join(EXTRACTED_FILES_DIR_PATH, keyword.lower(),
-        f'from_{raw_log_filename}'),
+        raw_log_filepath, _output_path(EXTRACTED_FILES_DIR_PATH, keyword, raw_log_filename),
         multithread_result
     ) for keyword in sorted(keywords)]
 
@@ -162,45 +740,129 @@ def multi_threaded_log_file_extractor():
         thread.join()  # Wait for each thread to finish
     return multithread_result
 
-if __name__ == "__main__":
-    # r = single_threaded_log_file_extractor()
-    r = multi_threaded_log_file_extractor()
+# Process all the keywords in a file with a single read of the file
+def single_pass_log_file_extractor(raw_log_filename=None):
+    raw_log_filename = raw_log_filename or _prompt_for_raw_log_filename()
+    raw_log_filepath = os.path.join(RAW_LOG_FILES_DIR_PATH, raw_log_filename)
+    return extract_contents_from_file(raw_log_filepath, raw_log_filename)
 
-    def add_ocpp_num(input_json):
-        key = 'unique_example_with_charger_num'
-        
-        # Handle both list of dictionaries and single dictionary
-        if isinstance(input_json, list):
-            for item in input_json:
-                if isinstance(item, dict):
-                    process_dictionary(item, key)
-        elif isinstance(input_json, dict):
-            process_dictionary(input_json, key)
-        
-        return input_json
-
-    def process_dictionary(dictionary, key):
-        """Process a dictionary to integrate Ocpp charger numbers."""
-        for value in dictionary.values():
-            if isinstance(value, dict) and key in value:
-                updated_examples = []
-                count = 0
-                for example in value[key]:
-                    # Split JSON obj and charger number
-                    match = re.match(r'^(.*?}), Ocpp charger number: ([\w\s]+)$', example)
-                    if match:
-                        count += 1
-                        json_part = match.group(1)
-                        charger_number = match.group(2)
-                        # Parse JSON obj and add charger number
-                        json_object = json.loads(json_part)
-                        json_object['charger_number'] = charger_number
-                        json_object['original'] = json_part
-                        updated_examples.append(json_object)
-                value[key] = {
-                    'count': count, # count the number of unique examples
-                    'formatted_examples': updated_examples
-                }
+# Process all the keywords in a file by scanning its memory-mapped bytes
+def mmap_log_file_extractor(raw_log_filename=None):
+    raw_log_filename = raw_log_filename or _prompt_for_raw_log_filename()
+    raw_log_filepath = os.path.join(RAW_LOG_FILES_DIR_PATH, raw_log_filename)
+    return mmap_extract_contents_from_file(raw_log_filepath, raw_log_filename)
+
+# Split a file into byte ranges and process them with a pool of worker processes
+def process_pool_log_file_extractor(processes=None, raw_log_filename=None):
+    raw_log_filename = raw_log_filename or _prompt_for_raw_log_filename()
+    raw_log_filepath = os.path.join(RAW_LOG_FILES_DIR_PATH, raw_log_filename)
+    return sharded_extract_contents_from_file(raw_log_filepath, raw_log_filename, processes=processes)
 
+# Extract the lines appended to a file since the previous run, then every `poll_interval` seconds if given
+def follow_log_file_extractor(raw_log_filename=None, poll_interval=None):
+    raw_log_filename = raw_log_filename or _prompt_for_raw_log_filename()
+    raw_log_filepath = os.path.join(RAW_LOG_FILES_DIR_PATH, raw_log_filename)
+    r = follow_contents_from_file(raw_log_filepath, raw_log_filename)
+    while poll_interval:
+        write_output_json(r)
+        time.sleep(poll_interval)
+        r = follow_contents_from_file(raw_log_filepath, raw_log_filename)
+    return r
+
+def _progress_printer(stream=sys.stderr):
+    """A `progress` callback of `batch_extract_contents_from_files` printing the done files and bytes and the remaining time."""
+    start = time.monotonic()
+
+    def _print_progress(done_files, total_files, done_bytes, total_bytes, filepath):
+        elapsed = time.monotonic() - start
+        ratio = done_bytes / total_bytes if total_bytes else 1
+        eta = f'{elapsed / ratio - elapsed:.0f}s' if ratio else '?'
+        # Overwrite the line on a terminal, print a line per file otherwise (e.g. redirected to a file)
+        end = '\n' if done_files == total_files or not stream.isatty() else ''
+        stream.write(f'\r[{done_files}/{total_files} files, {ratio:.0%} of {total_bytes / 2 ** 20:.1f} MiB, {elapsed:.0f}s elapsed, ETA {eta}] {os.path.basename(filepath)}\033[K{end}')
+        stream.flush()
+
+    return _print_progress
+
+# Extract all the files of directories / glob patterns with a pool of worker processes, skipping the files unchanged since the previous batch
+def batch_log_files_extractor(inputs, processes=None):
+    raw_log_filepaths = expand_batch_inputs(inputs)
+    r = batch_extract_contents_from_files(raw_log_filepaths, processes=processes, progress=_progress_printer())
+    print(f"{r['files']} files: {r['extracted_files']} extracted, {r['skipped_files']} unchanged, {len(r['failed_files'])} failed", file=sys.stderr)
+    add_ocpp_num(r['keywords'])
+    return r
+
+def add_ocpp_num(input_json):
+    key = 'unique_example_with_charger_num'
+    
+    # Handle both list of dictionaries and single dictionary
+    if isinstance(input_json, list):
+        for item in input_json:
+            if isinstance(item, dict):
+                process_dictionary(item, key)
+    elif isinstance(input_json, dict):
+        process_dictionary(input_json, key)
+    
+    return input_json
+
+def process_dictionary(dictionary, key):
+    """Process a dictionary to integrate Ocpp charger numbers."""
+    for value in dictionary.values():
+        if isinstance(value, dict) and key in value:
+            updated_examples = []
+            count = 0
+            for example in value[key]:
+                # Split JSON obj and charger number
+                match = re.match(r'^(.*?}), Ocpp charger number: ([\w\s]+)$', example)
+                if match:
+                    count += 1
+                    json_part = match.group(1)
+                    charger_number = match.group(2)
+                    # Parse JSON obj and add charger number
+                    json_object = jsoncodec.loads(json_part)
+                    json_object['charger_number'] = charger_number
+                    json_object['original'] = json_part
+                    updated_examples.append(json_object)
+            value[key] = {
+                'count': count, # count the number of unique examples
+                'formatted_examples': updated_examples
+            }
+
+def write_output_json(r):
     with open(os.path.join(root_dir, 'output.json'), 'w', encoding='utf-8') as f:
-        json.dump(add_ocpp_num(r), f, indent=4, ensure_ascii=False)
+        f.write(jsoncodec.dumps(add_ocpp_num(r), indent=4))
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Extract charger sent messages from a raw OCPP log file.')
+    arg_parser.add_argument('--processes', type=int, default=1,
+                            help='Number of worker processes. More than 1 shards the file by byte ranges across a process pool, '
+                                 'or extracts several files at once with --batch.')
+    arg_parser.add_argument('--mmap', action='store_true',
+                            help='Scan the memory-mapped bytes of the file, only decoding the lines of charger sent messages.')
+    arg_parser.add_argument('--follow', action='store_true',
+                            help='Only extract the lines appended since the previous --follow run, and append them to the outputs.')
+    arg_parser.add_argument('--poll-interval', type=float,
+                            help='With --follow, keep extracting the appended lines every POLL_INTERVAL seconds until interrupted.')
+    arg_parser.add_argument('--file', help=f"Log file name under '{RAW_LOG_FILES_DIR_PATH}', prompted for if not given.")
+    arg_parser.add_argument('--batch', nargs='+', metavar='PATH',
+                            help='Extract all the files of these directories or glob patterns (e.g. "statics/logs/raw/**/*.log.gz"), '
+                                 'skipping the files unchanged since the previous batch, and merge their results.')
+    args = arg_parser.parse_args()
+
+    # r = single_threaded_log_file_extractor()
+    # r = multi_threaded_log_file_extractor()
+    if args.batch:
+        r = batch_log_files_extractor(args.batch, args.processes)
+    elif args.follow:
+        try:
+            r = follow_log_file_extractor(args.file, args.poll_interval)
+        except KeyboardInterrupt:
+            raise SystemExit(0)
+    elif args.mmap:
+        r = mmap_log_file_extractor(args.file)
+    elif args.processes > 1:
+        r = process_pool_log_file_extractor(args.processes, args.file)
+    else:
+        r = single_pass_log_file_extractor(args.file)
+
+    write_output_json(r)
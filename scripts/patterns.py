@@ -3,7 +3,7 @@ import json
 import re
 
 from pydantic import BaseModel
-from typing import Callable
+from typing import Callable, Hashable, NamedTuple, Optional
 from utilities import comparator
 
 # Regex
@@ -18,28 +18,114 @@ class ChargerSentMessageIdentifier(str, Enum):
     RECEIVE_MESSAGE = 'receive message'
     CONSUMERS = 'consumers'
 
+# Finds the identifiers in the bytes of a raw log, so that the lines without any are never decoded
+CHARGER_SENT_MESSAGE_IDENTIFIERS_BYTES_REGEX = re.compile(b'|'.join(re.escape(identifier.value.encode()) for identifier in ChargerSentMessageIdentifier))
+
 # Keyword extraction patterns based on identifiers in raw data
 KEYWORD_PATTERNS = {
     ChargerSentMessageIdentifier.RECEIVE_MESSAGE: [re.compile(RECEIVE_MESSAGE_REGEX.pattern + THIRD_ARRAY_ITEM_REGEX.pattern)],
     ChargerSentMessageIdentifier.CONSUMERS: [re.compile(CONSUMERS_REGEX.pattern + THIRD_ARRAY_ITEM_REGEX.pattern)],
 }
 
+# JSON content patterns based on identifiers in raw data
+JSON_CONTENT_PATTERNS = {
+    ChargerSentMessageIdentifier.RECEIVE_MESSAGE: re.compile(RECEIVE_MESSAGE_REGEX.pattern + JSON_CONTENT_AFTER_THIRD_ARRAY_ITEM.pattern),
+    ChargerSentMessageIdentifier.CONSUMERS: re.compile(CONSUMERS_REGEX.pattern + JSON_CONTENT_AFTER_THIRD_ARRAY_ITEM.pattern),
+}
+
+# Finds in a single scan the first identifier of a line, the keyword of the first OCPP call after it and the start of its JSON content
+CHARGER_SENT_MESSAGE_REGEX = re.compile(
+    '(' + '|'.join(re.escape(identifier.value) for identifier in ChargerSentMessageIdentifier) + ')'
+    + '.*?' + THIRD_ARRAY_ITEM_REGEX.pattern + r'(?:\s*,\s*(\{))?'
+)
+# The JSON content captured by JSON_CONTENT_AFTER_THIRD_ARRAY_ITEM starts at the object after the last `"\w+",`
+# of the line; this finds the candidates (a superset, which is faster to search for)
+QUOTE_BEFORE_OBJECT_REGEX = re.compile(r'"\s*,\s*\{')
+CLOSING_BRACKET_REGEX = re.compile(r'\s*]')
+
+class ChargerSentMessage(NamedTuple):
+    identifier: ChargerSentMessageIdentifier
+    keyword: str
+    # Offset of the JSON content in the line, None when it has to be searched with JSON_CONTENT_PATTERNS
+    content_start: Optional[int] = None
+
+# Identifiers are checked in the order of the enum
+_HIGHER_PRECEDENCE_IDENTIFIERS = {identifier: list(ChargerSentMessageIdentifier)[:i] for i, identifier in enumerate(ChargerSentMessageIdentifier)}
+
+def _classify_with_keyword_patterns(line) -> Optional[ChargerSentMessage]:
+    for identifier in ChargerSentMessageIdentifier:
+        if identifier in line:
+            for keyword_pattern in KEYWORD_PATTERNS[identifier]:
+                match = keyword_pattern.search(line)
+                if match:
+                    keyword = match.group(1)
+                    if keyword and keyword.isalpha():
+                        return ChargerSentMessage(identifier, keyword)
+                    return None
+            # No need to go through more identifiers as an identifier should be exclusive
+            return None
+    return None
+
+def classify_charger_sent_message(line: str) -> Optional[ChargerSentMessage]:
+    """
+    The identifier, keyword and JSON content offset of a charger sent message line, None for any other line.
+
+    Gives the same identifier and keyword as `KEYWORD_PATTERNS`, which is used as a fallback for the
+    lines where the single scan of CHARGER_SENT_MESSAGE_REGEX could disagree: a line with a
+    lower precedence identifier before a higher one, or with several OCPP calls (the keyword patterns
+    capture the last one).
+    """
+    match = CHARGER_SENT_MESSAGE_REGEX.search(line)
+    if match is None:
+        return None
+    identifier = ChargerSentMessageIdentifier(match.group(1))
+    if any(other in line for other in _HIGHER_PRECEDENCE_IDENTIFIERS[identifier]) or THIRD_ARRAY_ITEM_REGEX.search(line, match.end(2)):
+        return _classify_with_keyword_patterns(line)
+    keyword = match.group(2)
+    if not keyword.isalpha():
+        return None
+    content_start = match.start(3)
+    # Another quoted word followed by an object would be where JSON_CONTENT_AFTER_THIRD_ARRAY_ITEM starts the content
+    if content_start == -1 or QUOTE_BEFORE_OBJECT_REGEX.search(line, content_start):
+        return ChargerSentMessage(identifier, keyword)
+    return ChargerSentMessage(identifier, keyword, content_start)
+
+def json_content(line: str, content_start: int) -> Optional[str]:
+    """The JSON content starting at `content_start`, up to the last `}` followed by a `]`, as JSON_CONTENT_AFTER_THIRD_ARRAY_ITEM captures it."""
+    end = line.rfind('}')
+    # The braces enclose at least a character
+    while end > content_start + 1:
+        if CLOSING_BRACKET_REGEX.match(line, end + 1):
+            return line[content_start:end + 1]
+        end = line.rfind('}', content_start + 1, end)
+    return None
+
 # Used to compare the structures of extracted contents
 class ComparablePattern(BaseModel):
     identifier: str
     pattern: re.Pattern # pattern to extract the contents
     is_identical: Callable[[str, str], bool]
+    signature: Callable[[str], Optional[Hashable]] # contents are identical if they have the same (not None) signature
+
+    def content(self, line: str, content_start: Optional[int] = None) -> Optional[str]:
+        """The content of a line, cut at the `content_start` found by `classify_charger_sent_message` when the pattern is a JSON content pattern."""
+        if content_start is not None and self.pattern is JSON_CONTENT_PATTERNS.get(self.identifier):
+            return json_content(line, content_start)
+        match = self.pattern.search(line)
+        return match.group(1) if match else None
 
 comparable_pattern001 = ComparablePattern(
     identifier=ChargerSentMessageIdentifier.RECEIVE_MESSAGE,
-    pattern=re.compile(RECEIVE_MESSAGE_REGEX.pattern + JSON_CONTENT_AFTER_THIRD_ARRAY_ITEM.pattern), # Used to extract content
-    is_identical=comparator.compare_json_str # Used to compare if two extacted contents have identical data structures
+    pattern=JSON_CONTENT_PATTERNS[ChargerSentMessageIdentifier.RECEIVE_MESSAGE], # Used to extract content
+    is_identical=comparator.compare_json_str, # Used to compare if two extacted contents have identical data structures
+    signature=comparator.json_str_signature
 )
 
 comparable_pattern002 = ComparablePattern(
     identifier=ChargerSentMessageIdentifier.CONSUMERS,
-    pattern=re.compile(CONSUMERS_REGEX.pattern + JSON_CONTENT_AFTER_THIRD_ARRAY_ITEM.pattern),
-    is_identical=comparator.compare_json_str
+    pattern=JSON_CONTENT_PATTERNS[ChargerSentMessageIdentifier.CONSUMERS],
+    is_identical=comparator.compare_json_str,
+    signature=comparator.json_str_signature
 )
 
 # A config map to link keyword and its content patterns
@@ -49,13 +135,15 @@ COMPARABLE_KEYWORD_CONTENT_MAP = {
     'datatransfer': [
         ComparablePattern(
             identifier=ChargerSentMessageIdentifier.RECEIVE_MESSAGE,
-            pattern=re.compile(RECEIVE_MESSAGE_REGEX.pattern + JSON_CONTENT_AFTER_THIRD_ARRAY_ITEM.pattern),
-            is_identical = comparator.datatransfer_content_comparator
+            pattern=JSON_CONTENT_PATTERNS[ChargerSentMessageIdentifier.RECEIVE_MESSAGE],
+            is_identical = comparator.datatransfer_content_comparator,
+            signature = comparator.datatransfer_content_signature
         ),
         ComparablePattern(
             identifier=ChargerSentMessageIdentifier.CONSUMERS,
-            pattern=re.compile(CONSUMERS_REGEX.pattern + JSON_CONTENT_AFTER_THIRD_ARRAY_ITEM.pattern),
-            is_identical = comparator.datatransfer_content_comparator
+            pattern=JSON_CONTENT_PATTERNS[ChargerSentMessageIdentifier.CONSUMERS],
+            is_identical = comparator.datatransfer_content_comparator,
+            signature = comparator.datatransfer_content_signature
         )
     ],
     'heartbeat': [comparable_pattern001, comparable_pattern002],
@@ -0,0 +1,384 @@
+import gzip
+import os
+import shutil
+import tempfile
+from django.test import SimpleTestCase
+
+from benchmarks import generate_log
+from log_processor import errors, ingest
+from scripts import extractor, patterns
+from utilities import loggers
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# Get the root path of the project directory
+root_dir = os.path.dirname(current_dir)
+
+EXTRA_LOG_RECORDS = [
+    'INFO:ocpp:1000191: receive message [2,"104","DataTransfer",{"vendorId":"ATESS","messageId":"currentrecord","data":"id=0&connectorId=0"}]',
+    'INFO:ocpp:1000191: receive message [2,"105","DataTransfer",{"vendorId":"ATESS","messageId":"currentrecord","data":"id=1&connectorId=3"}]',
+    'INFO:ocpp:TH009: receive message [2,"106","DataTransfer",{"vendorId":"CEGN","messageId":"chargePoridStatu","data":"{\\"FaultGroup\\":[]}"}]',
+    'INFO:ocpp:1000186: receive message [ 2, "1000186-14", "Authorize", { "idTag" : "5d2e7089" } ]',
+    'INFO:ocpp:1000186: send [3,"1000186-14",{"idTagInfo":{"status":"Accepted"}}]',
+    'INFO:websockets: consumers [TH010] message [2,"107","Heartbeat",{}]',
+    'INFO:ocpp:1000129: receive message [2,"108","StatusNotification",{"connectorId":1,"errorCode":"NoError","status":"Available"}]',
+    'Some noise which should be ignored',
+]
+
+def build_raw_log(dir_path, repeat=3):
+    """Write a raw log mixing the MeterValues test records with other request types and noise."""
+    with open(os.path.join(root_dir, 'statics/logs/test/meterValues.log'), 'r') as f:
+        lines = f.read().splitlines()
+    raw_log_filepath = os.path.join(dir_path, 'raw.log')
+    with open(raw_log_filepath, 'w') as f:
+        f.write('\n'.join(lines + EXTRA_LOG_RECORDS * repeat) + '\n')
+    return raw_log_filepath
+
+def read_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+class ExtractorTests(SimpleTestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.raw_log_filepath = build_raw_log(self.tmp_dir)
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+        shutil.rmtree(self.tmp_dir)
+
+    def _extract_per_keyword(self):
+        res = {}
+        for keyword in extractor.extract_keywords_from_log(self.raw_log_filepath):
+            output_path = os.path.join(self.tmp_dir, 'per_keyword', keyword.lower(), 'from_raw.log')
+            res[keyword] = extractor.extract_content_with_keyword_from_file(keyword, self.raw_log_filepath, output_path)
+        return res
+
+    def assertSameSummaries(self, summaries, expected):
+        self.assertEqual(sorted(summaries), sorted(expected))
+        for keyword, summary in summaries.items():
+            for field in ['success', 'keyword', 'extracted_lines', 'total_lines', 'input_filepath']:
+                self.assertEqual(summary[field], expected[keyword][field])
+            self.assertCountEqual(summary['unique_example_with_charger_num'], expected[keyword]['unique_example_with_charger_num'])
+            self.assertEqual(read_file(summary['output_filepath']), read_file(expected[keyword]['output_filepath']))
+
+    def test_single_pass_extraction_matches_per_keyword_extraction(self):
+        result = extractor.extract_contents_from_file(self.raw_log_filepath, 'raw.log', os.path.join(self.tmp_dir, 'single_pass'))
+        self.assertEqual([next(iter(r)) for r in result], ['Authorize', 'DataTransfer', 'Heartbeat', 'MeterValues', 'StatusNotification'])
+        self.assertSameSummaries({k: v for r in result for k, v in r.items()}, self._extract_per_keyword())
+
+    def test_sharded_extraction_matches_single_pass_extraction(self):
+        expected = extractor.extract_contents_from_file(self.raw_log_filepath, 'raw.log', os.path.join(self.tmp_dir, 'single_pass'))
+        result = extractor.sharded_extract_contents_from_file(self.raw_log_filepath, 'raw.log', os.path.join(self.tmp_dir, 'sharded'), processes=3)
+        self.assertEqual([next(iter(r)) for r in result], [next(iter(r)) for r in expected])
+        for r, e in zip(result, expected):
+            (summary,), (expected_summary,) = r.values(), e.values()
+            self.assertEqual(read_file(summary.pop('output_filepath')), read_file(expected_summary.pop('output_filepath')))
+            self.assertEqual(summary, expected_summary)
+
+    def test_mmap_extraction_matches_single_pass_extraction(self):
+        # CRLF line breaks and a last line without line break
+        with open(self.raw_log_filepath, 'rb') as f:
+            content = f.read()
+        with open(self.raw_log_filepath, 'wb') as f:
+            f.write(content.replace(b'\n', b'\r\n', 5) + EXTRA_LOG_RECORDS[0].encode())
+        expected = extractor.extract_contents_from_file(self.raw_log_filepath, 'raw.log', os.path.join(self.tmp_dir, 'single_pass'))
+        result = extractor.mmap_extract_contents_from_file(self.raw_log_filepath, 'raw.log', os.path.join(self.tmp_dir, 'mmap'))
+        self.assertEqual([next(iter(r)) for r in result], [next(iter(r)) for r in expected])
+        for r, e in zip(result, expected):
+            (summary,), (expected_summary,) = r.values(), e.values()
+            self.assertEqual(read_file(summary.pop('output_filepath')), read_file(expected_summary.pop('output_filepath')))
+            self.assertEqual(summary, expected_summary)
+        self.assertEqual(extractor.mmap_extract_keywords_from_log(self.raw_log_filepath), extractor.extract_keywords_from_log(self.raw_log_filepath))
+
+    def test_all_modes_read_lone_carriage_returns_and_invalid_bytes_alike(self):
+        with open(self.raw_log_filepath, 'rb') as f:
+            lines = f.read().splitlines()
+        # Lone CR, CRLF and LF line breaks, and bytes which are not UTF-8 in a message and in the noise
+        lines[0] = lines[0].replace(b'"value":"', b'"value":"\xff', 1)
+        lines.append(b'Noise \xe9\xe8')
+        line_breaks = [b'\r', b'\r\n', b'\n']
+        with open(self.raw_log_filepath, 'wb') as f:
+            f.write(b''.join(line + line_breaks[i % 3] for i, line in enumerate(lines)))
+        expected = extractor.extract_contents_from_file(self.raw_log_filepath, 'raw.log', os.path.join(self.tmp_dir, 'single_pass'))
+        self.assertEqual(next(iter(expected[0].values()))['total_lines'], len(lines))
+        results = [
+            extractor.sharded_extract_contents_from_file(self.raw_log_filepath, 'raw.log', os.path.join(self.tmp_dir, 'sharded'), processes=3),
+            extractor.mmap_extract_contents_from_file(self.raw_log_filepath, 'raw.log', os.path.join(self.tmp_dir, 'mmap')),
+            extractor.follow_contents_from_file(self.raw_log_filepath, 'raw.log', os.path.join(self.tmp_dir, 'follow')),
+        ]
+        for result in results:
+            self.assertEqual([next(iter(r)) for r in result], [next(iter(r)) for r in expected])
+            for r, e in zip(result, expected):
+                (summary,), (expected_summary,) = r.values(), e.values()
+                self.assertEqual(read_file(summary.pop('output_filepath')), read_file(expected_summary['output_filepath']))
+                self.assertEqual(summary, {k: v for k, v in expected_summary.items() if k != 'output_filepath'})
+        self.assertIn('\ufffd', read_file(os.path.join(self.tmp_dir, 'single_pass', 'metervalues', 'from_raw.log')))
+        self.assertEqual(extractor.mmap_extract_keywords_from_log(self.raw_log_filepath), extractor.extract_keywords_from_log(self.raw_log_filepath))
+
+    def test_extraction_of_lists_nested_in_list_elements(self):
+        with open(self.raw_log_filepath, 'a') as f:
+            f.write('INFO:ocpp:TH011: receive message [2,"109","BootNotification",{"chargePointModel":"M","modules":[{"ids":[1,2]},[3]]}]\n')
+            f.write('INFO:ocpp:TH011: receive message [2,"110","DataTransfer",{"vendorId":"CEGN","messageId":"faults","data":"{\\"FaultGroup\\":[{\\"codes\\":[1,2]},[3]]}"}]\n')
+        summaries = {k: v for r in extractor.extract_contents_from_file(self.raw_log_filepath, 'raw.log', self.tmp_dir) for k, v in r.items()}
+        for keyword in ['BootNotification', 'DataTransfer']:
+            self.assertTrue(summaries[keyword]['success'])
+            self.assertTrue(any(example.endswith(': TH011') for example in summaries[keyword]['unique_example_with_charger_num']))
+
+    def test_mmap_extraction_of_empty_file(self):
+        empty_log_filepath = os.path.join(self.tmp_dir, 'empty.log')
+        open(empty_log_filepath, 'w').close()
+        self.assertEqual(extractor.mmap_extract_contents_from_file(empty_log_filepath, 'empty.log', self.tmp_dir), [])
+
+    def test_compressed_log_extraction_matches_plain_log_extraction(self):
+        expected = extractor.extract_contents_from_file(self.raw_log_filepath, 'raw.log', os.path.join(self.tmp_dir, 'plain'))
+        compressed_log_filepath = os.path.join(self.tmp_dir, 'raw.log.gz')
+        with open(self.raw_log_filepath, 'rb') as f, gzip.open(compressed_log_filepath, 'wb') as compressed_file:
+            shutil.copyfileobj(f, compressed_file)
+        for extract in [extractor.extract_contents_from_file, extractor.sharded_extract_contents_from_file, extractor.mmap_extract_contents_from_file]:
+            result = extract(compressed_log_filepath, 'raw.log.gz', os.path.join(self.tmp_dir, extract.__name__))
+            self.assertEqual([next(iter(r)) for r in result], [next(iter(r)) for r in expected])
+            for r, e in zip(result, expected):
+                (summary,), (expected_summary,) = r.values(), e.values()
+                self.assertEqual(read_file(summary['output_filepath']), read_file(expected_summary['output_filepath']))
+                self.assertEqual(summary['extracted_lines'], expected_summary['extracted_lines'])
+                self.assertEqual(summary['unique_example_with_charger_num'], expected_summary['unique_example_with_charger_num'])
+        self.assertEqual(extractor.extract_keywords_from_log(compressed_log_filepath), extractor.extract_keywords_from_log(self.raw_log_filepath))
+
+    def test_byte_ranges_are_newline_aligned(self):
+        byte_ranges = extractor._split_into_byte_ranges(self.raw_log_filepath, 4)
+        self.assertEqual(byte_ranges[0][0], 0)
+        self.assertEqual(byte_ranges[-1][1], os.path.getsize(self.raw_log_filepath))
+        with open(self.raw_log_filepath, 'rb') as f:
+            content = f.read()
+        for (_, end), (start, _) in zip(byte_ranges, byte_ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(content[start - 1:start], b'\n')
+
+class FollowExtractorTests(SimpleTestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lines = read_file(build_raw_log(self.tmp_dir)).splitlines(keepends=True)
+        self.raw_log_filepath = os.path.join(self.tmp_dir, 'live.log')
+        self.output_dir = os.path.join(self.tmp_dir, 'follow')
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+        shutil.rmtree(self.tmp_dir)
+
+    def _append(self, content, path=None):
+        with open(path or self.raw_log_filepath, 'a') as f:
+            f.write(content)
+
+    def _follow(self):
+        return extractor.follow_contents_from_file(self.raw_log_filepath, 'live.log', self.output_dir)
+
+    def assertSameAsSinglePass(self, result, lines):
+        expected_log_filepath = os.path.join(self.tmp_dir, 'expected.log')
+        with open(expected_log_filepath, 'w') as f:
+            f.writelines(lines)
+        expected = extractor.extract_contents_from_file(expected_log_filepath, 'expected.log', os.path.join(self.tmp_dir, 'single_pass'))
+        self.assertEqual([next(iter(r)) for r in result], [next(iter(r)) for r in expected])
+        for r, e in zip(result, expected):
+            (summary,), (expected_summary,) = r.values(), e.values()
+            self.assertEqual(read_file(summary.pop('output_filepath')), read_file(expected_summary.pop('output_filepath')))
+            expected_summary['input_filepath'] = self.raw_log_filepath
+            self.assertEqual(summary, expected_summary)
+
+    def test_follow_extracts_appended_lines_only(self):
+        half = len(self.lines) // 2
+        self._append(''.join(self.lines[:half]))
+        self.assertSameAsSinglePass(self._follow(), self.lines[:half])
+        # A line being written is left for the next run
+        self._append(''.join(self.lines[half:-1]) + self.lines[-1][:10])
+        self._follow()
+        self._append(self.lines[-1][10:])
+        self.assertSameAsSinglePass(self._follow(), self.lines)
+        # Nothing new
+        self.assertSameAsSinglePass(self._follow(), self.lines)
+
+    def test_follow_log_with_carriage_returns(self):
+        lines = [line.rstrip('\n') for line in self.lines]
+        # The last carriage return may be the first half of a CRLF, its line is left for the next run
+        self._append('\r'.join(lines[:10]) + '\r')
+        self.assertSameAsSinglePass(self._follow(), self.lines[:9])
+        self._append('\n' + '\r\n'.join(lines[10:]) + '\r\n')
+        self.assertSameAsSinglePass(self._follow(), self.lines)
+
+    def test_follow_rotated_log(self):
+        self._append(''.join(self.lines[:10]))
+        self._follow()
+        # Appended after the last run, before the rotation
+        self._append(''.join(self.lines[10:20]))
+        os.rename(self.raw_log_filepath, f'{self.raw_log_filepath}.1')
+        self._append(''.join(self.lines[20:]))
+        self.assertSameAsSinglePass(self._follow(), self.lines)
+
+    def test_follow_truncated_log(self):
+        self._append(''.join(self.lines[:10]))
+        self._follow()
+        with open(self.raw_log_filepath, 'w') as f:
+            f.write(''.join(self.lines[10:]))
+        self.assertSameAsSinglePass(self._follow(), self.lines)
+
+class BatchExtractorTests(SimpleTestCase):
+
+    def setUp(self) -> None:
+        loggers.mute_logger(loggers.debug_file_logger)
+        loggers.mute_logger(loggers.error_file_logger)
+        self.tmp_dir = tempfile.mkdtemp()
+        lines = read_file(build_raw_log(self.tmp_dir)).splitlines(keepends=True)
+        self.raw_dir = os.path.join(self.tmp_dir, 'raw')
+        self.output_dir = os.path.join(self.tmp_dir, 'extracted')
+        # Logs of two servers with the same name, and a compressed one
+        self.contents = {
+            os.path.join(self.raw_dir, 'server1', 'ocpp.log'): ''.join(lines[:len(lines) // 3]),
+            os.path.join(self.raw_dir, 'server2', 'ocpp.log'): ''.join(lines[len(lines) // 3:]),
+            os.path.join(self.raw_dir, 'server2', 'ocpp.log.1.gz'): ''.join(lines[5:15]),
+        }
+        for path, content in self.contents.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with (gzip.open if path.endswith('.gz') else open)(path, 'wt') as f:
+                f.write(content)
+
+    def tearDown(self) -> None:
+        loggers.unmute_logger(loggers.debug_file_logger)
+        loggers.unmute_logger(loggers.error_file_logger)
+        shutil.rmtree(self.tmp_dir)
+
+    def _batch(self, processes=2):
+        return extractor.batch_extract_contents_from_files(extractor.expand_batch_inputs([self.raw_dir]), self.output_dir, processes=processes)
+
+    def test_batch_extraction(self):
+        result = self._batch()
+        self.assertEqual((result['files'], result['extracted_files'], result['skipped_files'], result['failed_files']), (3, 3, 0, {}))
+        # Every file is extracted like a single file
+        for path, raw_log_filename in [
+            (os.path.join(self.raw_dir, 'server1', 'ocpp.log'), 'server1_ocpp.log'),
+            (os.path.join(self.raw_dir, 'server2', 'ocpp.log.1.gz'), 'server2_ocpp.log.1.gz'),
+        ]:
+            for r in extractor.extract_contents_from_file(path, raw_log_filename, os.path.join(self.tmp_dir, 'single')):
+                (keyword, summary), = r.items()
+                self.assertEqual(read_file(extractor._output_path(self.output_dir, keyword, raw_log_filename)), read_file(summary['output_filepath']))
+        # The unique examples are merged like the ones of a single file made of all the files
+        all_log_filepath = os.path.join(self.tmp_dir, 'all.log')
+        with open(all_log_filepath, 'w') as f:
+            f.write(''.join(self.contents[path] for path in sorted(self.contents)))
+        expected = extractor.extract_contents_from_file(all_log_filepath, 'all.log', os.path.join(self.tmp_dir, 'all'))
+        self.assertEqual([next(iter(r)) for r in result['keywords']], [next(iter(r)) for r in expected])
+        for r, e in zip(result['keywords'], expected):
+            (summary,), (expected_summary,) = r.values(), e.values()
+            for field in ['extracted_lines', 'total_lines', 'unique_example_with_charger_num']:
+                self.assertEqual(summary[field], expected_summary[field])
+            self.assertEqual(len(summary['input_filepaths']), len(summary['output_filepaths']))
+
+    def test_batch_resumes_from_manifest(self):
+        first = self._batch(processes=1)
+        second = self._batch()
+        self.assertEqual((second['extracted_files'], second['skipped_files']), (0, 3))
+        self.assertEqual(second['keywords'], first['keywords'])
+        changed_path = os.path.join(self.raw_dir, 'server1', 'ocpp.log')
+        with open(changed_path, 'a') as f:
+            f.write(self.contents[changed_path])
+        third = self._batch()
+        self.assertEqual((third['extracted_files'], third['skipped_files']), (1, 2))
+        fresh = extractor.batch_extract_contents_from_files(extractor.expand_batch_inputs([self.raw_dir]), os.path.join(self.tmp_dir, 'fresh'), processes=1)
+        self.assertEqual([next(iter(r)) for r in third['keywords']], [next(iter(r)) for r in fresh['keywords']])
+        for r, e in zip(third['keywords'], fresh['keywords']):
+            (summary,), (expected_summary,) = r.values(), e.values()
+            for field in ['extracted_lines', 'total_lines', 'unique_example_with_charger_num', 'input_filepaths']:
+                self.assertEqual(summary[field], expected_summary[field])
+
+    def test_failed_file(self):
+        corrupted_path = os.path.join(self.raw_dir, 'corrupted.log.gz')
+        with open(corrupted_path, 'wb') as f:
+            f.write(gzip.compress(b'INFO:ocpp:1: receive message [2,"1","Heartbeat",{}]\n' * 100)[:-20])
+        result = self._batch()
+        self.assertEqual((result['extracted_files'], list(result['failed_files'])), (3, [corrupted_path]))
+        # A failed file is retried by the next batch
+        self.assertEqual(self._batch()['failed_files'], result['failed_files'])
+
+TRICKY_LOG_RECORDS = [
+    # A lower precedence identifier before a higher one
+    'INFO:websockets: consumers [TH010] receive message [2,"1","Heartbeat",{"a":1}]',
+    'INFO:websockets: consumers [2,"1","Authorize",{"idTag":"1"}] receive message',
+    # Several calls in a line
+    'INFO:ocpp:1: receive message [2,"1","Authorize",{"idTag":"1"}] [2,"2","Heartbeat",{"a":1}]',
+    # A quoted word followed by an object in the content
+    'INFO:ocpp:1: receive message [2,"1","DataTransfer",{"data":["x",{"y":1}]}]',
+    'INFO:ocpp:1: receive message [2,"1","DataTransfer",{"data":[1,"x" , {"y":1}]}] trailing } ]',
+    # No or empty content, trailing characters
+    'INFO:ocpp:1: receive message [2,"1","Heartbeat"]',
+    'INFO:ocpp:1: receive message [2,"1","Heartbeat",{}]',
+    'INFO:ocpp:1: receive message [2,"1","Heartbeat",{"a":1}] }',
+    'INFO:ocpp:1: receive message [2,"1","Heartbeat",{"a":{"b":1}}  ] {"c":2}]',
+    'INFO:ocpp:1: receive message [2,"1","Heartbeat",{"a":1}',
+    # Not a word
+    'INFO:ocpp:1: receive message [2,"1","Meter Values",{"a":1}]',
+    'INFO:ocpp:1: receive message [2, "1" , "Heartbeat" , {"a":1}]\r\n',
+]
+
+class ClassifierTests(SimpleTestCase):
+    """The single scan classifier must agree with the keyword and content patterns."""
+
+    def _expected(self, line):
+        for identifier in patterns.ChargerSentMessageIdentifier:
+            if identifier in line:
+                for keyword_pattern in patterns.KEYWORD_PATTERNS[identifier]:
+                    match = keyword_pattern.search(line)
+                    if match and match.group(1).isalpha():
+                        content_match = patterns.JSON_CONTENT_PATTERNS[identifier].search(line)
+                        return identifier, match.group(1), content_match and content_match.group(1)
+                    return None
+                return None
+        return None
+
+    def test_classifier_matches_patterns(self):
+        with open(os.path.join(root_dir, 'statics/logs/test/meterValues.log'), 'r') as f:
+            lines = f.readlines()
+        lines += EXTRA_LOG_RECORDS + TRICKY_LOG_RECORDS + list(generate_log.generate_lines(1000, seed=2))
+        for line in lines:
+            with self.subTest(line=line):
+                classified = patterns.classify_charger_sent_message(line)
+                expected = self._expected(line)
+                if expected is None:
+                    self.assertIsNone(classified)
+                    continue
+                identifier, keyword, content_start = classified
+                comparable_pattern = {p.identifier: p for p in [patterns.comparable_pattern001, patterns.comparable_pattern002]}[identifier]
+                self.assertEqual((identifier, keyword, comparable_pattern.content(line, content_start)), expected)
+
+    def test_content_start_of_regular_lines(self):
+        for line in EXTRA_LOG_RECORDS[:3]:
+            classified = patterns.classify_charger_sent_message(line)
+            self.assertEqual(line[classified.content_start], '{')
+
+class GenerateLogTests(SimpleTestCase):
+    """The synthetic logs of the benchmarks must be made of valid requests."""
+
+    def test_generated_requests_are_valid(self):
+        request_types = set()
+        for line in generate_log.generate_lines(500, seed=1):
+            classified = extractor._classify_line(line)
+            if classified is None:
+                continue
+            request_types.add(classified[1])
+            try:
+                ingest.validate_line(line)
+            except errors.CurrentlyUnSupported:
+                self.assertEqual(classified[1], 'StatusNotification')
+        self.assertEqual(request_types, {'DataTransfer', 'MeterValues', 'StatusNotification'})
+
+    def test_mix(self):
+        mix = generate_log.parse_mix('metervalues=1,noise=1')
+        classified = {extractor._classify_line(line) for line in generate_log.generate_lines(200, mix)}
+        self.assertEqual({c and c[1] for c in classified}, {'MeterValues', None})
+        with self.assertRaises(ValueError):
+            generate_log.parse_mix('bootnotification=1')
@@ -1,6 +1,14 @@
+import functools
 import json
 import re
-from typing import Callable, List
+from typing import Callable, Dict, Hashable, List, Optional
+
+from utilities import jsoncodec
+
+# Maximum number of entries kept by each of the parse caches below
+PARSE_CACHE_SIZE = 2048
+
+QUERY_STRING_REGEX = re.compile(r'^(\w+=[^&]+)(?:&\w+=[^&]+)*$')
 
 def extract_structure(json_data):
     if isinstance(json_data, dict):
@@ -21,6 +29,63 @@ def get_unique_structures(list_data):
             unique_structures.append(structure)
     return unique_structures
 
+class ListStructures(tuple):
+    """The unique structures (`get_unique_structures`) of the elements of a list, in a `json_structure` tree."""
+
+def json_structure(json_data):
+    """
+    The decoded JSON value as `compare_json_keys` sees it: dicts of structures, `ListStructures` for
+    lists and the type of the other values.
+    """
+    if isinstance(json_data, dict):
+        return {key: json_structure(value) for key, value in json_data.items()}
+    elif isinstance(json_data, list):
+        return ListStructures(get_unique_structures(json_data))
+    else:
+        return type(json_data)
+
+def compare_structures(structure1, structure2) -> bool:
+    """`compare_json_keys` of two values, given their `json_structure`."""
+    if isinstance(structure1, dict) and isinstance(structure2, dict):
+        if set(structure1.keys()) != set(structure2.keys()):
+            return False
+        for key in structure1:
+            if not compare_structures(structure1[key], structure2[key]):
+                return False
+        return True
+    elif isinstance(structure1, ListStructures) and isinstance(structure2, ListStructures):
+        if len(structure1) != len(structure2):
+            return False
+        for structure in structure1:
+            if structure not in structure2:
+                return False
+        return True
+    elif isinstance(structure1, type) and isinstance(structure2, type):
+        return structure1 == structure2
+    else:
+        return False
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def loads(json_str: str):
+    """
+    Memoized `jsoncodec.loads`.
+
+    The same example is compared with many candidates, so decoding it once saves most of the work.
+    The decoded value is shared between callers and must not be mutated.
+    """
+    return jsoncodec.loads(json_str)
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_structure(json_str: str):
+    """
+    Memoized `json_structure` of a JSON string, for the pairwise comparators.
+
+    Extracting the structures of the lists of the example once per candidate was most of the work of
+    `compare_json_keys`. It raises on the values `compare_json_keys` does not support (lists of
+    scalars or of lists inside list elements), so the signatures are built from `loads` instead.
+    """
+    return json_structure(loads(json_str))
+
 def compare_json_keys(json1, json2) -> bool:
     if isinstance(json1, dict) and isinstance(json2, dict):
         # Compare the keys of the dictionaries
@@ -48,7 +113,7 @@ def compare_json_keys(json1, json2) -> bool:
         return False
 
 def compare_json_str(json_str1: str, json_str2: str) -> bool:
-    return compare_json_keys(json.loads(json_str1), json.loads(json_str2))
+    return compare_structures(parse_structure(json_str1), parse_structure(json_str2))
 
 def compare_value_structure(json1: dict, json2: dict, key, str_comparators: List[Callable[[str, str], bool]]) -> bool:
     if key in json1 and key in json2:
@@ -63,34 +128,98 @@ def compare_value_structure(json1: dict, json2: dict, key, str_comparators: List
             return True
     return False
 
-def compare_query_strs(s1: str, s2: str):
-    def _is_query_string_structure(query_string):
-        # The regular expression matches a query string structure.
-        pattern = re.compile(r'^(\w+=[^&]+)(?:&\w+=[^&]+)*$')
-        return bool(pattern.match(query_string))
+def _is_query_string_structure(query_string):
+    # The regular expression matches a query string structure.
+    return bool(QUERY_STRING_REGEX.match(query_string))
 
-    def _parse_query_string(query_string):
-        """Parses a query string into a dictionary of keys."""
-        return {kv.split('=')[0] for kv in query_string.split('&')}
+def _parse_query_string(query_string):
+    """Parses a query string into a set of keys."""
+    return {kv.split('=')[0] for kv in query_string.split('&')}
 
+def compare_query_strs(s1: str, s2: str):
     if all(map(_is_query_string_structure, [s1, s2])):
         return _parse_query_string(s1) == _parse_query_string(s2)
     return False
 
 def compare_json_string(s1: str, s2: str):
     try:
-        json1, json2 = json.loads(s1), json.loads(s2)
-        return compare_json_keys(json1, json2)
+        return compare_json_str(s1, s2)
     except json.JSONDecodeError:
         return False
 
 def datatransfer_content_comparator(s1: str, s2: str):
-    json1, json2 = json.loads(s1), json.loads(s2)
-    if compare_json_keys(json1, json2):
+    if compare_structures(parse_structure(s1), parse_structure(s2)):
         str_comparators = [compare_query_strs, compare_json_string]
-        return compare_value_structure(json1, json2, 'data', str_comparators)
+        return compare_value_structure(loads(s1), loads(s2), 'data', str_comparators)
     return False
 
+def _element_structure_signature(json_data) -> Hashable:
+    # Same as `extract_structure`, values of list elements are ignored
+    if isinstance(json_data, dict):
+        return ('dict', frozenset((key, _element_structure_signature(value)) for key, value in json_data.items()))
+    elif isinstance(json_data, list):
+        return ('list', frozenset(_element_structure_signature(element) for element in json_data))
+    else:
+        return None
+
+def structure_signature(json_data) -> Hashable:
+    """
+    Canonical, hashable signature of the structure of a decoded JSON value.
+
+    Two values have the same signature if and only if `compare_json_keys` considers them identical,
+    so uniqueness checks become a single hash-set lookup instead of pairwise comparisons.
+    """
+    if isinstance(json_data, dict):
+        return ('dict', frozenset((key, structure_signature(value)) for key, value in json_data.items()))
+    elif isinstance(json_data, list):
+        # Lists are compared by the set of unique structures of their elements
+        return ('list', frozenset(_element_structure_signature(element) for element in json_data))
+    else:
+        return type(json_data).__name__
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def json_str_signature(json_str: str) -> Hashable:
+    """Signature counterpart of `compare_json_str`."""
+    return structure_signature(loads(json_str))
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def datatransfer_content_signature(s: str) -> Optional[Hashable]:
+    """
+    Signature counterpart of `datatransfer_content_comparator`.
+
+    Besides the structure of the content, the `data` value is either blank, a query string (compared by its keys)
+    or a JSON string (compared by its structure). Returns None for a content which is never identical to another one.
+    """
+    json_data = loads(s)
+    if not isinstance(json_data, dict) or 'data' not in json_data:
+        return None
+    data = json_data['data']
+    if not data:
+        data_signature = ('blank',)
+    elif _is_query_string_structure(data):
+        data_signature = ('query_string', frozenset(_parse_query_string(data)))
+    else:
+        try:
+            data_signature = ('json', json_str_signature(data))
+        except json.JSONDecodeError:
+            return None
+    return structure_signature(json_data), data_signature
+
+PARSE_CACHES = {
+    'loads': loads,
+    'parse_structure': parse_structure,
+    'json_str_signature': json_str_signature,
+    'datatransfer_content_signature': datatransfer_content_signature,
+}
+
+def parse_cache_info() -> Dict[str, dict]:
+    """Hit/miss counters and sizes of the parse caches."""
+    return {name: f.cache_info()._asdict() for name, f in PARSE_CACHES.items()}
+
+def clear_parse_cache():
+    for f in PARSE_CACHES.values():
+        f.cache_clear()
+
 def shallow_compare_two_dicts(dct1: dict, dct2: dict, keys_to_ignore:List[str]=[]) -> bool:
     if not keys_to_ignore:
         return dct1 == dct2
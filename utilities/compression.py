@@ -0,0 +1,211 @@
+"""
+Transparent reading of compressed raw logs.
+
+`open_log` detects gzip, bzip2, xz and zstd (when the `zstandard` package is installed) inputs from
+their magic numbers and returns a binary stream of the decompressed bytes; other inputs are returned
+as they are. Compressed inputs are decompressed by a background thread, a block of `BLOCK_SIZE`
+bytes at a time, while the caller parses the previous blocks: the standard library decompressors
+release the GIL, so both run in parallel. At most `QUEUE_SIZE` decompressed blocks wait for the
+caller, which bounds the memory used, and nothing is written to disk.
+
+    with compression.open_log('statics/logs/raw/ocpp.log.gz') as log_file:
+        for raw_line in log_file:
+            ...
+"""
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+from typing import BinaryIO, List, Optional, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Size of the decompressed blocks handed to the caller
+BLOCK_SIZE = 1 << 20
+# Decompressed blocks waiting to be read
+QUEUE_SIZE = 4
+# Decoding of the raw logs read as text, whether from a text stream or from bytes: invalid bytes are replaced
+TEXT_ENCODING = 'utf-8'
+TEXT_ERRORS = 'replace'
+
+MAGIC_NUMBERS = {
+    'gzip': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+_MAGIC_NUMBER_SIZE = max(len(magic_number) for magic_number in MAGIC_NUMBERS.values())
+
+class UnsupportedCompression(Exception):
+    pass
+
+class CorruptedLog(Exception):
+    """A compressed log could not be decompressed (corrupted or truncated), raised when reading the failing block."""
+
+def detect_compression(head: bytes) -> Optional[str]:
+    """The compression (a key of `MAGIC_NUMBERS`) of a file starting with `head`, or None for an uncompressed file."""
+    for compression, magic_number in MAGIC_NUMBERS.items():
+        if head.startswith(magic_number):
+            return compression
+    return None
+
+def detect_file_compression(path) -> Optional[str]:
+    with open(path, 'rb') as f:
+        return detect_compression(f.read(_MAGIC_NUMBER_SIZE))
+
+def _decompressing_reader(compression: str, fileobj: BinaryIO) -> BinaryIO:
+    # The readers decompress all the concatenated members / streams / frames of a file, like the command line tools
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if compression == 'bz2':
+        return bz2.BZ2File(fileobj)
+    if compression == 'xz':
+        return lzma.LZMAFile(fileobj)
+    if zstandard is None:
+        raise UnsupportedCompression('Reading zstd compressed logs requires the zstandard package')
+    return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+
+class _PrefixedStream(io.RawIOBase):
+    """
+    The bytes already read from the head of a stream, followed by the rest of the stream.
+
+    Closing it does not close the stream.
+    """
+
+    def __init__(self, head: bytes, stream):
+        self._head = head
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._head:
+            n = min(len(b), len(self._head))
+            b[:n], self._head = self._head[:n], self._head[n:]
+            return n
+        data = self._stream.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+class _ThreadedDecompressingStream(io.RawIOBase):
+    """Reads the blocks decompressed by a background thread."""
+
+    def __init__(self, reader: BinaryIO, owned_file: Optional[BinaryIO], block_size: int, queue_size: int):
+        self._blocks = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._block = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._run, args=(reader, owned_file, block_size), name='log-decompressor', daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, reader, owned_file, block_size):
+        try:
+            while True:
+                block = reader.read(block_size)
+                if not self._put(block) or not block:
+                    break
+        except BaseException as e:
+            # Raised in the reading thread, e.g. a corrupted or truncated file
+            self._put(e)
+        finally:
+            reader.close()
+            if owned_file is not None:
+                owned_file.close()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._block:
+            if self._eof:
+                return 0
+            block = self._blocks.get()
+            if isinstance(block, BaseException):
+                self._eof = True
+                raise CorruptedLog(f'Cannot decompress the log: {block!r}') from block
+            if not block:
+                self._eof = True
+                return 0
+            self._block = memoryview(block)
+        n = min(len(b), len(self._block))
+        b[:n] = self._block[:n]
+        self._block = self._block[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            # Unblock the decompressing thread if it waits for room in the queue
+            try:
+                while True:
+                    self._blocks.get_nowait()
+            except queue.Empty:
+                pass
+            self._thread.join()
+        super().close()
+
+def open_log(path_or_file: Union[str, BinaryIO], block_size: int = BLOCK_SIZE, queue_size: int = QUEUE_SIZE) -> BinaryIO:
+    """
+    Open a raw log, or wrap a binary stream of one (e.g. an uploaded file), for reading its decompressed bytes.
+
+    A path of an uncompressed log is opened as with `open(path, 'rb')`. Closing the returned stream
+    closes the file it opened, but not a stream passed by the caller.
+    """
+    if isinstance(path_or_file, (str, bytes)) or hasattr(path_or_file, '__fspath__'):
+        fileobj = owned_file = open(path_or_file, 'rb')
+    else:
+        fileobj, owned_file = path_or_file, None
+    try:
+        head = fileobj.read(_MAGIC_NUMBER_SIZE)
+        compression = detect_compression(head)
+        if owned_file is not None:
+            fileobj.seek(-len(head), io.SEEK_CUR)
+        else:
+            # Read the caller's stream through a proxy, which closing the returned stream leaves open
+            fileobj = io.BufferedReader(_PrefixedStream(head, fileobj))
+        if compression is None:
+            return fileobj
+        reader = _decompressing_reader(compression, fileobj)
+    except BaseException:
+        if owned_file is not None:
+            owned_file.close()
+        raise
+    return io.BufferedReader(_ThreadedDecompressingStream(reader, owned_file, block_size, queue_size), buffer_size=block_size)
+
+def open_text_log(path, block_size: int = BLOCK_SIZE, queue_size: int = QUEUE_SIZE):
+    """`open_log` in text mode, decoded with `TEXT_ENCODING` and `TEXT_ERRORS`, with universal newlines."""
+    if detect_file_compression(path) is None:
+        return open(path, 'r', encoding=TEXT_ENCODING, errors=TEXT_ERRORS)
+    return io.TextIOWrapper(open_log(path, block_size, queue_size), encoding=TEXT_ENCODING, errors=TEXT_ERRORS)
+
+def decode_text_lines(raw: bytes) -> List[str]:
+    """
+    Decode bytes of a raw log and split them into lines as `open_text_log` reads them.
+
+    Line feeds, CRLF and lone carriage returns end a line and are translated to a line feed. The
+    last line has no line break if `raw` does not end with one.
+    """
+    text = raw.decode(TEXT_ENCODING, TEXT_ERRORS)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
@@ -0,0 +1,98 @@
+"""
+JSON codec of the hot paths (parser, comparator, extractor).
+
+Decoding and compact encoding use msgspec or orjson when one of them is installed, and the standard
+library otherwise. The backend can be forced with the `JSON_CODEC` environment variable (`orjson`,
+`msgspec` or `json`) or with `set_backend`.
+
+The fast backends are stricter than the standard library (e.g. they reject NaN or lone surrogates),
+so inputs they fail on are decoded / encoded again by the standard library, which gives the same
+results and raises the same errors (`json.JSONDecodeError`) as before. The exceptions are that they
+encode non finite floats, which JSON cannot represent, as `null`, and that orjson decodes integers
+over 64 bits as floats, so documents with such long numbers are left to the standard library.
+"""
+import json
+import os
+import re
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+class Backend(NamedTuple):
+    name: str
+    loads: Callable[[Any], Any]
+    dumps: Callable[[Any], str]
+
+def _stdlib_dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+# Integers orjson decodes as floats have at least 20 digits
+_LONG_NUMBER_REGEX = re.compile(r'\d{20}')
+_LONG_NUMBER_BYTES_REGEX = re.compile(rb'\d{20}')
+
+def _orjson_backend() -> Backend:
+    import orjson
+
+    def _loads(s):
+        if (_LONG_NUMBER_REGEX if isinstance(s, str) else _LONG_NUMBER_BYTES_REGEX).search(s):
+            raise ValueError('Number out of the range of orjson')
+        return orjson.loads(s)
+
+    return Backend('orjson', _loads, lambda obj: orjson.dumps(obj).decode('utf-8'))
+
+def _msgspec_backend() -> Backend:
+    import msgspec
+    decoder, encoder = msgspec.json.Decoder(), msgspec.json.Encoder()
+    return Backend('msgspec', decoder.decode, lambda obj: encoder.encode(obj).decode('utf-8'))
+
+BACKEND_FACTORIES: Dict[str, Callable[[], Backend]] = {
+    'orjson': _orjson_backend,
+    'msgspec': _msgspec_backend,
+    'json': lambda: Backend('json', json.loads, _stdlib_dumps),
+}
+# In order of preference. msgspec decodes long integers exactly, so it does not need the (costly) guard of orjson
+BACKEND_NAMES = ['msgspec', 'orjson', 'json']
+
+backend: Optional[Backend] = None
+
+def set_backend(name: Optional[str] = None) -> Backend:
+    """Use the named backend, or the first installed one in `BACKEND_NAMES` when no name is given."""
+    global backend
+    for candidate in [name] if name else BACKEND_NAMES:
+        try:
+            backend = BACKEND_FACTORIES[candidate]()
+            break
+        except ImportError:
+            if name:
+                raise
+    return backend
+
+def available_backends():
+    names = []
+    for name in BACKEND_NAMES:
+        try:
+            BACKEND_FACTORIES[name]()
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+def loads(s):
+    """Decode a JSON document from `str` or `bytes`, like `json.loads`."""
+    try:
+        return backend.loads(s)
+    except Exception:
+        return json.loads(s)
+
+def dumps(obj, indent: Optional[int] = None) -> str:
+    """
+    Encode to JSON text without escaping non ASCII characters, compact unless `indent` is given.
+
+    Indented output is always produced by the standard library, for stable formatting.
+    """
+    if indent is not None:
+        return json.dumps(obj, indent=indent, ensure_ascii=False)
+    try:
+        return backend.dumps(obj)
+    except Exception:
+        return _stdlib_dumps(obj)
+
+set_backend(os.environ.get('JSON_CODEC'))
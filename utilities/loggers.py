@@ -1,25 +1,272 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+import weakref
+from typing import Dict, List, NamedTuple, Optional, Union
 from kuai_log import get_logger
+from kuai_log._datetime import aware_now
 from kuai_log.logger import KuaiLogger
+from kuai_log.stream import OsStream
 
-debug_file_logger = get_logger(name='debug_file_logger', level=logging.DEBUG, log_filename='debug.log',
+# `buffered` hands the log records to a background thread, `sync` writes them in the calling thread
+LOG_MODE = os.environ.get('LOG_MODE', 'buffered')
+# Records waiting for the background thread; records logged while the queue is full are dropped and counted
+LOG_QUEUE_SIZE = 10000
+# Maximum number of records written to a destination with a single write
+LOG_BATCH_SIZE = 500
+# Records of level WARNING and above logged from the same line of code (and for the same exception type)
+# are limited to a burst of LOG_RATE_LIMIT_BURST records per LOG_RATE_LIMIT_INTERVAL seconds
+LOG_RATE_LIMIT_BURST = 10
+LOG_RATE_LIMIT_INTERVAL = 60.0
+
+class LogRecord(NamedTuple):
+    level: int
+    msg: object
+    asctime: object
+    pathname: str
+    lineno: int
+    func_name: str
+    thread: int
+    # Captured without reading the source lines, which are only looked up when the record is written
+    exception: Optional[traceback.TracebackException] = None
+    extra: Optional[dict] = None
+
+class RateLimiter:
+    """Allow `burst` events per key in every window of `interval` seconds, and count the suppressed ones."""
+
+    def __init__(self, burst: int, interval: float):
+        self.burst = burst
+        self.interval = interval
+        self._lock = threading.Lock()
+        # key -> [window start, events in the window, suppressed events]
+        self._windows: Dict[tuple, list] = {}
+
+    def allow(self, key) -> Optional[int]:
+        """None if the event is suppressed, else the number of events suppressed since the last allowed one."""
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                return suppressed
+            if window[1] < self.burst:
+                window[1] += 1
+                suppressed, window[2] = window[2], 0
+                return suppressed
+            window[2] += 1
+            return None
+
+class BufferedLogger:
+    """
+    Drop-in wrapper of a `KuaiLogger` which takes the console and file writes off the calling thread.
+
+    The caller only checks the level and the rate limit, and captures the call site and traceback of the
+    record; the record is then formatted and written (by batches, one write per destination) by a daemon
+    thread. The queue is bounded, so a flood of records is dropped rather than blocking the caller.
+    With `buffered=False` the records are written in the calling thread, still rate limited.
+    """
+
+    def __init__(self, logger: KuaiLogger, buffered: bool = True, max_queue_size: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 rate_limiter: Optional[RateLimiter] = None, rate_limit_level: int = logging.WARNING):
+        self.logger = logger
+        self.buffered = buffered
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.rate_limiter = rate_limiter or RateLimiter(LOG_RATE_LIMIT_BURST, LOG_RATE_LIMIT_INTERVAL)
+        self.rate_limit_level = rate_limit_level
+        self._queue: Optional[queue.Queue] = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+        _buffered_loggers.add(self)
+
+    @property
+    def level(self):
+        return self.logger.level
+
+    def setLevel(self, level):
+        self.logger.setLevel(level)
+
+    def is_muted(self) -> bool:
+        return not (self.logger._is_add_stream_handler or self.logger._is_add_file_handler or self.logger._is_add_json_file_handler)
+
+    def log(self, level, msg, args=None, exc_info=None, extra=None, stack_info=False, stacklevel=1):
+        if self.logger.level > level or self.is_muted():
+            return
+        frame = sys._getframe(stacklevel)
+        exc = sys.exc_info() if exc_info else (None, None, None)
+        exc_type = exc[0]
+        if level >= self.rate_limit_level:
+            suppressed = self.rate_limiter.allow((frame.f_code.co_filename, frame.f_lineno, level, exc_type))
+            if suppressed is None:
+                return
+            if suppressed:
+                if isinstance(msg, str):
+                    msg = f'{msg} ({suppressed} similar records suppressed)'
+                else:
+                    extra = {**(extra or {}), 'suppressed_records': suppressed}
+        record = LogRecord(
+            level, msg, aware_now(), frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name, threading.get_ident(),
+            traceback.TracebackException(*exc, lookup_lines=False) if exc_type else None, extra,
+        )
+        if not self.buffered:
+            self._write([record])
+            return
+        try:
+            self._get_queue().put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, stacklevel=2, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, stacklevel=2, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, stacklevel=2, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, stacklevel=2, **kwargs)
+
+    def exception(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, exc_info=True, stacklevel=2, **kwargs)
+
+    def critical(self, msg, *args, **kwargs):
+        self.log(logging.CRITICAL, msg, *args, stacklevel=2, **kwargs)
+
+    def flush(self):
+        """Block until the records queued so far are written."""
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def _get_queue(self) -> queue.Queue:
+        # A forked child (e.g. a worker of the sharded extractor) does not inherit the writer thread
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(self.max_queue_size)
+                    threading.Thread(target=self._run, args=(self._queue,), name=f'{self.logger.name}-writer', daemon=True).start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def _run(self, records_queue: queue.Queue):
+        while True:
+            records = [records_queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(records_queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._dropped_lock:
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                frame = sys._getframe()
+                records.append(LogRecord(
+                    logging.WARNING, f'{dropped} log records dropped, the logging queue is full', aware_now(),
+                    frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name, threading.get_ident(),
+                ))
+            try:
+                self._write(records)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                for _ in range(len(records) - (1 if dropped else 0)):
+                    records_queue.task_done()
+
+    def _format(self, record: LogRecord):
+        """The console, text file and JSON file lines of a record, as `KuaiLogger.log` formats them."""
+        filename = record.pathname.split('/')[-1].split('\\')[-1]
+        format_kwargs = {
+            'name': self.logger.name,
+            'levelname': logging.getLevelName(record.level),
+            'message': record.msg,
+            'pathname': record.pathname,
+            'filename': filename,
+            'lineno': record.lineno,
+            'funcName': record.func_name,
+            'process': os.getgid(),
+            'thread': record.thread,
+            'asctime': record.asctime,
+            'host': KuaiLogger.host,
+        }
+        exc_text = ''.join(record.exception.format()) if record.exception else None
+        json_line = None
+        if self.logger._is_add_json_file_handler:
+            format_kwargs_json = {**format_kwargs, 'asctime': str(record.asctime), 'msg': {}}
+            if isinstance(record.msg, dict):
+                format_kwargs_json['msg'].update(record.msg)
+                format_kwargs_json['message'] = ''
+            if record.extra:
+                format_kwargs_json['msg'].update(record.extra)
+            if exc_text:
+                format_kwargs_json['msg']['traceback'] = exc_text
+            json_line = json.dumps(format_kwargs_json, ensure_ascii=False, default=str) + '\n'
+        if record.extra:
+            format_kwargs.update(record.extra)
+        text = self.logger._formatter_template.format(**format_kwargs)
+        if exc_text:
+            text += f'\n {exc_text}'
+        return self.logger._add_color(text, record.level) + '\n', text + '\n', json_line
+
+    def _write(self, records: List[LogRecord]):
+        lines = [self._format(record) for record in records]
+        if self.logger._is_add_stream_handler:
+            OsStream.stdout(''.join(stream_line for stream_line, _, _ in lines))
+        if self.logger._is_add_file_handler:
+            self.logger._fw.write_2_file(''.join(text_line for _, text_line, _ in lines))
+        if self.logger._is_add_json_file_handler:
+            self.logger._fw_json.write_2_file(''.join(json_line for _, _, json_line in lines if json_line))
+
+_buffered_loggers = weakref.WeakSet()
+
+def flush():
+    """Write the records queued by all the buffered loggers, e.g. before a worker process exits."""
+    for logger in list(_buffered_loggers):
+        logger.flush()
+
+def _reset_locks_after_fork():
+    # The locks may have been held by another thread of the parent when it forked
+    for logger in list(_buffered_loggers):
+        logger._start_lock = threading.Lock()
+        logger._dropped_lock = threading.Lock()
+        logger._dropped = 0
+
+atexit.register(flush)
+os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+debug_file_logger = BufferedLogger(get_logger(name='debug_file_logger', level=logging.DEBUG, log_filename='debug.log',
                 log_path='statics/logs/app/debug', is_add_file_handler=True,
                 json_log_path='statics/logs/app/debug/json', is_add_json_file_handler=True,
-            )
+            ), buffered=LOG_MODE == 'buffered')
 
-error_file_logger = get_logger(name='error_file_logger', level=logging.ERROR, log_filename='error.log',
+error_file_logger = BufferedLogger(get_logger(name='error_file_logger', level=logging.ERROR, log_filename='error.log',
                 log_path='statics/logs/app/error', is_add_file_handler=True,
                 json_log_path='statics/logs/app/error/json', is_add_json_file_handler=True,
-            )
+            ), buffered=LOG_MODE == 'buffered')
 
 test_logger = get_logger(name='test_logger', level=logging.ERROR)
 
-def mute_logger(logger: KuaiLogger):
+def _kuai_logger(logger: Union[KuaiLogger, BufferedLogger]) -> KuaiLogger:
+    return logger.logger if isinstance(logger, BufferedLogger) else logger
+
+def mute_logger(logger: Union[KuaiLogger, BufferedLogger]):
+    logger = _kuai_logger(logger)
     logger._is_add_stream_handler = False
     logger._is_add_file_handler = False
     logger._is_add_json_file_handler = False
 
-def unmute_logger(logger: KuaiLogger):
+def unmute_logger(logger: Union[KuaiLogger, BufferedLogger]):
+    logger = _kuai_logger(logger)
     logger._is_add_stream_handler = True
     logger._is_add_file_handler = True
-    logger._is_add_json_file_handler = True
\ No newline at end of file
+    logger._is_add_json_file_handler = True
@@ -0,0 +1,165 @@
+"""
+In-process counters and latency histograms, rendered in the Prometheus text exposition format.
+
+Instrumented code checks the module level `enabled` flag before measuring anything, so that
+disabled metrics cost an attribute lookup:
+
+    if metrics.enabled:
+        LINES.inc('metervalues', '201')
+
+Counter names end in `_total`, as the Prometheus naming conventions ask. Label values are passed
+positionally, in the order of the metric's label names.
+"""
+import bisect
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+enabled = False
+
+# Upper bounds, in seconds, of the default latency buckets
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _check_labels(self, labelvalues: tuple):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects the labels {self.labelnames}, got {labelvalues}')
+
+    def samples(self) -> List[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """The `(name suffix, label names, label values, value)` of every sample of the metric."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for suffix, names, values, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+    def clear(self):
+        raise NotImplementedError
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            try:
+                self._values[labelvalues] += amount
+            except KeyError:
+                self._check_labels(labelvalues)
+                self._values[labelvalues] = amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [('', self.labelnames, labelvalues, value) for labelvalues, value in values]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: the count of observations in each bucket (not cumulated), then their sum
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                self._check_labels(labelvalues)
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, *labelvalues) -> int:
+        state = self._values.get(labelvalues)
+        return sum(state[0]) if state else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labelvalues, (list(counts), total)) for labelvalues, (counts, total) in self._values.items())
+        names = self.labelnames + ('le',)
+        samples = []
+        for labelvalues, (counts, total) in values:
+            cumulated = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulated += count
+                samples.append(('_bucket', names, labelvalues + (_format_value(float(bound)),), cumulated))
+            samples.append(('_sum', self.labelnames, labelvalues, total))
+            samples.append(('_count', self.labelnames, labelvalues, cumulated))
+        return samples
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return ''.join(metric.render() + '\n' for metric in self._metrics.values())
+
+    def clear(self):
+        """Reset the values of all the metrics, e.g. between tests."""
+        for metric in self._metrics.values():
+            metric.clear()
+
+REGISTRY = Registry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,432 @@
+import bz2
+import gzip
+import io
+import itertools
+import json
+import logging
+import lzma
+import os
+import random
+import shutil
+import tempfile
+import threading
+from unittest import mock, skipUnless
+from django.test import SimpleTestCase
+
+from scripts import patterns
+from kuai_log.logger import KuaiLogger
+
+from utilities import comparator, compression, jsoncodec, loggers, metrics
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# Get the root path of the project directory
+root_dir = os.path.dirname(current_dir)
+
+JSON_CONTENTS = [
+    '{"idTag": "5d2e7089"}',
+    '{"idTag": 5}',
+    '{"idTag": null}',
+    '{"idTag": "5d2e7089", "connectorId": 1}',
+    '{"connectorId": 1, "idTag": "04A2"}',
+    '{"connectorId": 1.0, "idTag": "04A2"}',
+    '{"connectorId": true, "idTag": "04A2"}',
+    '{"a": {"b": 1}}',
+    '{"a": {"b": "1"}}',
+    '{"a": {"c": 1}}',
+    '{"a": []}',
+    '{"a": {}}',
+    '{"a": [1, 2]}',
+    '{"a": ["x"]}',
+    '{"a": [{"b": 1}, {"b": "2"}]}',
+    '{"a": [{"b": 1}, {"c": 2}]}',
+    '{"a": [{"c": 2}, {"b": 1}, {"b": null}]}',
+    '{"a": [{"b": 1, "c": 2}]}',
+    '[]',
+    '[{"a": 1}]',
+    '"text"',
+    '1',
+]
+
+DATATRANSFER_CONTENTS = [
+    '{"vendorId": "ATESS", "messageId": "currentrecord", "data": "id=0&connectorId=0&chargemode=0"}',
+    '{"vendorId": "ATESS", "messageId": "currentrecord", "data": "connectorId=1&id=2&chargemode=0"}',
+    '{"vendorId": "ATESS", "messageId": "currentrecord", "data": "id=0&connectorId=0"}',
+    '{"vendorId": "ATESS", "messageId": "currentrecord", "data": "id=&connectorId=0"}',
+    '{"vendorId": "ATESS", "messageId": "currentrecord", "data": ""}',
+    '{"vendorId": "ATESS", "messageId": "currentrecord", "data": null}',
+    '{"vendorId": "ATESS", "messageId": "currentrecord"}',
+    '{"vendorId": "CEGN", "messageId": "chargePoridStatu", "data": "{\\"FaultGroup\\":[],\\"timestamp\\":\\"2024-07-24T01:41:49Z\\"}"}',
+    '{"vendorId": "CEGN", "messageId": "chargePoridStatu", "data": "{\\"FaultGroup\\":[{\\"connectorId\\":1}],\\"timestamp\\":\\"2024-07-24T01:41:22Z\\"}"}',
+    '{"vendorId": "CEGN", "messageId": "chargePoridStatu", "data": "{\\"FaultGroup\\":[{\\"connectorId\\":2}],\\"timestamp\\":\\"2024-07-24T01:42:00Z\\"}"}',
+    '{"vendorId": "CEGN", "messageId": "chargePoridStatu", "data": "[1, 2]"}',
+    '{"vendorId": "CEGN", "messageId": "chargePoridStatu", "data": "12"}',
+    '{"vendorId": "CEGN", "messageId": "chargePoridStatu", "data": "not a structured value"}',
+    '{"vendorId": "CEGN", "data": "id=0&connectorId=0&chargemode=0"}',
+]
+
+def _random_scalar(rnd: random.Random):
+    return rnd.choice([rnd.randint(0, 9), str(rnd.randint(0, 9)), rnd.random(), True, None])
+
+def _random_flat_dict(rnd: random.Random):
+    return {key: _random_scalar(rnd) for key in rnd.sample('abcd', rnd.randint(0, 3))}
+
+def _random_json(rnd: random.Random, depth=0):
+    """Random JSON value in the domain supported by `comparator.compare_json_keys`."""
+    kind = rnd.choice(['scalar', 'dict', 'list']) if depth < 3 else 'scalar'
+    if kind == 'dict':
+        return {key: _random_json(rnd, depth + 1) for key in rnd.sample('abcd', rnd.randint(0, 3))}
+    elif kind == 'list':
+        # Elements of lists are compared by the structure of their keys
+        return [rnd.choice([_random_flat_dict(rnd), _random_scalar(rnd)]) for _ in range(rnd.randint(0, 3))]
+    return _random_scalar(rnd)
+
+def _random_datatransfer_content(rnd: random.Random):
+    data = rnd.choice([
+        '',
+        None,
+        '&'.join(f'{key}={rnd.randint(0, 9)}' for key in rnd.sample('abcd', rnd.randint(1, 3))),
+        json.dumps(_random_json(rnd)),
+        'plain text',
+    ])
+    content = {'vendorId': 'ATESS', 'messageId': rnd.choice(['currentrecord', 1])}
+    if rnd.random() > 0.1:
+        content['data'] = data
+    return json.dumps(content)
+
+def _meter_values_contents():
+    contents = []
+    with open(os.path.join(root_dir, 'statics/logs/test/meterValues.log'), 'r') as f:
+        for line in f:
+            for comparable_pattern in patterns.COMPARABLE_KEYWORD_CONTENT_MAP['metervalues']:
+                match = comparable_pattern.pattern.search(line)
+                if match:
+                    contents.append(match.group(1))
+                    break
+    return contents
+
+class StructureSignatureEquivalenceTests(SimpleTestCase):
+    """The structure signatures must agree with the pairwise comparators they replace."""
+
+    def assertSignatureEquivalent(self, contents, signature, is_identical):
+        signatures = [signature(c) for c in contents]
+        for (c1, s1), (c2, s2) in itertools.product(zip(contents, signatures), repeat=2):
+            with self.subTest(c1=c1, c2=c2):
+                self.assertEqual(s1 is not None and s1 == s2, is_identical(c1, c2))
+
+    def test_json_str_signature(self):
+        self.assertSignatureEquivalent(JSON_CONTENTS, comparator.json_str_signature, comparator.compare_json_str)
+
+    def test_json_str_signature_on_meter_values(self):
+        self.assertSignatureEquivalent(_meter_values_contents(), comparator.json_str_signature, comparator.compare_json_str)
+
+    def test_json_str_signature_on_random_contents(self):
+        rnd = random.Random(20240725)
+        contents = [json.dumps(_random_json(rnd)) for _ in range(300)]
+        self.assertSignatureEquivalent(contents, comparator.json_str_signature, comparator.compare_json_str)
+
+    def test_datatransfer_content_signature(self):
+        self.assertSignatureEquivalent(DATATRANSFER_CONTENTS, comparator.datatransfer_content_signature, comparator.datatransfer_content_comparator)
+
+    def test_datatransfer_content_signature_on_random_contents(self):
+        rnd = random.Random(20240726)
+        contents = [_random_datatransfer_content(rnd) for _ in range(300)]
+        self.assertSignatureEquivalent(contents, comparator.datatransfer_content_signature, comparator.datatransfer_content_comparator)
+
+    def test_signature_is_independent_of_key_and_element_order(self):
+        self.assertEqual(
+            comparator.json_str_signature('{"a": 1, "b": [{"x": 1}, {"y": "2"}]}'),
+            comparator.json_str_signature('{"b": [{"y": 3}, {"x": null}, {"x": 2}], "a": 5}'),
+        )
+
+    def test_signature_of_lists_nested_in_list_elements(self):
+        # compare_json_keys does not support these values, the signatures must not raise on them
+        self.assertEqual(comparator.loads('{"a": [{"b": [1, 2]}]}'), {'a': [{'b': [1, 2]}]})
+        self.assertEqual(
+            comparator.json_str_signature('{"a": [{"b": [1, 2]}]}'),
+            comparator.json_str_signature('{"a": [{"b": [3]}, {"b": [4, 5]}]}'),
+        )
+        self.assertNotEqual(
+            comparator.json_str_signature('{"a": [{"b": [1, 2]}]}'),
+            comparator.json_str_signature('{"a": [[1, 2]]}'),
+        )
+        content = '{"vendorId": "v", "messageId": "m", "data": "{\\"a\\": [[1, 2], {\\"b\\": [3]}]}"}'
+        other = '{"vendorId": "w", "messageId": "n", "data": "{\\"a\\": [{\\"b\\": [4]}, [5]]}"}'
+        self.assertIsNotNone(comparator.datatransfer_content_signature(content))
+        self.assertEqual(comparator.datatransfer_content_signature(content), comparator.datatransfer_content_signature(other))
+
+class ParseCacheTests(SimpleTestCase):
+
+    def setUp(self) -> None:
+        comparator.clear_parse_cache()
+
+    def test_repeated_comparisons_decode_once(self):
+        example = JSON_CONTENTS[0]
+        for candidate in JSON_CONTENTS:
+            comparator.compare_json_str(candidate, example)
+        info = comparator.parse_cache_info()['parse_structure']
+        # Every content is decoded and its structure extracted once, the example is then served from the cache
+        self.assertEqual((info['hits'], info['misses']), (len(JSON_CONTENTS), len(JSON_CONTENTS)))
+
+    def test_cached_structures_compare_like_the_decoded_values(self):
+        for c1, c2 in itertools.product(JSON_CONTENTS + _meter_values_contents(), repeat=2):
+            with self.subTest(c1=c1, c2=c2):
+                self.assertEqual(comparator.compare_json_str(c1, c2), comparator.compare_json_keys(json.loads(c1), json.loads(c2)))
+
+    def test_signatures_are_cached(self):
+        comparator.json_str_signature(JSON_CONTENTS[0])
+        comparator.json_str_signature(JSON_CONTENTS[0])
+        info = comparator.parse_cache_info()['json_str_signature']
+        self.assertEqual((info['hits'], info['misses']), (1, 1))
+
+    def test_cache_is_bounded(self):
+        for i in range(comparator.PARSE_CACHE_SIZE + 10):
+            comparator.loads(f'{{"id": {i}}}')
+        self.assertEqual(comparator.parse_cache_info()['loads']['currsize'], comparator.PARSE_CACHE_SIZE)
+
+class JsonCodecTests(SimpleTestCase):
+    """Every installed backend must decode and encode like the standard library."""
+
+    EDGE_CASES = [
+        '{"a": NaN, "b": Infinity}',
+        '{"big": 123456789012345678901234567890}',
+        '{"float": 1e400}',
+        '"\\ud800"',
+        '{"a": 1, "a": 2}',
+        ' [1, 2.50, "é", null, true] ',
+    ]
+
+    def tearDown(self) -> None:
+        jsoncodec.set_backend()
+
+    def _documents(self):
+        contents = _meter_values_contents() + JSON_CONTENTS + DATATRANSFER_CONTENTS + self.EDGE_CASES
+        return contents + [c.encode('utf-8') for c in contents]
+
+    def test_loads(self):
+        for name in jsoncodec.available_backends():
+            jsoncodec.set_backend(name)
+            for document in self._documents():
+                with self.subTest(backend=name, document=document):
+                    # repr, since NaN is not equal to itself
+                    self.assertEqual(repr(jsoncodec.loads(document)), repr(json.loads(document)))
+
+    def test_decode_errors(self):
+        for name in jsoncodec.available_backends():
+            jsoncodec.set_backend(name)
+            for document in ['{"a": 1', '', 'id=0&connectorId=0']:
+                with self.subTest(backend=name, document=document), self.assertRaises(json.JSONDecodeError):
+                    jsoncodec.loads(document)
+
+    def test_dumps(self):
+        values = [json.loads(c) for c in _meter_values_contents() + JSON_CONTENTS] + [{'é': 1.5}, {1: 2}, [10 ** 30]]
+        for name in jsoncodec.available_backends():
+            jsoncodec.set_backend(name)
+            for value in values:
+                with self.subTest(backend=name, value=value):
+                    self.assertEqual(jsoncodec.dumps(value), json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+                    self.assertEqual(jsoncodec.dumps(value, indent=4), json.dumps(value, ensure_ascii=False, indent=4))
+
+class MetricsTests(SimpleTestCase):
+
+    def test_counter(self):
+        counter = metrics.Counter('lines_total', 'Lines.', ['type', 'status'])
+        counter.inc('a', '201')
+        counter.inc('a', '201', amount=2)
+        counter.inc('b"\\', '400')
+        self.assertEqual(counter.value('a', '201'), 3)
+        self.assertEqual(counter.render(), '\n'.join([
+            '# HELP lines_total Lines.',
+            '# TYPE lines_total counter',
+            'lines_total{type="a",status="201"} 3',
+            'lines_total{type="b\\"\\\\",status="400"} 1',
+        ]))
+        with self.assertRaises(ValueError):
+            counter.inc('a')
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('step_seconds', 'Steps.', ['step'], buckets=[0.1, 1])
+        for value in [0.05, 0.1, 0.5, 2]:
+            histogram.observe(value, 'parse')
+        self.assertEqual(histogram.count('parse'), 4)
+        self.assertEqual(histogram.render().splitlines()[2:], [
+            'step_seconds_bucket{step="parse",le="0.1"} 2',
+            'step_seconds_bucket{step="parse",le="1.0"} 3',
+            'step_seconds_bucket{step="parse",le="+Inf"} 4',
+            'step_seconds_sum{step="parse"} 2.65',
+            'step_seconds_count{step="parse"} 4',
+        ])
+
+    def test_registry(self):
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter('a_total', 'A.'))
+        counter.inc()
+        with self.assertRaises(ValueError):
+            registry.register(metrics.Counter('a_total', 'A.'))
+        self.assertIn('a_total 1\n', registry.render())
+        registry.clear()
+        self.assertEqual(counter.value(), 0)
+
+class BufferedLoggerTests(SimpleTestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp_dir, 'json'))
+        self.kuai_logger = KuaiLogger(
+            'buffered_logger_test', level=logging.DEBUG, is_add_stream_handler=False,
+            is_add_file_handler=True, log_path=self.tmp_dir, log_filename='test.log',
+            is_add_json_file_handler=True, json_log_path=os.path.join(self.tmp_dir, 'json'),
+        )
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _read(self, json_file=False):
+        log_dir = os.path.join(self.tmp_dir, 'json') if json_file else self.tmp_dir
+        (filename,) = [f for f in os.listdir(log_dir) if f.endswith('test.log')]
+        with open(os.path.join(log_dir, filename), 'r') as f:
+            return f.read()
+
+    def test_records_are_written_by_the_background_thread(self):
+        logger = loggers.BufferedLogger(self.kuai_logger)
+        for i in range(3):
+            logger.debug(f'record {i}')
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logger.error({'line': 'x'}, exc_info=True)
+        logger.flush()
+        text = self._read()
+        self.assertLess(text.index('record 0'), text.index('record 1'))
+        self.assertIn('test_records_are_written_by_the_background_thread - buffered_logger_test - DEBUG - record 2', text)
+        self.assertIn('ValueError: boom', text)
+        records = [json.loads(line) for line in self._read(json_file=True).splitlines()]
+        self.assertEqual(records[-1]['msg']['line'], 'x')
+        self.assertIn('ValueError: boom', records[-1]['msg']['traceback'])
+
+    def test_sync_mode_and_muted_logger(self):
+        logger = loggers.BufferedLogger(self.kuai_logger, buffered=False)
+        logger.info('written in place')
+        self.assertIn('written in place', self._read())
+        loggers.mute_logger(logger)
+        logger.info('written while muted')
+        loggers.unmute_logger(logger)
+        self.assertNotIn('written while muted', self._read())
+
+    def test_repeated_errors_are_rate_limited(self):
+        logger = loggers.BufferedLogger(self.kuai_logger, buffered=False, rate_limiter=loggers.RateLimiter(burst=2, interval=60))
+
+        def _log_line_error(i):
+            logger.error(f'error {i}')
+
+        with mock.patch('time.monotonic', return_value=0):
+            for i in range(5):
+                _log_line_error(i)
+            logger.error('other call site')
+        with mock.patch('time.monotonic', return_value=60):
+            for i in range(5, 8):
+                _log_line_error(i)
+        text = self._read()
+        self.assertEqual([f'error {i}' in text for i in range(8)], [True, True, False, False, False, True, True, False])
+        self.assertIn('error 5 (3 similar records suppressed)', text)
+        self.assertIn('other call site', text)
+
+    def test_full_queue_drops_records(self):
+        logger = loggers.BufferedLogger(self.kuai_logger, max_queue_size=2)
+        released = threading.Event()
+        write = logger._write
+
+        def _blocked_write(records):
+            released.wait()
+            write(records)
+
+        with mock.patch.object(logger, '_write', side_effect=_blocked_write):
+            for i in range(10):
+                logger.info(f'record {i}')
+            released.set()
+            logger.flush()
+            # The writer reports the drops with its next batch
+            logger.info('after')
+            logger.flush()
+        text = self._read()
+        self.assertIn('record 0', text)
+        self.assertNotIn('record 9', text)
+        self.assertRegex(text, r'[0-9]+ log records dropped')
+
+class NonSeekableStream:
+    """Like a request body, which can only be read forward."""
+
+    def __init__(self, data: bytes):
+        self._stream = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+class CompressionTests(SimpleTestCase):
+
+    def setUp(self) -> None:
+        self.data = b''.join(f'INFO:ocpp:{i}: receive message [2,"{i}","Heartbeat",{{}}]\r\n'.encode() for i in range(5000))
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_decompressed_with_small_blocks(self):
+        half = len(self.data) // 2
+        compressed = {
+            None: self.data,
+            # Concatenated members / streams, as written by appending to an archive
+            'gzip': gzip.compress(self.data[:half]) + gzip.compress(self.data[half:]),
+            'bz2': bz2.compress(self.data[:half]) + bz2.compress(self.data[half:]),
+            'xz': lzma.compress(self.data),
+        }
+        for name, content in compressed.items():
+            with self.subTest(compression=name):
+                path = self._write(f'log.{name}', content)
+                self.assertEqual(compression.detect_file_compression(path), name)
+                with compression.open_log(path, block_size=1000, queue_size=2) as log_file:
+                    self.assertEqual(log_file.read(), self.data)
+                with compression.open_log(NonSeekableStream(content), block_size=1000) as log_file:
+                    self.assertEqual(list(log_file), self.data.splitlines(keepends=True))
+                with compression.open_text_log(path) as log_file, open(self._write('plain.log', self.data), 'r') as plain_file:
+                    self.assertEqual(log_file.read(), plain_file.read())
+
+    def test_close_before_the_end(self):
+        with compression.open_log(self._write('log.gz', gzip.compress(self.data * 10)), block_size=1000, queue_size=1) as log_file:
+            log_file.readline()
+            thread = log_file.raw._thread
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+
+    def test_caller_stream_left_open(self):
+        for name, content in [(None, self.data), ('gzip', gzip.compress(self.data))]:
+            with self.subTest(compression=name):
+                stream = io.BytesIO(content)
+                with compression.open_log(stream, block_size=1000) as log_file:
+                    self.assertEqual(log_file.read(), self.data)
+                self.assertTrue(log_file.closed)
+                self.assertFalse(stream.closed)
+
+    def test_corrupted_log(self):
+        content = gzip.compress(self.data)
+        for corrupted in [content[:len(content) // 2], content[:100] + b'\0' * 100 + content[200:]]:
+            with compression.open_log(io.BytesIO(corrupted)) as log_file:
+                with self.assertRaises(compression.CorruptedLog):
+                    log_file.read()
+
+    @skipUnless(compression.zstandard, 'zstandard is not installed')
+    def test_zstd(self):
+        compressor = compression.zstandard.ZstdCompressor()
+        content = compressor.compress(self.data[:100]) + compressor.compress(self.data[100:])
+        with compression.open_log(io.BytesIO(content)) as log_file:
+            self.assertEqual(log_file.read(), self.data)
+
+    def test_zstd_without_zstandard(self):
+        with mock.patch.object(compression, 'zstandard', None):
+            with self.assertRaises(compression.UnsupportedCompression):
+                compression.open_log(io.BytesIO(compression.MAGIC_NUMBERS['zstd'] + b'\0' * 10))